@@ -3,3 +3,4 @@ from .library import Library
 
 from .constants import (FILTER_BICUBIC, FILTER_BILINEAR, FILTER_BOX,
                        FILTER_BSPLINE, FILTER_CATMULLROM, FILTER_LANCZOS3)
+from .constants import FIT_BITMAP, FIT_UINT16, FIT_RGB16, FIT_RGBA16
@@ -51,6 +51,16 @@ class FreeImageLibrary(Protocol):
     def LoadFromHandle(self, fif, io, handle, flags=0):
         pass
 
+    def LoadFromMemory(self, fif, stream, flags=0):
+        pass
+
+    def OpenMemory(self, data, size_in_bytes):
+        """Wraps data without copying it. Must be closed with CloseMemory."""
+        pass
+
+    def CloseMemory(self, stream) -> None:
+        pass
+
     def Save(self, fif, dib, filename, flags=0) -> bool:
         pass
 
@@ -206,6 +216,18 @@ class FreeImageLibrary(Protocol):
     def ConvertTo32Bits(self, dib):
         pass
 
+    def ConvertToRawBits(self, bits, dib, pitch, bpp, red_mask, green_mask, blue_mask, topdown=False) -> None:
+        """Copies the pixels into bits, pitch bytes per row. Only copies; bpp must be the bitmap's."""
+        pass
+
+    def ConvertLine24To32(self, target, source, width_in_pixels) -> None:
+        """Converts a single 24 bit scanline to 32 bits (alpha 0xFF)."""
+        pass
+
+    def ConvertToStandardType(self, src, scale_linear=True):
+        """Converts a non standard image type (e.g. FIT_UINT16, FIT_FLOAT) to an 8 bit bitmap."""
+        pass
+
     def ColorQuantize(self, dib, quantize):
         pass
 
@@ -295,6 +317,9 @@ FUNCTION_LIST = (
     ('FreeImage_Load',          '@12', None, CO.fi_handle),
     ('FreeImage_LoadU',         '@12', None, CO.fi_handle),
     ('FreeImage_LoadFromHandle','@16', None, CO.fi_handle),
+    ('FreeImage_LoadFromMemory','@12', None, CO.fi_handle),
+    ('FreeImage_OpenMemory',    '@8', None, CO.fi_handle),
+    ('FreeImage_CloseMemory',   '@4', None, None),
     ('FreeImage_Save',          '@16', None, CO.BOOL),
     ('FreeImage_SaveU',         '@16', None, CO.BOOL),
     ('FreeImage_SaveToHandle',  '@20', None, CO.BOOL),
@@ -338,6 +363,7 @@ FUNCTION_LIST = (
     ('FreeImage_GetFileType',           '@8'), 
     ('FreeImage_GetFileTypeU',          '@8'),
     ('FreeImage_GetFileTypeFromHandle', '@12'), 
+    ('FreeImage_GetFileTypeFromMemory', '@8'),
     
     
     #Pixel access
@@ -362,7 +388,8 @@ FUNCTION_LIST = (
     ('FreeImage_Dither',                '@8', CO.COL_1TO32),
     ('FreeImage_ConvertFromRawBits',    '@36', CO.COL_1TO32),
     ('FreeImage_ConvertToRawBits',      '@32', CO.COL_1TO32),
-    ('FreeImage_ConvertToStandardType', '@8'),
+    ('FreeImage_ConvertLine24To32',     '@12', (CO.COL_24,)),
+    ('FreeImage_ConvertToStandardType', '@8', None, CO.fi_handle),
     ('FreeImage_ConvertToType',         '@12'),
     ('FreeImage_ConvertToRGBF',         '@4', (CO.COL_24, CO.COL_32,)),
     
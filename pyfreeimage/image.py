@@ -1,9 +1,23 @@
 import ctypes
+import io
 
 import pyfreeimage.constants as CO
 from pyfreeimage import library
 from pyfreeimage.buffer import FileIO
-from quivilib.interface.imagehandler import BaseImageProt
+from quivilib.interface.imagehandler import BaseImageProt, PixelBuffer
+
+
+def _memory_of(f):
+    """The rest of the contents of f if it's a file in memory, without copying. None otherwise."""
+    if isinstance(f, io.BytesIO):
+        #getvalue returns the bytes the BytesIO was made from; getbuffer would copy them
+        data = f.getvalue()
+        pos = f.tell()
+        return data if pos == 0 else memoryview(data)[pos:]
+    getbuffer = getattr(f, 'getbuffer', None)
+    if getbuffer is not None:
+        return getbuffer()[f.tell():]
+    return None
 
 
 class Image(BaseImageProt):
@@ -30,6 +44,10 @@ class Image(BaseImageProt):
 
     @classmethod
     def load_from_file(cls, f, filename_hint = None, flags = 0):
+        data = _memory_of(f)
+        if data is not None:
+            return cls.load_from_memory(data, filename_hint, flags)
+        #Not in memory; FreeImage reads through callbacks into Python
         lib = library.load()
         fileIO = FileIO(lib, f)
         fif = fileIO.getType()
@@ -42,6 +60,39 @@ class Image(BaseImageProt):
             raise RuntimeError('Unable to open image')
         return cls(dib)
     
+    @classmethod
+    def load_from_memory(cls, data, filename_hint = None, flags = 0):
+        """Load from bytes or any other buffer. FreeImage reads it in place."""
+        lib = library.load()
+        if isinstance(data, bytes):
+            #ctypes passes a pointer to the bytes' own storage
+            buf = data
+            size = len(data)
+        else:
+            view = memoryview(data).cast('B')
+            size = view.nbytes
+            if view.readonly:
+                #ctypes can't point into read-only buffers (e.g. a read-only mmap)
+                buf = (ctypes.c_char * size).from_buffer_copy(view)
+            else:
+                buf = (ctypes.c_char * size).from_buffer(view)
+        stream = lib.OpenMemory(buf, size)
+        if not stream:
+            raise RuntimeError('Unable to open image')
+        dib = None
+        try:
+            fif = lib.GetFileTypeFromMemory(stream, 0)
+            if fif == CO.FIF_UNKNOWN and filename_hint:
+                fif = lib.GetFIFFromFilename(filename_hint)
+            if fif != CO.FIF_UNKNOWN and lib.FIFSupportsReading(fif):
+                dib = lib.LoadFromMemory(fif, stream, flags)
+        finally:
+            #The bitmap doesn't refer to the memory once loaded
+            lib.CloseMemory(stream)
+        if not dib:
+            raise RuntimeError('Unable to open image')
+        return cls(dib)
+    
     def __init__(self, dib):
         self._lib = library.load()
         self._dib = dib
@@ -74,8 +125,22 @@ class Image(BaseImageProt):
         return self._lib.GetBPP(self._dib)
         
     def colortype(self):
-        return self._lib.GetColorType(self._dib)()
+        return self._lib.GetColorType(self._dib)
+
+    @property
+    def is_grayscale(self):
+        """8 bit with a linear black to white palette, so the palette indices are the gray levels."""
+        return self.bpp == 8 and self.colortype() == CO.FIC_MINISBLACK
     
+    @property
+    def image_type(self):
+        return self._lib.GetImageType(self._dib)
+
+    @property
+    def address(self):
+        """Address of the pixels (of the bottom row)."""
+        return ctypes.cast(self.bits, ctypes.c_void_p).value
+
     @property
     def pitch(self):
         return self._lib.GetPitch(self._dib)
@@ -123,6 +188,18 @@ class Image(BaseImageProt):
             raise RuntimeError('Unable to convert image to 32 bits')
         return self.__class__(dib)
     
+    def convert_to_8_bits(self):
+        dib = self._lib.ConvertTo8Bits(self._dib)
+        if not dib:
+            raise RuntimeError('Unable to convert image to 8 bits')
+        return self.__class__(dib)
+
+    def convert_to_standard_type(self, scale_linear=True):
+        dib = self._lib.ConvertToStandardType(self._dib, scale_linear)
+        if not dib:
+            raise RuntimeError('Unable to convert image to a standard type')
+        return self.__class__(dib)
+    
     def convert_to_24_bits(self):
         dib = self._lib.ConvertTo24Bits(self._dib)
         if not dib:
@@ -138,31 +215,47 @@ class Image(BaseImageProt):
         #Note - Stride: the number of bytes between the start of rows in the buffer as allocated.
         #In other words, the length in bytes of a row in the image, _padded for alignment_
         buf = ctypes.create_string_buffer(self.height * width_bytes)
+        #FreeImage stores the rows bottom-up; this flips them in a single call.
+        self._lib.ConvertToRawBits(buf, self._dib, width_bytes, self.bpp,
+                                   self.red_mask, self.green_mask, self.blue_mask, True)
+        return buf
+
+    def _convert_24_to_raw_32_bits(self, width_bytes):
+        """Same as convert_to_32_bits().convert_to_raw_bits(), without the intermediate 32 bit image."""
+        width, height = self.width, self.height
+        buf = ctypes.create_string_buffer(height * width_bytes)
         buf_idx = ctypes.addressof(buf)
-        for line_idx in range(self.height-1, -1, -1):
-            line_buf = self._lib.GetScanLine(self._dib, line_idx)
-            ctypes.memmove(buf_idx, line_buf, width_bytes)
+        convert_line = self._lib.ConvertLine24To32
+        get_scanline = self._lib.GetScanLine
+        for line_idx in range(height-1, -1, -1):
+            convert_line(ctypes.c_void_p(buf_idx), get_scanline(self._dib, line_idx), width)
             buf_idx += width_bytes
         return buf
         
+    def get_pixels(self, allow_gray=False):
+        #32 bit FreeImage images are B G R A in memory, which works as cairo's RGB24
+        bpp = self.bpp
+        if allow_gray and self.is_grayscale:
+            pixels = PixelBuffer(self.width, self.height, None, bytes_per_pixel=PixelBuffer.GRAY)
+            pixels.data = self.convert_to_raw_bits(pixels.stride)
+            return pixels
+        if bpp == 32:
+            return PixelBuffer(self.width, self.height, self.convert_to_raw_bits(), self.width_bytes)
+        if bpp == 24:
+            pixels = PixelBuffer(self.width, self.height, None)
+            pixels.data = self._convert_24_to_raw_32_bits(pixels.stride)
+            return pixels
+        return self.convert_to_32_bits().get_pixels()
+
     def convert_to_wx_bitmap(self, wx):
-        #TODO: (1,4) Improve: handle another types of bitmaps
+        #Only 32 bit images can have alpha; anything else is expanded to 32 bits while copying.
         if self.bpp == 32:
-            img = self
             img_format = wx.BitmapBufferFormat_ARGB32
-        #elif self.bpp == 24:
-        #Sigh. Still not working correctly.
-        #    img = self
-        #    img_format = wx.BitmapBufferFormat_RGB
         else:
-            img = self.convert_to_32_bits()
-            img_format = wx.BitmapBufferFormat_ARGB32
-        width, height, bpp, pitch = img.width, img.height, img.bpp, img.pitch
-        buf = img.convert_to_raw_bits()
-        if img is not self:
-            del img
-        bmp = wx.Bitmap(width, height, bpp)
-        bmp.CopyFromBuffer(buf, img_format, pitch)
+            img_format = wx.BitmapBufferFormat_RGB32
+        pixels = self.get_pixels()
+        bmp = wx.Bitmap(pixels.width, pixels.height, 32)
+        bmp.CopyFromBuffer(pixels.data, img_format, pixels.stride)
         return bmp
     
     def convert_to_cairo_surface(self, cairo):
@@ -224,6 +317,11 @@ class Image(BaseImageProt):
         if not dib:
             raise RuntimeError('Unable to copy image')
         return self.__class__(dib)
+
+    def rescale_region(self, box, width, height, resampling_filter=CO.FILTER_BICUBIC):
+        #Copy only takes whole pixels
+        left, top, right, bottom = (round(v) for v in box)
+        return self.copy_region(left, top, right, bottom).rescale(width, height, resampling_filter)
     
     def paste(self, src, left, top, alpha=256):
         copy_required = False
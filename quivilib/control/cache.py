@@ -1,5 +1,7 @@
 import logging
 import traceback
+from collections.abc import Callable
+from functools import partial
 from threading import Thread, Lock, Semaphore
 
 import wx
@@ -9,23 +11,32 @@ from quivilib import meta
 from quivilib.interface.imagehandler import ImageHandler
 from quivilib.model import image
 from quivilib.model.container.base import BaseContainer
+from quivilib.model.dimensions import DimensionStore
 from quivilib.util import DebugTimer
 
 log = logging.getLogger('cache')
 log.setLevel(logging.ERROR)
 
-#TODO: I want to save the resolution for any image that has been loaded, even if it is unloaded.
-#Should that go in here?
+#The resolution of every image that has been loaded is kept in Item.dimensions and the DimensionStore
+#(see also control/dimension_prober.py), so it's still known after the image is unloaded.
 
 
 class ImageCacheLoadRequest(object):
     """ Data class containing the necessary information for loading an image
     i.e. the physical path.
     """
-    def __init__(self, container: BaseContainer, item) -> None:
+    def __init__(self, container: BaseContainer, item, fit: Callable[[int, int], float]|None = None,
+                 preview: bool = False) -> None:
+        """fit: see Canvas.get_fit_function. Without it, the image is decoded at full size.
+        preview: send cache.image_preview with a quick low resolution copy first, if one can be made.
+        """
         self.container = container
         self.item = item
         self.path = item.path
+        self.fit = fit
+        self.preview = preview
+        #The preview shown for this request while it's decoded, if any. Set by whoever shows it.
+        self.preview_img: ImageHandler|None = None
     def __eq__(self, other):
         if not other:
             return False
@@ -42,31 +53,48 @@ class ImageCacheLoadRequest(object):
 class ImageCacheLoaded(ImageCacheLoadRequest):
     """ An ImageCacheLoadRequest that has an actual image loaded.
     """
-    def __init__(self, src, settings) -> None:
-        super().__init__(src.container, src.item)
-        item_index = self.container.items.index(self.item)
+    def __init__(self, src, settings, on_preview: Callable[[ImageHandler], None]|None = None) -> None:
+        """on_preview is called with the preview image (see image.open_preview), if there is one,
+        before the image is decoded."""
+        super().__init__(src.container, src.item, src.fit)
+        item_index = self.container.index_of(self.item)
         f = self.container.open_image(item_index)
         assert f is not None, "Failed to open image from container"
         #can't use "with" because not every file-like object used here supports it
         try:
+            if on_preview is not None:
+                preview = image.open_preview(f, self.path, self.fit)
+                if preview is not None:
+                    on_preview(preview)
             with DebugTimer(f'Cache: {self.path.name}'):
-                img = image.open_img(f, self.path, delay=True)
+                img = image.open_img(f, self.path, delay=True, fit=self.fit, reopen=self._reopen)
         finally:
             f.close()
         self.img: ImageHandler = img
+        #img.memory_size when it was last added to the cache
+        self.cached_size = 0
+
+    def _reopen(self):
+        """Open the image again, e.g. to decode it at full size. The container may have been replaced
+        (see ImageCache.on_container_moved)."""
+        return self.container.open_image(self.container.index_of(self.item))
 
 class ImageCache(object):
-    def __init__(self, settings) -> None:
+    def __init__(self, settings, dimensions: DimensionStore|None = None) -> None:
         self.settings = settings
+        self.dimensions = dimensions
         Publisher.subscribe(self.on_load_image, 'cache.load_image')
         Publisher.subscribe(self.on_clear_pending, 'cache.clear_pending')
         Publisher.subscribe(self.on_flush, 'cache.flush')
+        Publisher.subscribe(self.on_invalidate, 'cache.invalidate')
         Publisher.subscribe(self.on_program_closed, 'program.closed')
         Publisher.subscribe(self.on_container_moved, 'cache.move_file')
         
         self.queue : list[ImageCacheLoadRequest|None] = []
         self.q_lock = Lock()
         self.cache : list[ImageCacheLoaded] = []
+        #Sum of cached_size of the images in the cache
+        self.cache_memory = 0
         self.c_lock = Lock()
         self.semaphore = Semaphore(0)
         self.thread = Thread(target=self.run, daemon=True)
@@ -88,8 +116,8 @@ class ImageCache(object):
                     if not preload:
                         #Remove and then re-add the request so it is at the back of the queue.
                         #Only do this for actual loads, not preload fetch requests.
-                        self.cache.remove(req)
-                        self.cache.insert(0, req)
+                        self._remove(req)
+                        self._insert(req)
                     break
         if not hit and request != self.processing_request:
             log.debug(f'main: cache MISS   -- {request.path}')
@@ -98,14 +126,39 @@ class ImageCache(object):
     def on_image_loaded(self, request: ImageCacheLoaded) -> None:
         """ Called by the forked thread after the image is loaded. Handles the queue and message passing.
         """
+        dimensions = (request.img.base_width, request.img.base_height)
+        request.item.dimensions = dimensions
+        if self.dimensions is not None:
+            self.dimensions.put_item(request.item, dimensions)
         with self.c_lock:
-            if len(self.cache) >= meta.CACHE_SIZE:
-                removed = self.cache.pop()
-                self.notify_cache_removed(removed)
-                log.debug(f'main: removed cache {removed.path}')
-            self.cache.insert(0, request)
             request.img.delayed_load()
+            self._insert(request)
+            self._evict()
             self.notify_image_loaded(request)
+
+    def _insert(self, request: ImageCacheLoaded) -> None:
+        """Add the request as the most recently used. Its size is measured again, since zooming
+        or decoding the full size changes it. Must be called with c_lock held.
+        """
+        request.cached_size = request.img.memory_size
+        self.cache.insert(0, request)
+        self.cache_memory += request.cached_size
+
+    def _remove(self, request: ImageCacheLoaded) -> None:
+        """Must be called with c_lock held."""
+        self.cache.remove(request)
+        self.cache_memory -= request.cached_size
+
+    def _evict(self) -> None:
+        """Remove the least recently used images until the cache fits both meta.CACHE_SIZE and
+        meta.CACHE_MEMORY_SIZE. The newest image is always kept, however big it is.
+        Must be called with c_lock held.
+        """
+        while len(self.cache) > 1 and (len(self.cache) > meta.CACHE_SIZE or self.cache_memory > meta.CACHE_MEMORY_SIZE):
+            removed = self.cache.pop()
+            self.cache_memory -= removed.cached_size
+            self.notify_cache_removed(removed)
+            log.debug(f'main: removed cache {removed.path}')
             
     def on_flush(self) -> None:
         """ Clear out the cache.
@@ -114,13 +167,36 @@ class ImageCache(object):
         """
         with self.c_lock:
             self.cache.clear()
+            self.cache_memory = 0
             log.debug('main: cleared cache')
 
+    def on_invalidate(self, *, container: BaseContainer, items: list) -> None:
+        """ Remove only the given items of the container from the cache and the queue,
+        e.g. because the files were changed or removed.
+        Invoked by message passing.
+        """
+        paths = {item.path for item in items}
+        def is_stale(req):
+            return req is not None and req.container is container and req.path in paths
+        with self.c_lock:
+            for req in [req for req in self.cache if is_stale(req)]:
+                self._remove(req)
+        with self.q_lock:
+            self.queue = [req for req in self.queue if not is_stale(req)]
+        log.debug(f'main: invalidated {len(paths)} items')
+
     def notify_image_loaded(self, request: ImageCacheLoaded) -> None:
         """ Send message notifying of load completion.
         """
         Publisher.sendMessage('cache.image_loaded', request=request)
         
+    def notify_image_preview(self, request: ImageCacheLoadRequest, img: ImageHandler) -> None:
+        """ Send message with the preview of an image that is still being decoded.
+        It isn't cached; the decoded image is sent as usual when it's done.
+        """
+        img.delayed_load()
+        Publisher.sendMessage('cache.image_preview', request=request, img=img)
+
     def notify_image_load_error(self, request: ImageCacheLoadRequest, exception, tb) -> None:
         """ Send message notifying of load failure.
         """
@@ -198,14 +274,23 @@ class ImageCache(object):
                         log.debug('thread: queue empty')
                         break
                     req = self.queue.pop()
-                if req is None:
-                    return
+                    if req is None:
+                        return
+                    upcoming = [q.item for q in self.queue if q is not None and q.container is req.container]
+                #Let the container read the pending requests together with this one
+                try:
+                    req.container.prefetch([req.item] + upcoming)
+                except Exception:
+                    log.debug('thread: prefetch failed', exc_info=True)
                 self.processing_request = req
                 e, tb = None, None
                 try:
                     log.debug('thread: running request...')
                     #Convert the request to a Loaded image.
-                    loaded = ImageCacheLoaded(req, self.settings)
+                    on_preview = None
+                    if req.preview:
+                        on_preview = partial(wx.CallAfter, self.notify_image_preview, req)
+                    loaded = ImageCacheLoaded(req, self.settings, on_preview)
                     log.debug('thread: request processed, notifying')
                     wx.CallAfter(self.on_image_loaded, loaded)
                     log.debug('thread: request processed notified')
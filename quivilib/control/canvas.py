@@ -6,6 +6,7 @@ from pubsub import pub as Publisher
 
 from quivilib import meta
 from quivilib.interface.canvasadapter import CanvasLike
+from quivilib.interface.imagehandler import ImageHandler
 from quivilib.model import image
 from quivilib.model.commandenum import MovementType, FitSettings, MovementSize
 from quivilib.model.canvas import Canvas, PaintedRegion, WallpaperCanvas
@@ -197,6 +198,7 @@ class CanvasController(BaseCanvasController):
 
         self.pending_request: ImageCacheLoadRequest|None = None
         Publisher.subscribe(self.on_request_open_image, f'{self.name}.load.img')
+        Publisher.subscribe(self.on_cache_image_preview, 'cache.image_preview')
         Publisher.subscribe(self.on_cache_image_loaded, 'cache.image_loaded')
         Publisher.subscribe(self.on_cache_image_load_error, 'cache.image_load_error')
         Publisher.subscribe(self.on_timer, 'timer.pulse')
@@ -271,11 +273,14 @@ class CanvasController(BaseCanvasController):
     # Image loading (moved from file list)
     def on_request_open_image(self, *, container, item, preload=False):
         if meta.CACHE_ENABLED:
-            request = ImageCacheLoadRequest(container, item)
+            request = ImageCacheLoadRequest(container, item, self.canvas.get_fit_function(), preview=not preload)
             if not preload:
                 self.pending_request = request
                 Publisher.sendMessage('cache.clear_pending', request=request)
                 Publisher.sendMessage('container.image.loading', item=item)
+                if item.dimensions is not None:
+                    #Known from the header (see DimensionProber); no need to wait for the decode
+                    self.canvas.announce_fit(*item.dimensions)
             Publisher.sendMessage('cache.load_image', request=request, preload=preload)
             log.debug("canvas: cache requested")
             if not preload and self.pending_request is not None:
@@ -284,22 +289,35 @@ class CanvasController(BaseCanvasController):
         else:
             Publisher.sendMessage('busy', busy=True)
             path = item.path
-            item_index = container.items.index(item)
+            item_index = container.index_of(item)
             f = container.open_image(item_index)
             # can't use "with" because not every file-like object used here supports it
             try:
                 with DebugTimer(path.name):
-                    img = image.open_img(f, path)
+                    img = image.open_img(f, path, fit=self.canvas.get_fit_function(),
+                                         reopen=lambda: container.open_image(container.index_of(item)))
                     self.canvas.load_img(img)
             finally:
                 f.close()
             Publisher.sendMessage('busy', busy=False)
             Publisher.sendMessage('container.image.opened', item=item)
 
+    def on_cache_image_preview(self, *, request: ImageCacheLoadRequest, img: ImageHandler):
+        if request == self.pending_request:
+            #The cache may have sent an equal request, not ours
+            self.pending_request.preview_img = img
+            self.canvas.load_img(img)
+            self.update_cursor()
+
     def on_cache_image_loaded(self, *, request: ImageCacheLoaded):
         if request == self.pending_request:
+            preview = self.pending_request.preview_img
             self.pending_request = None
-            self.canvas.load_img(request.img)
+            if preview is not None and self.canvas.img is preview:
+                #Keeps the zoom and position; the canvas repaints through the image's callback
+                preview.set_image(request.img)
+            else:
+                self.canvas.load_img(request.img)
             Publisher.sendMessage('busy', busy=False)
             item = request.item
             Publisher.sendMessage('container.image.opened', item=item)
@@ -308,6 +326,9 @@ class CanvasController(BaseCanvasController):
 
     def on_cache_image_load_error(self, *, request: ImageCacheLoadRequest, exception, tb):
         if request == self.pending_request:
+            preview = self.pending_request.preview_img
+            if preview is not None and self.canvas.img is preview:
+                self.canvas.close_img()
             Publisher.sendMessage('busy', busy=False)
             Publisher.sendMessage('error', exception=exception, tb=tb)
             self.pending_request = None
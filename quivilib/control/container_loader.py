@@ -0,0 +1,95 @@
+import logging
+import traceback
+from collections.abc import Callable
+from threading import Thread, Event
+
+import wx
+from pubsub import pub as Publisher
+
+from quivilib.model.container import ContainerOpenCancelled
+from quivilib.model.container.base import BaseContainer, deferred_messages
+
+log = logging.getLogger('control.container_loader')
+
+
+class ContainerLoader(object):
+    """ Opens containers in a background thread, so listing a huge directory or archive
+    doesn't freeze the window. The current container stays usable until the new one is ready.
+    Only the most recent request is kept; starting a new one cancels the previous one.
+    container.loading is sent when a load starts, and container.loading_cancelled if it's
+    cancelled or fails (otherwise the container sends container.opened).
+    """
+    def __init__(self) -> None:
+        self._generation = 0
+        self._cancel: Event|None = None
+        Publisher.subscribe(self.on_program_closed, 'program.closed')
+
+    @property
+    def loading(self) -> bool:
+        return self._cancel is not None
+
+    def load(self, name: str, build_fn: Callable[[], BaseContainer],
+             on_done: Callable[[BaseContainer], None],
+             on_error: Callable[[Exception, str], None]|None = None) -> None:
+        """Call `build_fn` in a background thread and then `on_done` with the result in the main thread.
+        Messages sent by the container while it's being built are held back until it's accepted.
+        If `build_fn` raises, `on_error` is called with the exception and traceback in the main thread;
+        without it, the error is shown to the user.
+        """
+        self.cancel()
+        self._generation += 1
+        cancel = self._cancel = Event()
+        Publisher.sendMessage('busy', busy=True)
+        Publisher.sendMessage('container.loading', name=name)
+        thread = Thread(target=self._run, args=(self._generation, cancel, build_fn, on_done, on_error), daemon=True)
+        thread.start()
+
+    def cancel(self) -> None:
+        """Cancel the pending load, if any. A container that finishes anyway is discarded."""
+        if self._cancel is None:
+            return
+        log.debug('loader: cancelling pending open')
+        self._cancel.set()
+        self._cancel = None
+        Publisher.sendMessage('busy', busy=False)
+        Publisher.sendMessage('container.loading_cancelled')
+
+    def _run(self, generation: int, cancel: Event, build_fn, on_done, on_error) -> None:
+        try:
+            with deferred_messages(cancel) as messages:
+                container = build_fn()
+        except ContainerOpenCancelled:
+            log.debug('loader: open cancelled')
+            return
+        except Exception as e:
+            tb = traceback.format_exc()
+            wx.CallAfter(self._on_error, generation, e, tb, on_error)
+            return
+        wx.CallAfter(self._on_loaded, generation, container, messages, on_done)
+
+    def _is_current(self, generation: int) -> bool:
+        return generation == self._generation and self._cancel is not None
+
+    def _on_loaded(self, generation: int, container: BaseContainer, messages, on_done) -> None:
+        if not self._is_current(generation):
+            container.close_container()
+            return
+        self._cancel = None
+        Publisher.sendMessage('busy', busy=False)
+        for topic, kwargs in messages:
+            Publisher.sendMessage(topic, **kwargs)
+        on_done(container)
+
+    def _on_error(self, generation: int, exception, tb, on_error) -> None:
+        if not self._is_current(generation):
+            return
+        self._cancel = None
+        Publisher.sendMessage('busy', busy=False)
+        Publisher.sendMessage('container.loading_cancelled')
+        if on_error:
+            on_error(exception, tb)
+        else:
+            Publisher.sendMessage('error', exception=exception, tb=tb)
+
+    def on_program_closed(self, *, settings_lst=None) -> None:
+        self.cancel()
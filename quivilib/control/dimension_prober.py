@@ -0,0 +1,88 @@
+import logging
+from threading import Thread, Event
+
+import wx
+from pubsub import pub as Publisher
+
+from quivilib.model.container import Item, ItemType
+from quivilib.model.container.base import BaseContainer
+from quivilib.model.dimensions import DimensionStore
+from quivilib.model.image.probe import probe_size
+from quivilib.util import DebugTimer
+
+log = logging.getLogger('control.dimension_prober')
+
+#Number of probed items handed to the GUI thread at a time
+_BATCH_SIZE = 64
+
+
+class DimensionProber(object):
+    """ Fills in Item.dimensions for every image of the open container in a background thread,
+    by reading only the image headers. Known dimensions are taken from (and saved to) the DimensionStore.
+    Fit and spread detection can then be worked out before an image is decoded.
+    """
+    def __init__(self, store: DimensionStore) -> None:
+        self.store = store
+        self._cancel: Event|None = None
+        Publisher.subscribe(self.on_program_closed, 'program.closed')
+
+    def probe(self, container: BaseContainer) -> None:
+        """Start probing the container, cancelling any previous pass."""
+        self.cancel()
+        cancel = self._cancel = Event()
+        items = [item for item in container.items if item.typ == ItemType.IMAGE and item.dimensions is None]
+        if items:
+            thread = Thread(target=self._run, args=(container, items, cancel), daemon=True)
+            thread.start()
+
+    def cancel(self) -> None:
+        if self._cancel is not None:
+            self._cancel.set()
+            self._cancel = None
+
+    def _run(self, container: BaseContainer, items: list[Item], cancel: Event) -> None:
+        probed = 0
+        results: list[tuple[Item, tuple[int, int]]] = []
+        with DebugTimer(f'probe: {len(items)} images in {container.name}'):
+            for item in items:
+                if cancel.is_set():
+                    break
+                dimensions = self.store.get_item(item)
+                if dimensions is None:
+                    dimensions = self._probe_item(container, item)
+                    if dimensions is None:
+                        continue
+                    self.store.put_item(item, dimensions)
+                    probed += 1
+                results.append((item, dimensions))
+                if len(results) >= _BATCH_SIZE:
+                    wx.CallAfter(self._apply, results)
+                    results = []
+        if results:
+            #Even if cancelled, these are still right for their items
+            wx.CallAfter(self._apply, results)
+        log.debug(f'probe: read {probed} headers, {len(items) - probed} from the store or unknown')
+
+    @staticmethod
+    def _apply(results: list[tuple[Item, tuple[int, int]]]) -> None:
+        """Called in the GUI thread, which is the only one that reads Item.dimensions."""
+        for item, dimensions in results:
+            item.dimensions = dimensions
+
+    @staticmethod
+    def _probe_item(container: BaseContainer, item: Item) -> tuple[int, int]|None:
+        try:
+            f = container.open_image_stream(item)
+            if f is None:
+                return None
+            try:
+                return probe_size(f)
+            finally:
+                f.close()
+        except Exception:
+            #Unreadable, or the container was closed meanwhile. The image will be decoded eventually anyway.
+            log.debug(f'probe: failed for {item.path}', exc_info=True)
+            return None
+
+    def on_program_closed(self, *, settings_lst=None) -> None:
+        self.cancel()
@@ -1,6 +1,9 @@
 import logging
 import os
+import traceback
+from collections.abc import Callable
 from pathlib import Path
+from threading import Thread
 from typing import Any
 
 import wx
@@ -8,15 +11,18 @@ from pubsub import pub as Publisher
 
 from quivilib import meta
 from quivilib.control.cache import ImageCacheLoadRequest
+from quivilib.control.container_loader import ContainerLoader
+from quivilib.control.dimension_prober import DimensionProber
 from quivilib.i18n import _
 from quivilib.meta import PATH_SEP
 from quivilib.model import App
-from quivilib.model.container import ItemType, get_supported_extensions as get_supported_container_extensions, SortOrder
+from quivilib.model.container import Item, ItemType, is_supported_extension as is_container_extension, SortOrder
 from quivilib.model.container.base import BaseContainer
 from quivilib.model.container.compressed import CompressedContainer
 from quivilib.model.container.directory import DirectoryContainer
+from quivilib.model.container.watcher import DirectoryWatcher, watch_directory
 from quivilib.model.favorites import Favorite
-from quivilib.model.image import get_supported_extensions as get_supported_image_extensions
+from quivilib.model.image import is_supported_extension as is_image_extension
 from quivilib.util import DebugTimer
 
 log = logging.getLogger('control.file_list')
@@ -40,18 +46,21 @@ class FileListController(object):
         Publisher.subscribe(self.on_container_item_changed, 'container.item.changed')
         Publisher.subscribe(self.on_file_dropped, 'file.dropped')
         Publisher.subscribe(self.on_move_file, 'file_list.move_file')
+        Publisher.subscribe(self.on_program_closed, 'program.closed')
         self.pending_request = None
         self._last_opened_item = None
         self._direction = 1
         self.show_hidden = False
+        self.loader = ContainerLoader()
+        self._watcher: DirectoryWatcher|None = None
+        self._watched_container: BaseContainer|None = None
+        self.prober = DimensionProber(model.dimensions)
         self._set_container(start_container)
         
     def on_file_list_activated(self, *, index: int):
         container = self.model.container
         if container.items[index].typ != ItemType.IMAGE:
-            opened = container.open_container(index)
-            if opened:
-                self._set_container(opened)
+            self._open_container(container, index)
             
     def on_file_list_selected(self, *, index: int):
         container = self.model.container
@@ -74,8 +83,7 @@ class FileListController(object):
 
     def on_favorite_open(self, *, favorite: Favorite, window=None):
         is_placeholder = favorite.page is not None
-        try:
-            self._open_path(favorite.path, is_placeholder)
+        def on_opened():
             if is_placeholder:
                 #Bypass the default page open and manually select the saved index.
                 #Otherwise it will try to load the cover page and the selected page.
@@ -86,13 +94,23 @@ class FileListController(object):
                     self.model.favorites.remove(favorite.path, is_placeholder)
                     Publisher.sendMessage('favorites.changed', favorites=self.model.favorites, settings=self.model.settings)
                     log.debug(f'Removing placeholder on open: {favorite.path}')
-        except FileNotFoundError as e:
+        def on_missing():
             #Favorite invalid; probably deleted manually. Prompt user to remove.
             if _ask_delete_favorite(window, favorite.path) == wx.ID_YES:
                 #Duplicate of remove_favorite in main.
                 self.model.favorites.remove(favorite.path, is_placeholder)
                 Publisher.sendMessage('favorites.changed', favorites=self.model.favorites, settings=self.model.settings)
                 Publisher.sendMessage('favorite.opened', favorite=False)
+        def on_error(exception, tb):
+            #The path may also disappear while the container is being built
+            if isinstance(exception, FileNotFoundError):
+                on_missing()
+            else:
+                Publisher.sendMessage('error', exception=exception, tb=tb)
+        try:
+            self._open_path(favorite.path, is_placeholder, on_opened, on_error)
+        except FileNotFoundError:
+            on_missing()
 
     def open_item(self, item_index: int) -> None:
         container = self.model.container
@@ -114,18 +132,17 @@ class FileListController(object):
                 log.debug("fl: done")
             self._last_opened_item = item_index
         else:
-            opened = container.open_container(item_index)
-            if opened:
-                self._set_container(opened)
+            self._open_container(container, item_index)
 
     def on_file_dropped(self, *, path: Path):
         self.open_path(path)
 
     def open_parent(self) -> None:
         container = self.model.container
-        parent = container.open_parent()
-        if parent and parent is not container:
-            self._set_container(parent)
+        def on_done(parent: BaseContainer):
+            if parent and parent is not container:
+                self._set_container(parent)
+        self.loader.load(container.name, container.open_parent, on_done)
 
     def open_directory(self) -> None:
         class Request():
@@ -153,43 +170,81 @@ class FileListController(object):
         container = self.model.container
         index = container.selected_item_index
         if container.items[index].typ != ItemType.IMAGE:
-            container = container.open_container(index)
-            self._set_container(container)
+            self._open_container(container, index)
             
     def open_sibling(self, skip) -> None:
-        Publisher.sendMessage('gui.freeze')
-        try:
-            container = self.model.container
-            parent = container.open_parent()
-            if parent and parent is not container:
+        container = self.model.container
+        def on_done(parent: BaseContainer):
+            if parent is container:
+                return
+            Publisher.sendMessage('gui.freeze')
+            try:
                 self.model.container = parent
+                self._watch_container()
                 nindex = parent.selected_item_index + skip
                 if 0 <= nindex < parent.item_count:
                     self.open_item(nindex)
                     if parent.items[nindex].typ == ItemType.IMAGE:
                         parent.selected_item = nindex
-        finally:
-            Publisher.sendMessage('gui.thaw') 
+            finally:
+                Publisher.sendMessage('gui.thaw')
+        self.loader.load(container.name, container.open_parent, on_done)
+
+    def _open_container(self, container: BaseContainer, index: int) -> None:
+        """Open the container item at `index` in the background and switch to it when it's ready."""
+        item = container.items[index]
+        def build():
+            #The list may have been re-sorted while waiting for the thread
+            return container.open_container(container.index_of(item))
+        self.loader.load(item.name, build, self._set_container)
         
     def refresh(self) -> None:
+        self.loader.cancel()
         Publisher.sendMessage('cache.flush')
         self.model.container.refresh(self.show_hidden)
         
-    def refresh_after_delete(self, deleted_index: int) -> None:
+    def delete_item(self, deleted_index: int, window) -> None:
+        """Delete the file of the item and continue from its neighbour, in the current direction.
+        Only that item is removed from the list and the cache, so the prefetched pages are kept.
+        The file itself is deleted (or recycled) in the background.
+        """
         container = self.model.container
-        self.refresh()
+        item = container.remove_item(deleted_index)
+        Publisher.sendMessage('cache.invalidate', container=container, items=[item])
+        #wx can only be used from the main thread, so the thread only gets the window handle
+        hwnd = window.GetHandle() if window else 0
+        thread = Thread(target=self._delete_file, args=(container, item, hwnd), daemon=True)
+        thread.start()
+        if container.item_count <= 1:
+            #Only the parent is left
+            return
         nindex = deleted_index if self._direction == 1 else deleted_index - 1
         nindex = max(1, min(nindex, len(container.items) - 1))
         container.selected_item = nindex 
         if container.items[nindex].typ == ItemType.IMAGE:
             self.open_item(nindex)
 
+    def _delete_file(self, container: BaseContainer, item: Item, hwnd: int) -> None:
+        try:
+            with DebugTimer(f'delete: {item.path}'):
+                container.delete_image(item, hwnd)
+        except Exception as e:
+            tb = traceback.format_exc()
+            wx.CallAfter(self._on_delete_failed, container, item, e, tb)
+
+    def _on_delete_failed(self, container: BaseContainer, item: Item, exception, tb) -> None:
+        #Put the item back, since the file is still there
+        if container is self.model.container:
+            container.restore_item(item)
+        Publisher.sendMessage('error', exception=exception, tb=tb)
+
     def on_move_file(self, *, new_dir: Path):
         """ If the opened container is a zipfile, prompt to move it to a new location.
         In theory this could be done for regular dirs too, but this isn't supported.
         """
         if not self._can_move():
             return
+        self.loader.cancel()
         cont = self.model.container
         old_cont = cont
         old_path = cont.path
@@ -245,39 +300,61 @@ class FileListController(object):
             self.on_favorite_open(favorite=favorite)
         else:
             self._open_path(path, skip_open)
-    def _open_path(self, path: Path, skip_open=False) -> None:
+    def _open_path(self, path: Path, skip_open=False, on_opened: Callable[[], None]|None = None,
+                   on_error: Callable[[Exception, str], None]|None = None) -> None:
         """Open the given path for viewing. This may be a directory (show images), a single image,
         or a archive (e.g. zip) containing images.
         Opening a single image will open the containing directory and jump directly to that image.
+        The container is built in the background; `on_opened` is called once it's displayed,
+        or `on_error` if building it fails (see ContainerLoader.load).
+        Raises FileNotFoundError immediately if the path doesn't exist.
         """
         sort_order = self.model.container.sort_order
         show_hidden = self.model.container.show_hidden
+        build: Callable[[], BaseContainer]
         
         if path.is_dir():
-            container = DirectoryContainer(path, sort_order, show_hidden)
-            self._set_container(container, skip_open)
-        elif path.is_file() and path.suffix.lower() in get_supported_image_extensions():
-            container = DirectoryContainer(path.parent, sort_order, show_hidden)
-            self.model.container = container
-            container.selected_item = path
-            if container.selected_item_index != -1:
-                self.open_item(container.selected_item_index)
-        elif path.is_file() and path.suffix.lower() in get_supported_container_extensions():
-            container = CompressedContainer(path, sort_order, show_hidden)
-            self._set_container(container, skip_open)
+            def build():
+                return DirectoryContainer(path, sort_order, show_hidden)
+            def on_done(container):
+                self._set_container(container, skip_open)
+        elif path.is_file() and is_image_extension(path.suffix):
+            def build():
+                container = DirectoryContainer(path.parent, sort_order, show_hidden)
+                container.selected_item = path
+                return container
+            def on_done(container):
+                self.model.container = container
+                self._watch_container()
+                if container.selected_item_index != -1:
+                    self.open_item(container.selected_item_index)
+        elif path.is_file() and is_container_extension(path.suffix):
+            def build():
+                return CompressedContainer(path, sort_order, show_hidden)
+            def on_done(container):
+                self._set_container(container, skip_open)
         else:
             paths = str(path).split(PATH_SEP)
             root_container_path = Path(paths[0])
             if root_container_path.is_file():
-                root_container = CompressedContainer(root_container_path, sort_order, show_hidden)
-                container = self._open_virtual_path(root_container, paths[1:])
-                if container.selected_item_index == -1:
-                    self._set_container(container, skip_open)
-                else:
-                    self.model.container = container
-                    self.open_item(container.selected_item_index)
+                def build():
+                    root_container = CompressedContainer(root_container_path, sort_order, show_hidden)
+                    return self._open_virtual_path(root_container, paths[1:])
+                def on_done(container):
+                    if container.selected_item_index == -1:
+                        self._set_container(container, skip_open)
+                    else:
+                        self.model.container = container
+                        self._watch_container()
+                        self.open_item(container.selected_item_index)
             else:
                 raise FileNotFoundError(_('File or directory does not exist'))
+
+        def on_loaded(container: BaseContainer):
+            on_done(container)
+            if on_opened:
+                on_opened()
+        self.loader.load(path.name, build, on_loaded, on_error)
             
     def toggle_show_hidden(self) -> None:
         self.show_hidden = not self.show_hidden
@@ -300,10 +377,49 @@ class FileListController(object):
                 container = container.open_container(container.selected_item_index)
                 return self._open_virtual_path(container, paths[1:])
         
+    def _watch_container(self) -> None:
+        """Watch the current container for changes on disk, if it's a directory,
+        and start reading the dimensions of its images.
+        """
+        container = self.model.container
+        if container is self._watched_container:
+            return
+        if container is not None:
+            self.prober.probe(container)
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+        self._watched_container = container
+        if meta.WATCH_DIRECTORIES and isinstance(container, DirectoryContainer):
+            def on_change(names):
+                #Stat the entries here; after lost events that's the whole directory
+                changes = container.scan_entries(names)
+                wx.CallAfter(self._on_directory_changed, container, changes)
+            self._watcher = watch_directory(container.path, on_change)
+
+    def _on_directory_changed(self, container: DirectoryContainer, changes) -> None:
+        if container is not self.model.container:
+            return
+        stale = container.apply_changes(*changes)
+        if not stale:
+            return
+        log.debug(f'fl: {len(stale)} items changed on disk')
+        Publisher.sendMessage('cache.invalidate', container=container, items=stale)
+        self.prober.probe(container)
+        selected = container.selected_item
+        if selected is not None and selected in stale and selected.typ == ItemType.IMAGE:
+            #The open image was modified
+            self.open_item(container.selected_item_index)
+
+    def on_program_closed(self, *, settings_lst=None) -> None:
+        if self._watcher:
+            self._watcher.stop()
+
     def _set_container(self, container: BaseContainer, skip_open=False) -> None:
         if self.model.container is not None:
             self.model.container.close_container()
         self.model.container = container
+        self._watch_container()
         self._last_opened_item = None
         if not skip_open:
             for idx, item in enumerate(self.model.container.items):
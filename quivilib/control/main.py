@@ -33,6 +33,7 @@ class MainController(object):
     INI_FILE_NAME = 'pyquivi.ini'
     LOG_FILE_NAME = 'quivi.log' 
     STDIO_FILE_NAME = 'error.log' 
+    DIMENSIONS_FILE_NAME = 'dimensions.json'
     
     def __init__(self, main_script, file_to_open):
         if main_script is not None:
@@ -73,10 +74,11 @@ class MainController(object):
         
         self.view = MainWindow()
         
-        self.model = App(self.settings, start_dir)
+        dimensions_path = Path(wx.StandardPaths.Get().GetUserDataDir()) / self.DIMENSIONS_FILE_NAME
+        self.model = App(self.settings, start_dir, dimensions_path)
         
         self.i18n = I18NController(self, self.settings)
-        self.cache = ImageCache(self.settings)
+        self.cache = ImageCache(self.settings, self.model.dimensions)
         self.canvas = CanvasController('canvas', self.view.canvas_view, settings=self.settings)
         #This will send messages due to opening the default container
         #TODO: Probably should move that out of the constructor...
@@ -273,8 +275,7 @@ class MainController(object):
         img = self.canvas.get_img()
         if filetype == ItemType.IMAGE and img:
             img.close()
-        container.delete_image(index, self.view)
-        self.file_list.refresh_after_delete(index)
+        self.file_list.delete_item(index, self.view)
 
     def _need_delete_confirmation(self):
         # No confirmation on win32 because it uses the recycle bin.
@@ -347,6 +348,7 @@ class MainController(object):
         #TODO: (3,2) Improve: make favorites save in the config automatically
         self.model.favorites.save(self.settings)
         self.settings.save()
+        self.model.dimensions.save()
         tempdir.delete_tempdir()
         log.shutdown()
 
@@ -27,10 +27,14 @@ class QuiviStatusBar(wx.StatusBar):
         zoom_width = self.GetTextExtent('9999.99%')[0] + 20
         fit_width = self.GetTextExtent('Width if larger with added stuff')[0] + 20
         self.SetStatusWidths([-1, size_width, zoom_width, fit_width])
+        #Shown again if a container load doesn't finish
+        self._name_before_loading = ''
 
         Publisher.subscribe(self.on_canvas_fit_changed, 'canvas.fit.changed')
         Publisher.subscribe(self.on_canvas_zoom_changed, 'canvas.zoom.changed')
         Publisher.subscribe(self.on_container_opened, 'container.opened')
+        Publisher.subscribe(self.on_container_loading, 'container.loading')
+        Publisher.subscribe(self.on_container_loading_cancelled, 'container.loading_cancelled')
         Publisher.subscribe(self.on_image_opened, 'container.image.opened')
         Publisher.subscribe(self.on_image_loading, 'container.image.loading')
         Publisher.subscribe(self.on_image_loaded, 'canvas.image.loaded')
@@ -49,6 +53,8 @@ class QuiviStatusBar(wx.StatusBar):
 
     def on_image_loading(self, *, item):
         self.SetStatusText(_('Loading...'), NAME_FIELD)
+        if item.dimensions is not None:
+            self.SetStatusText('%d x %d' % item.dimensions, SIZE_FIELD)
 
     def on_image_loaded(self, *, img: ImageHandler):
         if img is None:
@@ -59,6 +65,13 @@ class QuiviStatusBar(wx.StatusBar):
             height = img.base_height
             self.SetStatusText('%d x %d' % (width, height), SIZE_FIELD)
 
+    def on_container_loading(self, *, name: str):
+        self._name_before_loading = self.GetStatusText(NAME_FIELD)
+        self.SetStatusText(f"{_('Loading...')} {name}", NAME_FIELD)
+
+    def on_container_loading_cancelled(self):
+        self.SetStatusText(self._name_before_loading, NAME_FIELD)
+
     def on_container_opened(self, *, container: BaseContainer):
         self.SetStatusText(container.name, NAME_FIELD)
 
@@ -51,6 +51,7 @@ class FileList(wx.ListCtrl, FileListViewBase):
         self.Bind(wx.EVT_LIST_COL_END_DRAG, self.on_end_column_drag)
         self.Bind(wx.EVT_LIST_BEGIN_DRAG, self.on_begin_drag)
         Publisher.subscribe(self.on_container_changed, 'container.changed')
+        Publisher.subscribe(self.on_container_items_changed, 'container.items.changed')
         Publisher.subscribe(self.on_selection_changed, 'container.selection_changed')
         Publisher.subscribe(self.on_language_changed, 'language.changed')
         
@@ -123,6 +124,19 @@ class FileList(wx.ListCtrl, FileListViewBase):
         if sel >= 0:
             self.on_selection_changed(idx=sel, item=self.container.selected_item)
         
+    def on_container_items_changed(self, *, container: BaseContainer):
+        #Some items were added or removed; being a virtual list, it's enough
+        #to update the count and redraw. The icons and scroll position are kept.
+        if container is not self.container:
+            return
+        count = len(container.items)
+        self.SetItemCount(count)
+        if count:
+            self.RefreshItems(0, count - 1)
+        sel = container.selected_item_index
+        if sel >= 0:
+            self.on_selection_changed(idx=sel, item=container.selected_item)
+
     def flush_icon_cache(self):
         self.icon_cache = {}
         #TODO: (1,3) Improve: get size from somewhere
@@ -42,6 +42,7 @@ class QuiviThumbnailCtrl(tc.ThumbnailCtrl, FileListViewBase):
         self.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_item_selected)
         self.Bind(st.EVT_THUMBNAILS_DCLICK, self.on_item_activated)
         Publisher.subscribe(self.on_container_changed, 'container.changed')
+        Publisher.subscribe(self.on_container_items_changed, 'container.items.changed')
         Publisher.subscribe(self.on_selection_changed, 'container.selection_changed')
         
     @error_handler(_handle_error)
@@ -61,6 +62,11 @@ class QuiviThumbnailCtrl(tc.ThumbnailCtrl, FileListViewBase):
             if sel >= 0:
                 self.on_selection_changed(idx=sel, item=self.container.selected_item)
         
+    def on_container_items_changed(self, *, container):
+        #The thumbnail control can't insert items, so rebuild it
+        if container is self.container:
+            self.on_container_changed(container=container)
+
     def on_selection_changed(self, *, idx, item):
         if not self._delayed_load:
             self._selecting_programatically = True
@@ -3,6 +3,7 @@ import sys
 import threading
 import time
 from collections.abc import Callable
+from enum import IntFlag
 from typing import Protocol, IO, Self, Tuple, List
 
 import wx
@@ -12,6 +13,44 @@ from quivilib.util import rescale_by_size_factor
 log = logging.getLogger('IMG')
 
 
+class Capability(IntFlag):
+    """What an image backend can do beyond plain decoding. Used to route formats to backends."""
+    NONE = 0
+    #Decodes every frame of animated images (GIF, APNG, WebP)
+    ANIMATION = 1 << 0
+    #Can decode straight to a reduced size (e.g. JPEG DCT scaling). CreateImage accepts fit= and reopen=
+    DRAFT = 1 << 1
+
+
+class PixelBuffer(object):
+    """Decoded pixels in cairo's FORMAT_RGB24 layout: 4 bytes per pixel, B G R (unused) in memory,
+    rows top-down and stride bytes apart. This is also wx's BitmapBufferFormat_RGB32, so the same
+    buffer can back a cairo surface (create_for_data) and fill a wx.Bitmap without converting.
+    Grayscale images may instead use 1 byte per pixel (cairo's FORMAT_A8 layout), if the caller allows it.
+    data may be read-only (e.g. bytes from PIL); it's only copied for cairo, which needs a writable buffer.
+    """
+    RGB = 4
+    GRAY = 1
+
+    def __init__(self, width: int, height: int, data, stride: int|None = None, bytes_per_pixel: int = RGB) -> None:
+        self.width = width
+        self.height = height
+        self.bytes_per_pixel = bytes_per_pixel
+        #Rows are 4 byte aligned, as cairo requires
+        self.stride = stride if stride is not None else (width * bytes_per_pixel + 3) & ~3
+        self.data = data
+
+    @property
+    def is_gray(self) -> bool:
+        return self.bytes_per_pixel == self.GRAY
+
+    def to_wx_bitmap(self) -> wx.Bitmap:
+        assert not self.is_gray, 'wx bitmaps need RGB pixels'
+        bmp = wx.Bitmap(self.width, self.height, 32)
+        bmp.CopyFromBuffer(self.data, wx.BitmapBufferFormat_RGB32, self.stride)
+        return bmp
+
+
 class BaseImageProt(Protocol):
     """Protocol for an image, direct from PIL/FreeImage.
     Or, rather, the wrapper classes used to standardize the interface."""
@@ -33,9 +72,18 @@ class BaseImageProt(Protocol):
     def convert_to_raw_bits(self, width_bytes=None) -> bytearray:
         pass
 
+    def get_pixels(self, allow_gray: bool = False) -> PixelBuffer:
+        """The image as a PixelBuffer, converted in as few passes as possible.
+        If allow_gray, grayscale images are returned as 1 byte per pixel."""
+        pass
+
     def copy_region(self, left: int, top: int, right: int, bottom: int) -> Self:
         pass
 
+    def rescale_region(self, box: tuple[float, float, float, float], width: int, height: int) -> Self:
+        """The part of the image inside box (left, top, right, bottom) scaled to width x height."""
+        pass
+
     def paste(self, src, left: int, top: int, alpha: int = 256) -> None:
         pass
 
@@ -116,9 +164,26 @@ class ImageHandler(Protocol):
     @staticmethod
     def extensions() -> list[str]:
         pass
+    capabilities: Capability
+    "What the backend supports; see Capability"
+    backend_name: str
+    "Short name used to refer to the backend in settings, e.g. meta.PREFERRED_DECODERS"
     def getImg(self) -> BaseImageProt:
         """Direct access to the underlying Image, which is likely a mistake."""
         pass
+    def load_full_resolution(self) -> bool:
+        """If the image was decoded at a reduced size, decode it again at full size.
+        Returns True if the image changed."""
+        pass
+    def load_full_resolution_async(self, on_loaded: Callable[[], None]) -> bool:
+        """Like load_full_resolution, but decodes in the background worker and calls on_loaded in the
+        main thread once the image changed. Returns False if there's nothing to decode."""
+        pass
+    @property
+    def memory_size(self) -> int:
+        """Approximate number of bytes held for the image (pixels, bitmaps, kept file contents).
+        Used for the cache budget."""
+        pass
 
 class SecondaryImageHandler(ImageHandler):
     @classmethod
@@ -138,6 +203,8 @@ class ImageHandlerBase(ImageHandler):
     "Height of the originally loaded image, without modification"
     img_change_cb: Callable[[ImageHandler], None] | None = None
     "Callback function used to inform the owning canvas of a change to the image"
+    capabilities = Capability.NONE
+    backend_name = ''
 
     @property
     def base_width(self):
@@ -197,6 +264,17 @@ class ImageHandlerBase(ImageHandler):
     def is_animated(self):
         return False
 
+    def load_full_resolution(self) -> bool:
+        return False
+
+    def load_full_resolution_async(self, on_loaded: Callable[[], None]) -> bool:
+        return False
+
+    @property
+    def memory_size(self) -> int:
+        #Rough default: one 32 bit copy of the displayed image
+        return self.base_width * self.base_height * 4
+
     def set_callback(self, cb:Callable[[ImageHandler], None]) -> None:
         self.img_change_cb = cb
 
@@ -222,6 +300,8 @@ if sys.platform == 'win32':
 class AnimatedImage(ImageHandlerBase):
     """Base class for an animated image. Manages a timer to handle the animation, using the callback function to report changes.
     delays should be a list of duration in ms (GIF stores the value in cs)
+    frames only needs len() and indexing; subclasses that decode frames as they play (see decode_ahead)
+    use their own get_display_bmp.
     """
     def __init__(self, frames: List[wx.Bitmap], delays: List[int], loops = 0):
         if len(frames) != len(delays):
@@ -285,6 +365,7 @@ class AnimatedImage(ImageHandlerBase):
         else:
             assert self.timer is not None
             self.timer.Start(self.delays[self.frame] - SLEEP_OFFSET, True)
+            self.decode_ahead()
         if __debug__:
             self.planned_delay = self.delays[self.frame]
             self.start = time.perf_counter()
@@ -302,6 +383,11 @@ class AnimatedImage(ImageHandlerBase):
             assert self.timer is not None
             self.timer.Stop()
 
+    def decode_ahead(self) -> None:
+        """Called after each frame change, from the animation thread (or the main thread with wx.Timer).
+        Subclasses that decode frames as they play do it here."""
+        pass
+
     def _next_frame_timer(self, event):
         assert self.timer is not None
         next_delay = self._next_frame()
@@ -309,16 +395,22 @@ class AnimatedImage(ImageHandlerBase):
             return
         #Times in ms.
         self.timer.Start(int(next_delay - SLEEP_OFFSET), True)
+        self.decode_ahead()
+    def _sleep_after_decode(self, delay: float) -> None:
+        #Decoding counts towards the frame's delay
+        start = time.perf_counter()
+        self.decode_ahead()
+        #Times in s.
+        time.sleep(max(0.0, delay / 1000.0 - (time.perf_counter() - start)))
     def _next_frame_thread(self):
         #In practice, self.frame will always be 0 here.
         first_delay = self.delays[self.frame]
-        time.sleep(first_delay / 1000.0)
+        self._sleep_after_decode(first_delay)
         while not self.stopped:
             next_delay = self._next_frame()
             if next_delay is None:
                 return
-            #Times in s.
-            time.sleep(next_delay / 1000.0)
+            self._sleep_after_decode(next_delay)
 
     def _next_frame(self) -> float|None:
         """Shared logic for advancing to the next frame of an animation.
@@ -17,8 +17,54 @@ ORIG_AUTHOR_EMAIL = 'conradoplg@gmail.com'
 COPYRIGHT = f"Copyright (c) 2009, {ORIG_AUTHOR} <{ORIG_AUTHOR_EMAIL}>\nCopyright (c) 2022, {AUTHOR} <{AUTHOR_EMAIL}>\nAll rights reserved."
 
 CACHE_ENABLED = True
+#Maximum number of images kept in the cache...
 CACHE_SIZE = 7
+#...and the memory they may use, in bytes (decoded pixels plus any zoomed copy).
+#Small or grayscale pages are cheap, so many more of them fit than large color ones.
+CACHE_MEMORY_SIZE = 512 * 1024 * 1024
 PREFETCH_COUNT = 2
+#Number of recently listed directories kept, so going back to a parent (e.g. to open the next
+#archive in a series) doesn't list it again. Reused only while the directory is unchanged.
+LISTING_CACHE_SIZE = 4
+#Number of image dimensions remembered between sessions (read from the headers in the background).
+DIMENSION_STORE_SIZE = 20000
+#Decoder tried first for each image format (told from the file contents, not the extension).
+#'pil' or 'freeimage'; if that one isn't enabled or fails, the others are tried. Formats not
+#listed use the order in quivilib.model.image (PIL first). Tune this by timing both backends.
+PREFERRED_DECODERS = {
+    'JPEG': 'pil',
+    'PNG': 'pil',
+    'GIF': 'pil',
+    'WEBP': 'pil',
+    'TIFF': 'freeimage',
+    'PSD': 'freeimage',
+}
+#Decode large images at a reduced size (e.g. 1/2, 1/4) when they'll be shown at that size or smaller.
+#The full size is decoded when zooming past it.
+DECODE_REDUCED = True
+#Show a quick low resolution copy of large JPEGs (their EXIF thumbnail, or decoded at 1/8) while
+#the image is decoded. Images decoded to fewer pixels than this (after any reduction, see DECODE_REDUCED)
+#are fast enough without one.
+PROGRESSIVE_PREVIEW = True
+PREVIEW_MIN_PIXELS = 4 * 1024 * 1024
+#Frames of animated images are decoded while they play, at most this many ahead of the one shown.
+ANIMATION_FRAMES_AHEAD = 8
+#Images longer than this (in pixels, either side) are shown in tiles: only the part in view is scaled
+#and made into bitmaps. Bitmaps and cairo surfaces can't be much larger (cairo's limit is 32767).
+TILED_MIN_SIZE = 16384
+#Memory for the tiles kept per image, in bytes
+TILE_CACHE_SIZE = 64 * 1024 * 1024
+#Ask the OS to start reading the next images of a directory before they're needed (helps on slow drives).
+DIRECTORY_READAHEAD = True
+#Bytes of archive data that may be read ahead, so consecutive pages are read in one go.
+ARCHIVE_READAHEAD_SIZE = 32 * 1024 * 1024
+#Containers with at least this many items compute the sort keys for the other sort orders
+#in the background, so changing the sort order is instant. 0 to disable.
+SORT_KEY_PRECOMPUTE_MIN = 1000
+#Watch the open directory and update the file list when files are added, removed or changed.
+WATCH_DIRECTORIES = True
+#Seconds between checks where the OS can't notify about changes (i.e. anything but Linux).
+WATCH_POLL_INTERVAL = 2.0
 if __debug__:
     DEBUG = True
     LOG_LEVEL = logging.DEBUG
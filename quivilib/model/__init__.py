@@ -1,12 +1,14 @@
 from quivilib.model.container.directory import DirectoryContainer
 from quivilib.model.canvas import Canvas
+from quivilib.model.dimensions import DimensionStore
 from quivilib.model.favorites import Favorites
 from quivilib.model.settings import Settings
 
 
 class App(object):
-    def __init__(self, conf, start_dir):
+    def __init__(self, conf, start_dir, dimensions_path=None):
         self.settings: Settings = conf
+        self.dimensions = DimensionStore(dimensions_path)
         sort_order = conf.getint('FileList', 'SortOrder')
         #Must be created before container in order to notify if it's a favorite
         self.favorites = Favorites(conf)
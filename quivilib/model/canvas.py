@@ -14,6 +14,36 @@ from quivilib.util import rescale_by_size_factor
 #Number of scrolls at the top/bottom of the image needed to switch to horizontal scroll.
 #Maybe a timestamp is more appropriate?
 STICKY_LIMIT = 2
+
+def get_fit_factor(fit_type: FitSettings.FitType, img_w: int, img_h: int, view_w: int, view_h: int,
+                   detect_spreads=False, custom_w=0) -> tuple[float, bool]:
+    """Return the zoom factor for fitting an image of the given size in the view, and whether it was
+    considered a spread. Only the dimensions are needed, so this also works before the image is decoded.
+    """
+    is_spread = False
+    if detect_spreads and img_w > (img_h * 1.3):
+        #Normal page layout is taller than it is long. If this is not true,
+        #assume it's two pages combined. display may be improved by calculating the width based on the "half" pages
+        img_w = (img_w+1) // 2
+        #Used for status bar updates. Will be reported even if it doesn't matter (e.g. fit height). Is this bad?
+        is_spread = True
+
+    if (fit_type & FitSettings.FitType.WINDOW) == FitSettings.FitType.WINDOW:
+        factor = rescale_by_size_factor(img_w, img_h, view_w, view_h)
+    elif (fit_type & FitSettings.FitType.HEIGHT) == FitSettings.FitType.HEIGHT:
+        factor = rescale_by_size_factor(img_w, img_h, 0, view_h)
+    elif (fit_type & FitSettings.FitType.WIDTH) == FitSettings.FitType.WIDTH:
+        factor = rescale_by_size_factor(img_w, img_h, view_w, 0)
+    elif (fit_type & FitSettings.FitType.CUSTOM_WIDTH) == FitSettings.FitType.CUSTOM_WIDTH:
+        factor = rescale_by_size_factor(img_w, img_h, custom_w, 0)
+    elif fit_type == FitSettings.FitType.NONE:
+        factor = 1
+    else:
+        assert False, 'Invalid fit type: ' + str(fit_type)
+    if (fit_type & FitSettings.FitType._OVERSIZE):
+        factor = 1 if factor > 1 else factor
+    return factor, is_spread
+
 class Canvas(object):
     def __init__(self, name, settings) -> None:
         self.name = name
@@ -86,39 +116,42 @@ class Canvas(object):
     def set_zoom_by_fit_type(self, fit_type: FitSettings.FitType, scr_w = -1):
         if not self.img:
             return
-        view_w = self.view.width
-        view_h = self.view.height
-        spread = self._get_bool_setting('DetectSpreads')
-        img_w = self.img.base_width
-        img_h = self.img.base_height
-        is_spread = False
-        if spread and img_w > (img_h * 1.3):
-            #Normal page layout is taller than it is long. If this is not true,
-            #assume it's two pages combined. display may be improved by calculating the width based on the "half" pages
-            img_w = (img_w+1) // 2
-            #Used for status bar updates. Will be reported even if it doesn't matter (e.g. fit height). Is this bad?
-            is_spread = True
-
-        if (fit_type & FitSettings.FitType.WINDOW) == FitSettings.FitType.WINDOW:
-            factor = rescale_by_size_factor(img_w, img_h, view_w, view_h)
-        elif (fit_type & FitSettings.FitType.HEIGHT) == FitSettings.FitType.HEIGHT:
-            factor = rescale_by_size_factor(img_w, img_h, 0, view_h)
-        elif (fit_type & FitSettings.FitType.WIDTH) == FitSettings.FitType.WIDTH:
-            factor = rescale_by_size_factor(img_w, img_h, view_w, 0)
-        elif (fit_type & FitSettings.FitType.CUSTOM_WIDTH) == FitSettings.FitType.CUSTOM_WIDTH:
-            custom_w = self._get_int_setting('FitWidthCustomSize')
-            factor = rescale_by_size_factor(img_w, img_h, custom_w, 0)
-        elif fit_type == FitSettings.FitType.NONE:
-            factor = 1
-        else:
-            assert False, 'Invalid fit type: ' + str(fit_type)
-        if (fit_type & FitSettings.FitType._OVERSIZE):
-            factor = 1 if factor > 1 else factor
+        factor, is_spread = self._get_fit_factor(fit_type, self.img.base_width, self.img.base_height)
         self.zoom = factor
         
         self.center()
         Publisher.sendMessage(f'{self.name}.fit.changed', FitType=fit_type, IsSpread=is_spread)
 
+    def _get_fit_factor(self, fit_type: FitSettings.FitType, img_w: int, img_h: int) -> tuple[float, bool]:
+        custom_w = 0
+        if (fit_type & FitSettings.FitType.CUSTOM_WIDTH) == FitSettings.FitType.CUSTOM_WIDTH:
+            custom_w = self._get_int_setting('FitWidthCustomSize')
+        return get_fit_factor(fit_type, img_w, img_h, self.view.width, self.view.height,
+                              self._get_bool_setting('DetectSpreads'), custom_w)
+
+    def announce_fit(self, img_w: int, img_h: int) -> None:
+        """Report the fit (and whether it's a spread) an image of this size will get, e.g. from
+        Item.dimensions while the image is still being decoded. The zoom is set once it's loaded.
+        """
+        fit_type = FitSettings.get_fittype(self._get_str_setting('FitType'))
+        _, is_spread = self._get_fit_factor(fit_type, img_w, img_h)
+        Publisher.sendMessage(f'{self.name}.fit.changed', FitType=fit_type, IsSpread=is_spread)
+
+    def get_fit_function(self) -> Callable[[int, int], float]:
+        """The zoom that the current fit setting gives an image of a given size. The settings and view
+        size are read now, so the returned function can be called from other threads (e.g. to decode an
+        image at the size it'll be shown).
+        """
+        fit_type = FitSettings.get_fittype(self._get_str_setting('FitType'))
+        custom_w = 0
+        if (fit_type & FitSettings.FitType.CUSTOM_WIDTH) == FitSettings.FitType.CUSTOM_WIDTH:
+            custom_w = self._get_int_setting('FitWidthCustomSize')
+        view_w, view_h = self.view.width, self.view.height
+        detect_spreads = self._get_bool_setting('DetectSpreads')
+        def fit(img_w: int, img_h: int) -> float:
+            return get_fit_factor(fit_type, img_w, img_h, view_w, view_h, detect_spreads, custom_w)[0]
+        return fit
+
     def _zoom_image(self, zoom) -> bool:
         """ Shared logic between zoom_to_center (default behavior) and zoom_to_point (new behavior)
         This is still kinda confused because zoom_to_center is used as a setter.
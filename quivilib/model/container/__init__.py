@@ -1,11 +1,15 @@
 from pathlib import Path
 from enum import IntEnum, auto
-from quivilib.model.image import get_supported_extensions as get_supported_image_extensions
+from quivilib.model.image import is_supported_extension as is_image_extension
 
 
-supported_extensions = []
+_extensions = frozenset(['.rar', '.zip', '.cbr', '.cbz', '.tar', '.cbt'])
 def get_supported_extensions():
-    return ['.rar', '.zip', '.cbr', '.cbz']
+    return sorted(_extensions)
+
+def is_supported_extension(ext: str) -> bool:
+    return ext.lower() in _extensions
+
 supported_extensions = get_supported_extensions()
 
 
@@ -13,6 +17,11 @@ class UnsupportedPathError(Exception):
     pass
 
 
+class ContainerOpenCancelled(Exception):
+    """Raised inside a background container open when it has been cancelled."""
+    pass
+
+
 class Item(object):
     def __init__(self, path:Path, last_modified=None, chktyp:bool = True, data=None) -> None:
         """Create a Item.
@@ -27,6 +36,10 @@ class Item(object):
         self.path = path
         self.last_modified = last_modified
         self.data = data
+        #Natural sort keys, computed on demand by the container. SortOrder -> key
+        self.sort_keys: dict[SortOrder, tuple] = {}
+        #(width, height) if known, from the header or a previous load. Only set in the GUI thread.
+        self.dimensions: tuple[int, int]|None = None
         if not isinstance(path, Path):
             print(repr(path), type(path))
             assert False, "non-path given to " + __file__
@@ -38,9 +51,9 @@ class Item(object):
         elif (chktyp and path.is_file()) or (not chktyp and path.name not in '/\\'):
             self.ext = path.suffix.lower()
             self.namebase = self.path.stem.lower()
-            if self.ext.lower() in get_supported_extensions():
+            if self.ext in _extensions:
                 self.typ = ItemType.COMPRESSED
-            elif self.ext.lower() in get_supported_image_extensions():
+            elif is_image_extension(self.ext):
                 self.typ = ItemType.IMAGE
             else:
                 raise UnsupportedPathError()
@@ -65,6 +78,10 @@ class Item(object):
     
     def __ne__(self, other):
         return not self.__eq__(other)
+
+    def __hash__(self):
+        #Must agree with __eq__, which compares by path
+        return hash(self.path)
     
     def __str__(self):
         return str(self.path)
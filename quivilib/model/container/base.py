@@ -1,24 +1,101 @@
 import sys
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
+from threading import Thread, Event, local
 import operator
 
 from pubsub import pub as Publisher
 from natsort import natsort_keygen, ns
 
+from quivilib import meta
 from quivilib.model.container import Item, ItemType, SortOrder
-from quivilib.model.container import UnsupportedPathError
+from quivilib.model.container import UnsupportedPathError, ContainerOpenCancelled
+
+from typing import IO, Any
+
+
+#Containers may be created off the main thread (see control/container_loader.py).
+#Messages can't be sent from there, so they're queued while `deferred_messages` is active.
+_thread_state = local()
+
+@contextmanager
+def deferred_messages(cancel: Event|None = None):
+    """Queue any container messages sent by this thread instead of sending them.
+    The caller is responsible for sending the queued (topic, kwargs) pairs from the main thread.
+    If `cancel` is given and gets set, listing aborts with ContainerOpenCancelled.
+    """
+    queued: list[tuple[str, dict[str, Any]]] = []
+    _thread_state.queued = queued
+    _thread_state.cancel = cancel
+    try:
+        yield queued
+    finally:
+        _thread_state.queued = None
+        _thread_state.cancel = None
+
+def send_message(topic: str, **kwargs) -> None:
+    queued = getattr(_thread_state, 'queued', None)
+    if queued is None:
+        Publisher.sendMessage(topic, **kwargs)
+    else:
+        queued.append((topic, kwargs))
+
+def check_cancelled() -> None:
+    """Raise ContainerOpenCancelled if this thread's container open was cancelled."""
+    cancel = getattr(_thread_state, 'cancel', None)
+    if cancel is not None and cancel.is_set():
+        raise ContainerOpenCancelled()
+
+
+def _sort_keyfn(order: SortOrder):
+    if order == SortOrder.NAME:
+        def keyfn(elem):
+            return str(elem.path)
+    elif order == SortOrder.TYPE:
+        def keyfn(elem):
+            return elem.typ, str(elem.path)
+    elif order == SortOrder.EXTENSION:
+        def keyfn(elem):
+            return elem.ext, elem.namebase
+    elif order == SortOrder.LAST_MODIFIED:
+        keyfn = operator.attrgetter('typ', 'last_modified')
+    else:
+        assert False, 'Invalid sort order specified'
+    return keyfn
+
+#Building a natsort key generator isn't free, so only do it once per sort order.
+_natsort_keys = {order: natsort_keygen(key=_sort_keyfn(order), alg=ns.PATH) for order in SortOrder}
+
+def get_sort_key(item: Item, order: SortOrder) -> tuple:
+    """Return the natural sort key of the item for the given order.
+    Keys are computed the first time they're needed and then stored in the item.
+    """
+    keys = item.sort_keys
+    key = keys.get(order)
+    if key is None:
+        key = keys[order] = _natsort_keys[order](item)
+    return key
 
-from typing import IO
 
 class BaseContainer(object):
-    def __init__(self, sort_order: SortOrder, show_hidden: bool) -> None:
+    def __init__(self, sort_order: SortOrder, show_hidden: bool, items: list[Item]|None = None) -> None:
         self._selected_item: Item|None = None
         self.items: list[Item] = []
+        #Lookup tables for self.items. Rebuilt whenever the list is changed or reordered.
+        self._path_index: dict[Path, int] = {}
+        self._name_index: dict[str, int] = {}
         self._name: str
         self._sort_order = sort_order
+        self._precompute_thread: Thread|None = None
         self.show_hidden = show_hidden
-        self.refresh(show_hidden)
+        if items is None:
+            self.refresh(show_hidden)
+        else:
+            #Already listed (e.g. a cached listing); only needs sorting
+            check_cancelled()
+            self.items = items
+            self.sort_order = sort_order
 
     @property
     def sort_order(self) -> SortOrder:
@@ -26,28 +103,36 @@ class BaseContainer(object):
 
     @sort_order.setter
     def sort_order(self, order: SortOrder) -> None:
-        if order == SortOrder.NAME:
-            def keyfn(elem):
-                return str(elem.path)
-        elif order == SortOrder.TYPE:
-            def keyfn(elem):
-                return elem.typ, str(elem.path)
-        elif order == SortOrder.EXTENSION:
-            def keyfn(elem):
-                return elem.ext, elem.namebase
-        elif order == SortOrder.LAST_MODIFIED:
-            keyfn = operator.attrgetter('typ', 'last_modified')
-        else:
-            assert False, 'Invalid sort order specified'
+        assert order in _natsort_keys, 'Invalid sort order specified'
+        self._sort_order = order
+        self._sort_items()
+        self._precompute_sort_keys()
+        send_message('container.changed', container=self)
+
+    def _sort_items(self) -> None:
         parent = None
-        if self.items[0].path.name == '..':
+        if self.items and self.items[0].path.name == '..':
             parent = self.items.pop(0)
-        natsort_key = natsort_keygen(key=keyfn, alg=ns.PATH)
-        self.items.sort(key=natsort_key)
+        self.items.sort(key=lambda item: get_sort_key(item, self._sort_order))
         if parent:
             self.items.insert(0, parent)
-        self._sort_order = order
-        Publisher.sendMessage('container.changed', container=self)
+        self._rebuild_index()
+
+    def _precompute_sort_keys(self) -> None:
+        """Compute the sort keys for every other sort order in a background thread,
+        so switching the order (e.g. clicking a column header) on a large container doesn't stall.
+        """
+        if not meta.SORT_KEY_PRECOMPUTE_MIN or len(self.items) < meta.SORT_KEY_PRECOMPUTE_MIN:
+            return
+        if self._precompute_thread is not None and self._precompute_thread.is_alive():
+            return
+        def run(items: list[Item]):
+            #Races with the main thread are harmless; both sides would store the same key.
+            for order in SortOrder:
+                for item in items:
+                    get_sort_key(item, order)
+        self._precompute_thread = Thread(target=run, args=(list(self.items),), daemon=True)
+        self._precompute_thread.start()
 
     def open_container(self, item_index: int) -> 'BaseContainer':
         #Import here to avoid circular import
@@ -70,16 +155,26 @@ class BaseContainer(object):
     def refresh(self, show_hidden: bool) -> None:
         self.show_hidden = show_hidden
         paths = self._list_paths()
+        check_cancelled()
+        old_items = self.items
+        old_path_index = self._path_index
         self.items = []
         old_selected_item = self._selected_item
         self._selected_item = None
         selected_item = None
         for path, last_modified in paths:
+            check_cancelled()
             try:
                 item = Item(path, last_modified, not self.virtual_files, None)
                 self.items.append(item)
             except UnsupportedPathError:
                 continue
+            #Unchanged items can keep their sort keys
+            old_idx = old_path_index.get(path)
+            if old_idx is not None:
+                old_item = old_items[old_idx]
+                if old_item.last_modified == last_modified and old_item.typ == item.typ:
+                    item.sort_keys = old_item.sort_keys
             if old_selected_item == item:
                 selected_item = self.items[-1]
             #TODO: (2,3) Test: check is exceptions can be thrown inside the loop
@@ -94,7 +189,67 @@ class BaseContainer(object):
             #i.e., file has been modified (but it's probably overkill)
             self.selected_item = selected_item
             if self.selected_item.typ == ItemType.IMAGE:
-                Publisher.sendMessage('container.item.changed', index=self.items.index(self.selected_item))
+                send_message('container.item.changed', index=self.index_of(self.selected_item))
+
+    def apply_changes(self, added: list[tuple[Path, datetime|None]], removed: list[Path],
+                      modified: list[tuple[Path, datetime|None]]) -> list[Item]:
+        """Update the item list in place instead of re-listing the whole container.
+        `added` and `modified` are (path, last_modified) pairs, like _list_paths returns.
+        Returns the old items that were removed or replaced, so their cached images can be dropped.
+        """
+        #The changes may have been found in another thread, against a slightly older list
+        added = [(path, last_modified) for path, last_modified in added if path not in self._path_index]
+        gone = set(removed) | {path for path, _ in modified}
+        if not added and not gone:
+            return []
+        old_selected_index = self.selected_item_index
+        selected = self._selected_item
+        stale = [item for item in self.items if item.path in gone]
+        items = [item for item in self.items if item.path not in gone]
+        new_items = []
+        for path, last_modified in modified + added:
+            try:
+                new_items.append(Item(path, last_modified, not self.virtual_files, None))
+            except UnsupportedPathError:
+                continue
+        #The list is already sorted, so this is close to linear
+        self.items = items + new_items
+        self._sort_items()
+        for item in new_items:
+            item.full_path = self.get_item_path(self.index_of(item))
+        
+        if selected is not None and selected.path in gone:
+            if selected.path in self._path_index:
+                self._selected_item = self.items[self.index_of(selected)]
+            elif self.items:
+                #Removed; select whatever took its place
+                self._selected_item = self.items[min(old_selected_index, len(self.items) - 1)]
+            else:
+                self._selected_item = None
+        send_message('container.items.changed', container=self)
+        return stale
+
+    def _rebuild_index(self) -> None:
+        """Rebuild the path -> index and name -> index maps. Must be called after any change to self.items.
+        If there are duplicates the first one wins, same as list.index.
+        """
+        path_index: dict[Path, int] = {}
+        name_index: dict[str, int] = {}
+        for idx, item in enumerate(self.items):
+            path_index.setdefault(item.path, idx)
+            name_index.setdefault(item.path.name, idx)
+        self._path_index = path_index
+        self._name_index = name_index
+
+    def index_of(self, item: Item|Path) -> int:
+        """Return the index of the given item (or item path) in self.items.
+        Raises ValueError if not found, like list.index.
+        """
+        path = item.path if isinstance(item, Item) else item
+        try:
+            return self._path_index[path]
+        except KeyError:
+            raise ValueError(f'{path} is not in the container') from None
 
     @property
     def item_count(self):
@@ -132,24 +287,24 @@ class BaseContainer(object):
         if isinstance(item, int):
             self._selected_item = self.items[item]
         elif isinstance(item, Path):
-            lst = [i for i in self.items if i.path.name == item.name]
-            if lst:
-                self._selected_item = lst[0]
+            idx = self._name_index.get(item.name)
+            if idx is not None:
+                self._selected_item = self.items[idx]
         else:
-            if item in self.items:
+            if item.path in self._path_index:
                 self._selected_item = item
             else:
                 raise RuntimeError("Invalid item set as selected")
         if self._selected_item and self._selected_item != old_selected_item:
-            idx = self.items.index(self._selected_item)
-            Publisher.sendMessage('container.selection_changed', idx=idx, item=self._selected_item)
+            idx = self.index_of(self._selected_item)
+            send_message('container.selection_changed', idx=idx, item=self._selected_item)
 
     @property
     def selected_item_index(self):
         if self._selected_item is None:
             return -1
         try:
-            return self.items.index(self._selected_item)
+            return self.index_of(self._selected_item)
         except ValueError:
             return -1 
 
@@ -161,9 +316,27 @@ class BaseContainer(object):
         """ Return true if this container allows deleting contents (zip files could but don't, for example). """
         raise NotImplementedError()
 
-    def delete_image(self, index: int, window):
+    def delete_image(self, item: Item, hwnd: int = 0):
+        """ Delete the file of the given item. Doesn't touch the item list, so it may be called from another thread.
+        hwnd: (win32) handle of the window that owns any dialog shown, read on the main thread; 0 for none.
+        """
         raise NotImplementedError()
 
+    def remove_item(self, index: int) -> Item:
+        """ Remove a single item from the list (e.g. after deleting it) without re-listing the container. """
+        item = self.items[index]
+        self.apply_changes([], [item.path], [])
+        return item
+
+    def restore_item(self, item: Item) -> None:
+        """ Put back an item taken out by remove_item (e.g. because deleting its file failed). """
+        if item.path in self._path_index:
+            return
+        self.items.append(item)
+        self._sort_items()
+        item.full_path = self.get_item_path(self.index_of(item))
+        send_message('container.items.changed', container=self)
+
     def can_delete_self(self) -> bool:
         """ Return true if this container can be deleted while open. Deleting directories is not allowed. """
         raise NotImplementedError()
@@ -185,15 +358,29 @@ class BaseContainer(object):
     
     def open_image(self, item_index: int) -> IO[bytes]:
         raise NotImplementedError()
+
+    def open_image_stream(self, item: Item) -> IO[bytes]|None:
+        """Open the image for reading just the start of it (e.g. the header), without reading or
+        extracting the whole file first. Returns None if the container can't do this cheaply.
+        Unlike open_image this takes the item, since it's used from other threads.
+        """
+        return None
+
+    def prefetch(self, items: list[Item]) -> None:
+        """Hint that these items are about to be opened. The first one is being opened right now,
+        the rest are in no particular order. Called from the cache thread.
+        Containers may use it to read them more efficiently; the default does nothing.
+        """
+        pass
     
     def _list_paths(self) -> list[tuple[Path, datetime|None]]:
         raise NotImplementedError()
 
     @staticmethod
-    def _delete_file(path, window=None):
+    def _delete_file(path, hwnd: int = 0):
         if sys.platform == 'win32':
             #Use win32com.shell to send the file to the recycle bin, rather than outright deleting it.
             from quivilib.windows.util import delete_file
-            delete_file(str(path), window)
+            delete_file(str(path), hwnd)
         else:
             path.unlink()
\ No newline at end of file
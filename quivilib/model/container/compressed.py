@@ -1,17 +1,25 @@
 import sys, os
 import io
+import logging
+import mmap
+import tarfile
+from collections import OrderedDict
+from operator import attrgetter
 from pathlib import Path
+from threading import Lock
 from zipfile import ZipFile as PyZipFile, ZipInfo
 from datetime import datetime
 
-from pubsub import pub as Publisher
+from quivilib import meta
 from quivilib.model.container import Item, ItemType, SortOrder
-from quivilib.model.container.base import BaseContainer
+from quivilib.model.container.base import BaseContainer, send_message
 from quivilib.model.container.directory import DirectoryContainer
 from quivilib.meta import PATH_SEP
 from quivilib import tempdir
 
-from typing import Protocol, IO
+from typing import Protocol, IO, BinaryIO, Callable
+
+log = logging.getLogger('compressed')
 
 
 class CompressedFileFormat(Protocol):
@@ -24,6 +32,12 @@ class CompressedFileFormat(Protocol):
         pass
     def open_file(self, path) -> IO[bytes]:
         pass
+    def open_stream(self, path) -> IO[bytes]|None:
+        """Open the file without extracting all of it first. Optional; None if not supported."""
+        return None
+    def prefetch(self, paths: list[Path]) -> None:
+        """Hint that these files will be opened soon. Optional."""
+        pass
     def close(self) -> None:
         pass
 
@@ -36,6 +50,42 @@ def _is_hidden(path) -> bool:
     return False
 
 
+class _ReadAhead(object):
+    """Archive members that were read ahead recently, so their data is likely still in the OS cache.
+    Only the names and sizes are kept, up to a total size in bytes; the oldest are forgotten first.
+    Members are taken out when they're opened.
+    """
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._sizes
+
+    def put(self, name: str, size: int) -> None:
+        if name in self._sizes or size > self.max_size:
+            return
+        while self._sizes and self.size + size > self.max_size:
+            _, old = self._sizes.popitem(last=False)
+            self.size -= old
+        self._sizes[name] = size
+        self.size += size
+
+    def discard(self, name: str) -> None:
+        self.size -= self._sizes.pop(name, 0)
+
+    def clear(self) -> None:
+        self._sizes.clear()
+        self.size = 0
+
+
+#Unrequested bytes between members that are still read through rather than seeking over.
+_MAX_READ_GAP = 256 * 1024
+#Size of the reads that warm the OS cache
+_READ_AHEAD_CHUNK = 1024 * 1024
+
+
 class ZipFile(CompressedFileFormat):
     #TODO: (3,4) Improve: how to deal with password protected files?
     
@@ -45,6 +95,18 @@ class ZipFile(CompressedFileFormat):
         self.mapping = {}
         for f in self.file.infolist():
             self.mapping[Path(f.filename)] = f
+        #Where each member's data ends, i.e. where the next member (or the central directory) starts.
+        self._member_end: dict[str, int] = {}
+        infos = sorted(self.file.infolist(), key=attrgetter('header_offset'))
+        ends = [info.header_offset for info in infos[1:]] + [getattr(self.file, 'start_dir', -1)]
+        for info, end in zip(infos, ends):
+            self._member_end[info.filename] = end
+        self._read_ahead = _ReadAhead(meta.ARCHIVE_READAHEAD_SIZE)
+        self._read_ahead_lock = Lock()
+        #Separate handle for the coalesced reads, so they don't disturb zipfile's own file position
+        self._raw_fp: IO[bytes]|None = None
+        #Set by close(), which may happen while the cache thread is prefetching
+        self._closed = False
         
     @staticmethod
     def is_valid_extension(ext):
@@ -61,9 +123,76 @@ class ZipFile(CompressedFileFormat):
             encpath = self.mapping[path]
         else:
             encpath = str(path)
+        if isinstance(encpath, ZipInfo):
+            with self._read_ahead_lock:
+                self._read_ahead.discard(encpath.filename)
         return io.BytesIO(self.file.read(encpath))
 
+    def open_stream(self, path) -> IO[bytes]|None:
+        #Decompresses as it's read
+        return self.file.open(self.mapping[path])
+
+    def prefetch(self, paths: list[Path]) -> None:
+        """Read the raw data of the given members ahead, so it's in the OS cache when they're opened
+        (and decompressed by zipfile as usual). Members that are stored next to each other (usually
+        the case for consecutive pages) are read with a single sequential read, instead of one seek
+        and small read per member.
+        """
+        infos = []
+        with self._read_ahead_lock:
+            if self._closed:
+                return
+            for path in paths:
+                info = self.mapping.get(path)
+                if (info is None or info.is_dir() or info.flag_bits & 0x1
+                        or info.filename in self._read_ahead
+                        or self._member_end.get(info.filename, -1) < info.header_offset):
+                    continue
+                infos.append(info)
+        infos.sort(key=attrgetter('header_offset'))
+        run: list[ZipInfo] = []
+        for info in infos:
+            if run:
+                run_start = run[0].header_offset
+                gap = info.header_offset - self._member_end[run[-1].filename]
+                size = self._member_end[info.filename] - run_start
+                if gap > _MAX_READ_GAP or size > self._read_ahead.max_size:
+                    self._read_run(run)
+                    run = []
+            run.append(info)
+        self._read_run(run)
+
+    def _read_run(self, run: list[ZipInfo]) -> None:
+        #A single member is read just as fast when it's opened
+        if len(run) < 2:
+            return
+        start = run[0].header_offset
+        end = self._member_end[run[-1].filename]
+        chunk = memoryview(bytearray(min(_READ_AHEAD_CHUNK, end - start)))
+        with self._read_ahead_lock:
+            if self._closed:
+                #Don't leave a handle open that nothing would close (and that blocks moving the file)
+                return
+            if self._raw_fp is None:
+                self._raw_fp = open(self.path, 'rb', buffering=0)
+            self._raw_fp.seek(start)
+            left = end - start
+            while left > 0:
+                read = self._raw_fp.readinto(chunk[:min(left, len(chunk))])
+                if not read:
+                    break
+                left -= read
+            for info in run:
+                self._read_ahead.put(info.filename, self._member_end[info.filename] - info.header_offset)
+        log.debug(f'Read {len(run)} members ({end - start} bytes) in one read')
+
     def close(self) -> None:
+        with self._read_ahead_lock:
+            self._closed = True
+            self._read_ahead.clear()
+            if self._raw_fp is not None:
+                self._raw_fp.close()
+                self._raw_fp = None
         self.file.close()
         self.file = None    # type: ignore[assignment]
 
@@ -101,6 +230,172 @@ class RarFileExternal(CompressedFileFormat):
         return npath.replace(os.sep, '/')
 
 
+class _SliceReader(io.BufferedIOBase, BinaryIO):
+    """Read-only file object over a slice of a buffer (e.g. a mmap), without copying it up front.
+    on_close is called once the slice has been released.
+    """
+    def __init__(self, buffer, start: int, size: int, on_close: Callable[[], None]|None = None) -> None:
+        super().__init__()
+        self._view: memoryview|None = memoryview(buffer)[start:start+size]
+        self._pos = 0
+        self._on_close = on_close
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def read(self, size: int|None = -1) -> bytes:
+        assert self._view is not None, 'I/O operation on closed file'
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return data
+
+    def read1(self, size: int|None = -1) -> bytes:
+        return self.read(size)
+
+    def readinto(self, b) -> int:
+        assert self._view is not None, 'I/O operation on closed file'
+        out = memoryview(b).cast('B')
+        count = max(0, min(len(out), len(self._view) - self._pos))
+        out[:count] = self._view[self._pos:self._pos+count]
+        self._pos += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        assert self._view is not None, 'I/O operation on closed file'
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError('negative seek position')
+        self._pos = offset
+        return offset
+
+    def tell(self) -> int:
+        return self._pos
+
+    def getbuffer(self) -> memoryview:
+        """Like BytesIO.getbuffer: all the contents, without copying. Must not be kept after close."""
+        assert self._view is not None, 'I/O operation on closed file'
+        return self._view
+
+    def close(self) -> None:
+        if self._view is not None:
+            #Must be released, or the mmap can't be closed
+            self._view.release()
+            self._view = None
+            if self._on_close is not None:
+                self._on_close()
+                self._on_close = None
+        super().close()
+
+
+class _TarIndexCache(object):
+    """Member indexes of recently opened tar files, so reopening one (e.g. going back to it)
+    doesn't scan the headers again. Keyed by path, size and mtime.
+    """
+    def __init__(self) -> None:
+        self._entries: OrderedDict[tuple[Path, int, int], dict[Path, tuple[int, int, datetime]]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+            return index
+
+    def put(self, key, index) -> None:
+        with self._lock:
+            self._entries[key] = index
+            while len(self._entries) > meta.LISTING_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+_tar_index_cache = _TarIndexCache()
+
+
+class TarFile(CompressedFileFormat):
+    """Uncompressed tar (cbt). The members are stored as is, so after scanning the headers once
+    each page is just a slice of the (memory mapped) file.
+    """
+    @staticmethod
+    def is_valid_extension(ext):
+        return ext.lower() in ['.tar', '.cbt']
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.file = open(path, 'rb')
+        try:
+            stat = os.fstat(self.file.fileno())
+            key = (path, stat.st_size, stat.st_mtime_ns)
+            index = _tar_index_cache.get(key)
+            if index is None:
+                index = self._scan(self.file)
+                _tar_index_cache.put(key, index)
+            #member path -> (data offset, size, last modified)
+            self.index: dict[Path, tuple[int, int, datetime]] = index
+            #mmap can't map empty files
+            self._mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else None
+            #Open readers; the map is closed when the file and all of them are
+            self._readers = 0
+            self._closed = False
+            self._mm_lock = Lock()
+        except BaseException:
+            self.file.close()
+            raise
+
+    @staticmethod
+    def _scan(f: IO[bytes]) -> dict[Path, tuple[int, int, datetime]]:
+        index = {}
+        #'r:' only accepts uncompressed tars; compressed ones can't be sliced.
+        with tarfile.open(fileobj=f, mode='r:') as tar:
+            for info in tar:
+                if info.isfile():
+                    index[Path(info.name)] = (info.offset_data, info.size, datetime.fromtimestamp(info.mtime))
+        return index
+
+    def list_files(self) -> list[tuple[Path, datetime]]:
+        return [(path, last_modified) for path, (_, _, last_modified) in self.index.items()]
+
+    def open_file(self, path) -> IO[bytes]:
+        offset, size, _ = self.index[Path(path)]
+        with self._mm_lock:
+            if self._closed:
+                raise ValueError(f'{self.path} is closed')
+            if self._mm is None:
+                #Empty tar (mmap can't map those)
+                return io.BytesIO()
+            self._readers += 1
+            return _SliceReader(self._mm, offset, size, self._reader_closed)
+
+    def _reader_closed(self) -> None:
+        with self._mm_lock:
+            self._readers -= 1
+            if self._closed and not self._readers:
+                self._close_map()
+
+    def _close_map(self) -> None:
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def open_stream(self, path) -> IO[bytes]|None:
+        return self.open_file(path)
+
+    def close(self) -> None:
+        with self._mm_lock:
+            self._closed = True
+            #A page still being read keeps the map open until its reader is closed
+            if not self._readers:
+                self._close_map()
+        self.file.close()
+        self.file = None    # type: ignore[assignment]
+
+
 class CompressedContainer(BaseContainer):
     def __init__(self, path: Path, sort_order: SortOrder, show_hidden: bool) -> None:
         self._path = path.resolve()
@@ -109,6 +404,8 @@ class CompressedContainer(BaseContainer):
             classes = [ZipFile, RarFileExternal]
         elif RarFileExternal.is_valid_extension(self._path.suffix):
             classes = [RarFileExternal, ZipFile]
+        elif TarFile.is_valid_extension(self._path.suffix):
+            classes = [TarFile, ZipFile]
         else:
             assert False, 'Invalid compressed file extension'
         firstExcep: Exception|None = None
@@ -127,8 +424,13 @@ class CompressedContainer(BaseContainer):
             raise firstExcep
         self.file: CompressedFileFormat = archive
 
-        super().__init__(sort_order, show_hidden)
-        Publisher.sendMessage('container.opened', container=self)
+        try:
+            super().__init__(sort_order, show_hidden)
+        except BaseException:
+            #e.g. a cancelled background open; don't leave the archive open.
+            archive.close()
+            raise
+        send_message('container.opened', container=self)
 
     def _list_paths(self) -> list[tuple[Path, datetime|None]]:
         paths: list[tuple[Path, datetime|None]] = []
@@ -168,6 +470,20 @@ class CompressedContainer(BaseContainer):
         path = self.items[item_index].path
         img = self.file.open_file(path)
         return img 
+
+    def open_image_stream(self, item: Item) -> IO[bytes]|None:
+        return self.file.open_stream(item.path)
+
+    def prefetch(self, items: list[Item]) -> None:
+        #The pages after the requested ones are likely to be requested next,
+        #and reading them now is cheap if they're stored right after.
+        indices = sorted(self._path_index[item.path] for item in items if item.path in self._path_index)
+        if not indices:
+            return
+        last = indices[-1]
+        following = range(last + 1, min(last + 1 + meta.PREFETCH_COUNT, len(self.items)))
+        indices.extend(idx for idx in following if self.items[idx].typ == ItemType.IMAGE)
+        self.file.prefetch([self.items[idx].path for idx in indices])
     
     @property
     def virtual_files(self):
@@ -175,7 +491,8 @@ class CompressedContainer(BaseContainer):
     
     @staticmethod
     def is_valid_extension(ext):
-        return ZipFile.is_valid_extension(ext) or RarFileExternal.is_valid_extension(ext)
+        return (ZipFile.is_valid_extension(ext) or RarFileExternal.is_valid_extension(ext)
+                or TarFile.is_valid_extension(ext))
     
     @property
     def path(self) -> Path:
@@ -191,7 +508,7 @@ class CompressedContainer(BaseContainer):
         return True
 
     def delete_self(self, window):
-        BaseContainer._delete_file(self._path, window)
+        BaseContainer._delete_file(self._path, window.GetHandle() if window else 0)
 
     def get_item_path(self, item_index: int) -> Path:
         if item_index == 0:
@@ -1,15 +1,22 @@
+import logging
 import os
 import sys
+import time
+from collections import OrderedDict
 from datetime import datetime
 from pathlib import Path
-from pubsub import pub as Publisher
+from queue import SimpleQueue
+from threading import Thread, Lock
 
-from quivilib.model.container import ItemType
-from quivilib.model.container.base import BaseContainer
+from quivilib import meta
+from quivilib.model.container import Item, ItemType
+from quivilib.model.container.base import BaseContainer, send_message, check_cancelled
 from quivilib.model.container.root import RootContainer
 
 from typing import IO
 
+log = logging.getLogger('directory')
+
 
 def _is_hidden(path) -> bool:
     if sys.platform == 'win32':
@@ -26,15 +33,157 @@ def _is_hidden(path) -> bool:
     return False
 
 
+class _ReadAhead(object):
+    """Gets the OS to read files into its page cache before they're opened, so the decoder doesn't wait
+    on the drive. Uses posix_fadvise where available, otherwise a background thread reads the files
+    and throws the data away.
+    Also times the first read of each file, with and without a hint, to tell if it's helping.
+    """
+    LOG_EVERY = 20
+
+    def __init__(self) -> None:
+        self._hinted: set[Path] = set()
+        self._lock = Lock()
+        self._queue: SimpleQueue[Path]|None = None
+        #Hinted? -> [files read, seconds spent]
+        self.stats = {True: [0, 0.0], False: [0, 0.0]}
+
+    def hint(self, paths: list[Path], current: Path|None = None) -> None:
+        """Hint the files about to be opened. Earlier hints outside of them (pages that were skipped)
+        are forgotten; `current`, the file being opened right now, keeps its hint.
+        """
+        with self._lock:
+            keep = set(paths)
+            if current is not None:
+                keep.add(current)
+            self._hinted &= keep
+            new = [path for path in paths if path not in self._hinted]
+            self._hinted.update(new)
+        for path in new:
+            if hasattr(os, 'posix_fadvise'):
+                try:
+                    fd = os.open(path, os.O_RDONLY)
+                    try:
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    pass
+            else:
+                if self._queue is None:
+                    self._queue = SimpleQueue()
+                    Thread(target=self._warm_files, args=(self._queue,), daemon=True).start()
+                self._queue.put(path)
+
+    @staticmethod
+    def _warm_files(queue: SimpleQueue) -> None:
+        buf = bytearray(1024 * 1024)
+        while True:
+            path = queue.get()
+            try:
+                with open(path, 'rb', buffering=0) as f:
+                    while f.readinto(buf):
+                        pass
+            except OSError:
+                pass
+
+    def open(self, path: Path) -> IO[bytes]:
+        """Open the file, timing the first read (the wait for the drive, if it isn't cached)."""
+        with self._lock:
+            hinted = path in self._hinted
+            self._hinted.discard(path)
+        start = time.perf_counter()
+        f = path.open('rb')
+        try:
+            #Fills the buffer without moving the position
+            f.peek(1)
+        except BaseException:
+            f.close()
+            raise
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stat = self.stats[hinted]
+            stat[0] += 1
+            stat[1] += elapsed
+            total = self.stats[True][0] + self.stats[False][0]
+        if total % self.LOG_EVERY == 0:
+            log.debug(f'read-ahead: {self.summary()}')
+        return f
+
+    def summary(self) -> str:
+        def avg(stat):
+            return f'{stat[1] / stat[0] * 1000:0.1f}ms' if stat[0] else '-'
+        hinted = self.stats[True]
+        unhinted = self.stats[False]
+        return (f'{hinted[0]} hinted first reads avg {avg(hinted)}, '
+                f'{unhinted[0]} unhinted first reads avg {avg(unhinted)}')
+
+#Shared by all directories; only one is open at a time anyway.
+_read_ahead = _ReadAhead()
+
+
+class _ListingCache(object):
+    """Items of recently listed directories. An entry is only used while the directory's mtime is the
+    same as when it was listed (adding, removing or renaming files changes it). Rewriting a file in
+    place doesn't change it, so containers drop their entry when they find changed items.
+    """
+    def __init__(self) -> None:
+        self._entries: OrderedDict[tuple[Path, bool], tuple[int, list[Item]]] = OrderedDict()
+        #Containers may be built in the loader thread
+        self._lock = Lock()
+
+    def get(self, path: Path, show_hidden: bool) -> list[Item]|None:
+        try:
+            mtime = path.stat().st_mtime_ns
+        except OSError:
+            return None
+        key = (path, show_hidden)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != mtime:
+                return None
+            self._entries.move_to_end(key)
+            return list(entry[1])
+
+    def put(self, path: Path, show_hidden: bool, mtime: int, items: list[Item]) -> None:
+        key = (path, show_hidden)
+        with self._lock:
+            self._entries[key] = (mtime, list(items))
+            self._entries.move_to_end(key)
+            while len(self._entries) > meta.LISTING_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path: Path) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                del self._entries[key]
+
+_listing_cache = _ListingCache()
+
+
 class DirectoryContainer(BaseContainer):
     def __init__(self, directory: Path, sort_order, show_hidden: bool) -> None:
         self.path = directory.resolve()
-        BaseContainer.__init__(self, sort_order, show_hidden)
-        Publisher.sendMessage('container.opened', container=self)
+        items = None
+        if meta.LISTING_CACHE_SIZE:
+            items = _listing_cache.get(self.path, show_hidden)
+        BaseContainer.__init__(self, sort_order, show_hidden, items)
+        send_message('container.opened', container=self)
+
+    def refresh(self, show_hidden: bool) -> None:
+        #Take the mtime first, so a change made while listing invalidates the entry
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        super().refresh(show_hidden)
+        if meta.LISTING_CACHE_SIZE and mtime is not None:
+            _listing_cache.put(self.path, show_hidden, mtime, self.items)
                 
     def _list_paths(self) -> list[tuple[Path, datetime|None]]:
         paths = []
         for path in self.path.iterdir():
+            check_cancelled()
             last_modified: datetime|None = None
             if not self.show_hidden and _is_hidden(path):
                 continue
@@ -46,6 +195,58 @@ class DirectoryContainer(BaseContainer):
             paths.append((path, last_modified))
         paths.insert(0, (Path('..'), None))
         return paths
+
+    def apply_changes(self, added: list[tuple[Path, datetime|None]], removed: list[Path],
+                      modified: list[tuple[Path, datetime|None]]) -> list[Item]:
+        if added or removed or modified:
+            #The cached listing still has the old items
+            _listing_cache.invalidate(self.path)
+        return super().apply_changes(added, removed, modified)
+
+    def restore_item(self, item: Item) -> None:
+        _listing_cache.invalidate(self.path)
+        super().restore_item(item)
+
+    def update_entries(self, names: set[str]|None) -> list[Item]:
+        """Check the directory entries with the given names and add, remove or update their items.
+        None checks every entry. Returns the items that were removed or replaced.
+        """
+        return self.apply_changes(*self.scan_entries(names))
+
+    def scan_entries(self, names: set[str]|None) -> tuple[list[tuple[Path, datetime|None]], list[Path], list[tuple[Path, datetime|None]]]:
+        """The added, removed and modified entries among the given names (None checks every entry),
+        for apply_changes. Only reads the item list, so the directory watcher calls it from its thread
+        and applies the result on the main thread.
+        """
+        #The main thread may change the list meanwhile; apply_changes copes with a slightly stale result
+        known = {item.path: item.last_modified for item in list(self.items)}
+        if names is None:
+            names = {path.name for path, _ in self._list_paths()} | {path.name for path in known}
+        added = []
+        removed = []
+        modified = []
+        for name in names:
+            if name == '..':
+                continue
+            path = self.path / name
+            try:
+                stat = path.lstat()
+            except os.error:
+                stat = None
+            if stat is None or (not self.show_hidden and _is_hidden(path)):
+                if path in known:
+                    removed.append(path)
+                continue
+            last_modified: datetime|None = None
+            try:
+                last_modified = datetime.fromtimestamp(stat.st_mtime)
+            except ValueError:
+                pass
+            if path not in known:
+                added.append((path, last_modified))
+            elif known[path] != last_modified:
+                modified.append((path, last_modified))
+        return added, removed, modified
             
     @property
     def name(self):
@@ -69,8 +270,25 @@ class DirectoryContainer(BaseContainer):
         return parent
     
     def open_image(self, item_index: int) -> IO[bytes]:
-        img = self.items[item_index].path.open('rb')
-        return img
+        if not meta.DIRECTORY_READAHEAD:
+            return self.items[item_index].path.open('rb')
+        return _read_ahead.open(self.items[item_index].path)
+
+    def open_image_stream(self, item: Item) -> IO[bytes]|None:
+        return item.path.open('rb')
+
+    def prefetch(self, items: list[Item]) -> None:
+        if not meta.DIRECTORY_READAHEAD or not items:
+            return
+        indices = [self._path_index[item.path] for item in items if item.path in self._path_index]
+        if not indices:
+            return
+        last = max(indices)
+        indices.extend(range(last + 1, min(last + 1 + meta.PREFETCH_COUNT, len(self.items))))
+        #items[0] is already being opened, so it's too late for it.
+        paths = [self.items[idx].path for idx in indices
+                 if self.items[idx].typ == ItemType.IMAGE and self.items[idx].path != items[0].path]
+        _read_ahead.hint(paths, items[0].path)
     
     def can_delete_contents(self) -> bool:
         can_delete = False
@@ -82,9 +300,8 @@ class DirectoryContainer(BaseContainer):
     def can_delete_self(self) -> bool:
         return False
 
-    def delete_image(self, index: int, window):
-        path = self.items[index].path
-        BaseContainer._delete_file(path, window)
+    def delete_image(self, item: Item, hwnd: int = 0):
+        BaseContainer._delete_file(item.path, hwnd)
     
     @property
     def universal_path(self) -> Path|None:
@@ -1,9 +1,7 @@
 from datetime import datetime
 from pathlib import Path
-from pubsub import pub as Publisher
-
 from quivilib.i18n import _
-from quivilib.model.container.base import BaseContainer
+from quivilib.model.container.base import BaseContainer, send_message
 
 
 try:
@@ -14,7 +12,7 @@ except ImportError:
 
 class RootContainer(BaseContainer):
     def __init__(self, sort_order, show_hidden: bool) -> None:
-        Publisher.sendMessage('container.opened', container=self)
+        send_message('container.opened', container=self)
         BaseContainer.__init__(self, sort_order, show_hidden)
 
     def _list_paths(self) -> list[tuple[Path, datetime|None]]:
@@ -0,0 +1,200 @@
+"""Watch an open directory for changes, so the file list can be updated without a manual refresh.
+Uses inotify on Linux and polls the directory everywhere else.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+from collections.abc import Callable
+from pathlib import Path
+from threading import Thread, Event
+
+from quivilib import meta
+
+log = logging.getLogger('watcher')
+
+#Files are usually written in several steps, so wait until the events stop for this long (seconds)
+#before reporting. This also merges the events of a program dropping several files at once.
+_SETTLE_DELAY = 0.3
+#Rewriting a file in place doesn't change the directory mtime, so the polling watcher
+#compares every entry once every this many polls.
+_RESCAN_POLLS = 5
+
+#Called from the watcher thread with the names of the entries that changed, or None if
+#it's unknown what changed (e.g. events were lost) and everything should be checked.
+ChangeCallback = Callable[[set[str]|None], None]
+
+
+class DirectoryWatcher(object):
+    def __init__(self, path: Path, callback: ChangeCallback) -> None:
+        self.path = path
+        self.callback = callback
+        self._stop = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching. Returns immediately; the thread exits on its next wake up."""
+        self._stop.set()
+
+    def _run(self) -> None:
+        raise NotImplementedError()
+
+
+class PollingWatcher(DirectoryWatcher):
+    def _snapshot(self) -> dict[str, float]:
+        snapshot = {}
+        with os.scandir(self.path) as it:
+            for entry in it:
+                try:
+                    snapshot[entry.name] = entry.stat(follow_symlinks=False).st_mtime
+                except OSError:
+                    pass
+        return snapshot
+
+    def _run(self) -> None:
+        try:
+            dir_mtime = os.stat(self.path).st_mtime
+            snapshot = self._snapshot()
+        except OSError:
+            log.debug(f'Could not read {self.path}, not watching it')
+            return
+        polls = 0
+        while not self._stop.wait(meta.WATCH_POLL_INTERVAL):
+            polls += 1
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if mtime == dir_mtime and polls % _RESCAN_POLLS:
+                    continue
+                dir_mtime = mtime
+                new_snapshot = self._snapshot()
+            except OSError:
+                continue
+            changed = {name for name in snapshot.keys() | new_snapshot.keys()
+                       if snapshot.get(name) != new_snapshot.get(name)}
+            snapshot = new_snapshot
+            if changed:
+                self.callback(changed)
+
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = os.O_CLOEXEC
+
+#IN_MODIFY is left out on purpose: it fires for every write; IN_CLOSE_WRITE fires once at the end.
+_WATCH_MASK = (_IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+               | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher(DirectoryWatcher):
+    _libc: ctypes.CDLL|None = None
+
+    @classmethod
+    def available(cls) -> bool:
+        if not sys.platform.startswith('linux'):
+            return False
+        if cls._libc is None:
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+                libc.inotify_init1.argtypes = [ctypes.c_int]
+                libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            except (OSError, AttributeError):
+                return False
+            cls._libc = libc
+        return True
+
+    def __init__(self, path: Path, callback: ChangeCallback) -> None:
+        """Raises OSError if the watch can't be created (e.g. the inotify watch limit was reached)."""
+        super().__init__(path, callback)
+        libc = self._libc
+        assert libc is not None, 'Check InotifyWatcher.available() first'
+        fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        if libc.inotify_add_watch(fd, os.fsencode(path), _WATCH_MASK) < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, os.strerror(err), str(path))
+        self._fd = fd
+
+    def _read_events(self, changed: set[str]) -> bool:
+        """Add the names in the pending events to `changed`.
+        Returns False if the directory itself is gone and watching should stop.
+        """
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return True
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset+length].rstrip(b'\0')
+            offset += length
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF | _IN_IGNORED):
+                return False
+            if mask & _IN_Q_OVERFLOW:
+                changed.add('')
+            elif name:
+                changed.add(os.fsdecode(name))
+        return True
+
+    def _run(self) -> None:
+        fd = self._fd
+        try:
+            while not self._stop.is_set():
+                #Wake up periodically to check if we've been stopped
+                ready, _, _ = select.select([fd], [], [], 0.5)
+                if not ready:
+                    continue
+                changed: set[str] = set()
+                alive = self._read_events(changed)
+                while alive and not self._stop.is_set() and select.select([fd], [], [], _SETTLE_DELAY)[0]:
+                    alive = self._read_events(changed)
+                if self._stop.is_set():
+                    break
+                if changed:
+                    #An empty name means the event queue overflowed
+                    self.callback(None if '' in changed else changed)
+                if not alive:
+                    log.debug(f'{self.path} was removed or moved, not watching it anymore')
+                    break
+        except OSError as e:
+            if e.errno != errno.EBADF:
+                log.debug(f'inotify error on {self.path}: {e}')
+        finally:
+            os.close(fd)
+
+
+def watch_directory(path: Path, callback: ChangeCallback) -> DirectoryWatcher:
+    """Start watching the directory. `callback` is called from a background thread."""
+    watcher: DirectoryWatcher
+    if InotifyWatcher.available():
+        try:
+            watcher = InotifyWatcher(path, callback)
+        except OSError as e:
+            log.debug(f'inotify unavailable for {path} ({e}), polling instead')
+            watcher = PollingWatcher(path, callback)
+    else:
+        watcher = PollingWatcher(path, callback)
+    watcher.start()
+    return watcher
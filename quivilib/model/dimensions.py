@@ -0,0 +1,76 @@
+import json
+import logging
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+
+from quivilib import meta
+from quivilib.model.container import Item
+
+log = logging.getLogger('dimensions')
+
+
+def _mtime(item: Item) -> float:
+    return item.last_modified.timestamp() if item.last_modified else 0.0
+
+
+class DimensionStore(object):
+    """Remembers the dimensions of images between sessions, so they don't need to be probed again.
+    Keyed by the full (possibly virtual) path of the image; an entry is only valid for the same
+    last modified time. Only the most recent DIMENSION_STORE_SIZE entries are kept.
+    """
+    def __init__(self, path: Path|None = None) -> None:
+        self.path = path
+        self._entries: OrderedDict[str, tuple[float, int, int]] = OrderedDict()
+        self._lock = Lock()
+        self._changed = False
+        if path is not None:
+            self.load()
+
+    def get(self, key: str, mtime: float) -> tuple[int, int]|None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != mtime:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1], entry[2]
+
+    def put(self, key: str, mtime: float, dimensions: tuple[int, int]) -> None:
+        with self._lock:
+            self._entries[key] = (mtime, dimensions[0], dimensions[1])
+            self._entries.move_to_end(key)
+            while len(self._entries) > meta.DIMENSION_STORE_SIZE:
+                self._entries.popitem(last=False)
+            self._changed = True
+
+    def get_item(self, item: Item) -> tuple[int, int]|None:
+        return self.get(str(item.full_path), _mtime(item))
+
+    def put_item(self, item: Item, dimensions: tuple[int, int]) -> None:
+        self.put(str(item.full_path), _mtime(item), dimensions)
+
+    def load(self) -> None:
+        assert self.path is not None
+        try:
+            with self.path.open('r', encoding='utf8') as f:
+                data = json.load(f)
+            with self._lock:
+                for key, (mtime, width, height) in data.items():
+                    self._entries[key] = (mtime, width, height)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError) as e:
+            #Only a cache; start over
+            log.debug(f'Could not load {self.path}: {e}')
+
+    def save(self) -> None:
+        if self.path is None or not self._changed:
+            return
+        with self._lock:
+            data = {key: list(entry) for key, entry in self._entries.items()}
+            self._changed = False
+        try:
+            with self.path.open('w', encoding='utf8') as f:
+                json.dump(data, f)
+        except OSError as e:
+            log.debug(f'Could not save {self.path}: {e}')
@@ -1,10 +1,14 @@
 import logging as log
 import traceback
 from pathlib import Path
+from typing import Any, Callable
 
 from quivilib import meta
 
-from quivilib.interface.imagehandler import ImageHandler, SecondaryImageHandler
+from quivilib.interface.imagehandler import ImageHandler, SecondaryImageHandler, Capability
+from quivilib.model.image.registry import FormatRegistry
+from quivilib.model.image.probe import SNIFF_SIZE
+from quivilib.model.image.tiled import TiledImage, needs_tiles
 
 IMG_CLASSES: list[type[SecondaryImageHandler]] = []
 IMG_LOAD_CLASSES: list[type[ImageHandler]] = []
@@ -14,27 +18,31 @@ if meta.USE_CAIRO:
     IMG_CLASSES.append(CairoImage)
 if meta.USE_PIL:
     from quivilib.model.image.pil import PilImage
+    from quivilib.model.image.preview import PreviewImage
     IMG_LOAD_CLASSES.append(PilImage)
 if meta.USE_FREEIMAGE:
     from quivilib.model.image.freeimage import FreeImage
     IMG_LOAD_CLASSES.append(FreeImage)
 
 
-supported_extensions = []
-def get_supported_extensions():
-    exts = []
-    if meta.USE_FREEIMAGE:
-        from pyfreeimage import library
-        exts += library.load().get_readable_extensions()
-    if meta.USE_PIL:
-        #PIL.Image.registered_extensions(). This is a curated list.
-        exts += ['.bmp', '.cur', '.dcx', '.fli', '.flc', '.fpx', '.gbr', '.gif', 
-                 '.ico', '.im', '.imt', '.jpg', '.jpeg', '.pcd', '.pcx', '.png', '.apng',
-                 #JPEG 2000. No JPEG XL support yet.
-                 '.j2c', '.j2k', '.jfif', '.jp2', '.jpc', '.jpe', '.jpf', '.jpx',
-                 '.ppm', '.pbm', '.pgm', '.sgi', '.tga', '.tif', '.tiff', '.xmb',
-                 '.webp', '.xpm']
-    return list(set(exts))
+_listed_extensions: dict[type[ImageHandler], list[str]] = {}
+if meta.USE_PIL:
+    #PIL.Image.registered_extensions(). This is a curated list.
+    _listed_extensions[PilImage] = ['.bmp', '.cur', '.dcx', '.fli', '.flc', '.fpx', '.gbr', '.gif', 
+             '.ico', '.im', '.imt', '.jpg', '.jpeg', '.pcd', '.pcx', '.png', '.apng',
+             #JPEG 2000. No JPEG XL support yet.
+             '.j2c', '.j2k', '.jfif', '.jp2', '.jpc', '.jpe', '.jpf', '.jpx',
+             '.ppm', '.pbm', '.pgm', '.sgi', '.tga', '.tif', '.tiff', '.xmb',
+             '.webp', '.xpm']
+
+#Shared by everything that needs to know whether/how an extension can be opened.
+registry = FormatRegistry(IMG_LOAD_CLASSES, _listed_extensions, meta.PREFERRED_DECODERS)
+
+def get_supported_extensions() -> list[str]:
+    return sorted(registry.extensions)
+
+def is_supported_extension(ext: str) -> bool:
+    return registry.is_supported(ext)
 
 supported_extensions = get_supported_extensions()
 
@@ -42,34 +50,23 @@ supported_extensions = get_supported_extensions()
 def open_base_image(f, path, delay=False):
     """Return a PIL/FreeImage image, without the additional logic provided by an ImageHandler
     Used for thumbnail generation and wallpaper - the extra baggage, including wx.Bitmap, is not needed."""
-    ext = path.suffix.casefold()
-    img = None
-    for cls in IMG_LOAD_CLASSES:
-        if not ext in cls.extensions():
-            log.debug(f"Skip {cls} - no support for {ext}")
-            continue
-        try:
-            img = cls.OpenImage(f, str(path), delay=delay)
-            break
-        except Exception:
-            if IMG_LOAD_CLASSES[-1] is cls:
-                raise
-            else:
-                log.debug(traceback.format_exc())
-    if img is not None:
-        return img
-    raise Exception(f"Could not open {path} (unsupported extension?)")
+    return _open_with_backends(f, path, lambda cls: cls.OpenImage(f, str(path), delay=delay))
 
-def open_img(f, path, delay=False) -> ImageHandler:
+def open_img(f, path, delay=False, fit: Callable[[int, int], float]|None = None,
+             reopen: Callable[[], Any]|None = None) -> ImageHandler:
     """ Open the provided filehandle/path as an image.
     Wraps the image in a Cairo object if USE_CAIRO is True
     (This would also use GDI on Windows, if GDI was still supported)
+    Very large images are shown in tiles instead (see TiledImage).
     """
     ext = path.suffix
-    img = open_direct(f, path, delay)
+    img = open_direct(f, path, delay, fit, reopen)
     if img.is_animated():
         #It may be possible to use cairo, but figure that out later.
         return img
+    if needs_tiles(img):
+        #Too large for a single bitmap or cairo surface
+        return TiledImage.CreateWrappedImage(src=img, delay=delay)
     for cls in IMG_CLASSES:
         try:
             img2 = cls.CreateWrappedImage(src=img, delay=delay)
@@ -79,24 +76,49 @@ def open_img(f, path, delay=False) -> ImageHandler:
             log.debug(traceback.format_exc())
     return img
 
-def open_direct(f, path: Path, delay=False) -> ImageHandler:
+def open_preview(f, path: Path, fit: Callable[[int, int], float]|None = None) -> ImageHandler|None:
+    """ A low resolution stand-in to show while the image is opened (see PreviewImage),
+    or None if it can't be made much faster than the image itself.
+    The file is rewound afterwards.
+    """
+    if not (meta.USE_PIL and meta.PROGRESSIVE_PREVIEW):
+        return None
+    if not meta.DECODE_REDUCED:
+        fit = None
+    return PreviewImage.CreatePreview(f, str(path), fit)
+
+def open_direct(f, path: Path, delay=False, fit: Callable[[int, int], float]|None = None,
+                reopen: Callable[[], Any]|None = None) -> ImageHandler:
     """ Open the provided filehandle/path as an image.
     PIL/Freeimage is used to open the image, depending on configuration.
+    fit gives the zoom the image will be shown at, from its full size (see Canvas.get_fit_function).
+    Backends that can will decode large images at a reduced size, and use reopen() to read the file
+    again if the full size is needed later.
     """
-    ext = path.suffix.casefold()
-    img = None
-    for cls in IMG_LOAD_CLASSES:
-        if not ext in cls.extensions():
-            log.debug(f"Skip {cls} - no support for {ext}")
-            continue
+    if not meta.DECODE_REDUCED:
+        fit = None
+    def create(cls: type[ImageHandler]) -> ImageHandler:
+        if fit is not None and cls.capabilities & Capability.DRAFT:
+            return cls.CreateImage(f, str(path), delay=delay, fit=fit, reopen=reopen)
+        return cls.CreateImage(f, str(path), delay=delay)
+    return _open_with_backends(f, path, create)
+
+def _open_with_backends(f, path: Path, open_fn: Callable[[type[ImageHandler]], Any]) -> Any:
+    """Call open_fn with each backend that can open the file until one succeeds.
+    The backends are picked from the first bytes of the file, so the preferred decoder is tried first
+    even if the extension is wrong. The next backend is only tried if the previous one failed to decode;
+    the file is rewound to where it was before each attempt.
+    """
+    start = f.tell()
+    head = f.read(SNIFF_SIZE)
+    f.seek(start)
+    backends = registry.backends_for_content(head, path.suffix)
+    for cls in backends:
         try:
-            img = cls.CreateImage(f, str(path), delay=delay)
-            break
+            return open_fn(cls)
         except Exception:
-            if IMG_LOAD_CLASSES[-1] is cls:
+            if backends[-1] is cls:
                 raise
-            else:
-                log.debug(traceback.format_exc())
-    if img is not None:
-        return img
+            log.debug(f'{cls.__name__} could not open {path}, trying the next backend', exc_info=True)
+            f.seek(start)
     raise Exception(f"Could not open {path} (unsupported extension?)")
@@ -13,9 +13,57 @@ except ImportError:
     cairo_stride_for_width = cairo.Format.stride_for_width
 import wx
 from quivilib.interface.imagehandler import *
+from quivilib.model.image import worker
 
 log = logging.getLogger('cairo')
 
+#Seconds without further zoom steps before the high quality zoomed surface is made
+RESIZE_DELAY = 0.2
+#Pixels around the view included in the zoomed in tile, so panning a bit doesn't need a new one
+TILE_MARGIN = 256
+
+
+def _contains(outer: tuple[int, int, int, int], inner: tuple[int, int, int, int]) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and outer[2] >= inner[2] and outer[3] >= inner[3]
+
+def _grow(rect: tuple[int, int, int, int], margin: int, width: int, height: int) -> tuple[int, int, int, int]:
+    left, top, right, bottom = rect
+    return (max(0, left - margin), max(0, top - margin), min(width, right + margin), min(height, bottom + margin))
+
+
+class _Tile(object):
+    """Part of the image scaled to width x height. left, top, right, bottom are in that scale."""
+    def __init__(self, surface: cairo.ImageSurface, width: int, height: int, rect: tuple[int, int, int, int]) -> None:
+        self.surface = surface
+        self.width = width
+        self.height = height
+        self.rect = rect
+        self.left, self.top = rect[0], rect[1]
+
+    @classmethod
+    def render(cls, src: cairo.ImageSurface, width: int, height: int, rect: tuple[int, int, int, int]) -> Self:
+        left, top, right, bottom = rect
+        surface = cairo.ImageSurface(src.get_format(), right - left, bottom - top)
+        pattern = cairo.SurfacePattern(src)
+        matrix = cairo.Matrix()
+        matrix.scale(src.get_width() / width, src.get_height() / height)
+        matrix.translate(left, top)
+        pattern.set_matrix(matrix)
+        pattern.set_filter(cairo.FILTER_BEST)
+        pattern.set_extend(cairo.EXTEND_PAD)
+        ctx = cairo.Context(surface)
+        ctx.set_operator(cairo.OPERATOR_SOURCE)
+        ctx.set_source(pattern)
+        ctx.paint()
+        surface.flush()
+        return cls(surface, width, height, rect)
+
+    def matches(self, width: int, height: int) -> bool:
+        return self.width == width and self.height == height
+
+    def contains(self, rect: tuple[int, int, int, int]) -> bool:
+        return _contains(self.rect, rect)
+
 
 class CairoImage(ImageHandlerBase, SecondaryImageHandler):
     @classmethod
@@ -31,8 +79,11 @@ class CairoImage(ImageHandlerBase, SecondaryImageHandler):
         self.img_path = src.img_path
         img = self.convert_to_cairo_surface(src.getImg())
         
-        self._original_width = self._width = img.get_width()
-        self._original_height = self._height = img.get_height()
+        #The surface may be smaller than the image (decoded at a reduced size); paint scales it.
+        self._width = img.get_width()
+        self._height = img.get_height()
+        self._original_width = src.base_width
+        self._original_height = src.base_height
         
         self.img = img
         #Set by the thread
@@ -41,7 +92,10 @@ class CairoImage(ImageHandlerBase, SecondaryImageHandler):
         self.delay = delay
         self.rotation = 0
         
-        self.timer: threading.Timer|None = None
+        #High quality copy of the part of the image around the view, when zoomed in
+        self._tile: _Tile|None = None
+        self._tile_pending: tuple[int, int, int, int]|None = None
+        
         #Used to determine if the current paint action is a pan or a zoom.
         #Pans need to be significantly faster, and thus require a lower quality filter.
         self._last_zoom = 1.0
@@ -62,65 +116,103 @@ class CairoImage(ImageHandlerBase, SecondaryImageHandler):
             return self._height
         return self._width
 
-    def convert_to_cairo_surface(self, img: BaseImageProt|ImageHandler):
-        """ Requests img data as bytes from the loaded image
-        Loads that data in as a cairo surface. Should work with either image loader.
+    def convert_to_cairo_surface(self, img: BaseImageProt):
+        """ Wraps the pixels of the loaded image in a cairo surface. They're only copied if they're read-only.
+        Should work with either image loader.
         """
-        srcImage = img
-        img_format = cairo.FORMAT_ARGB32
-        width, height = img.width, img.height
-        stride = cairo_stride_for_width(img_format, width)
-        #Make sure PIL and FreeImage both have this.
-        #TODO: I can't get other cairo formats to work. But if I could, this would need to report
-        #the format, e.g. to allow changing to RGB24. See https://afrantzis.com/pixel-format-guide/cairo.html
-        #or https://github.com/afrantzis/pixel-format-guide/blob/master/pfg/cairo.py
-        img = img.maybeConvert32bit()
-        #Make sure PIL and FreeImage both have this.
-        b = img.convert_to_raw_bits(width_bytes=stride)
-        surface = cairo.ImageSurface.create_for_data(b, img_format, width, height)
-        
-        if img is not srcImage:
-            del img
-        return surface
+        pixels = img.get_pixels(allow_gray=True)
+        #Opaque images only (the loaders flatten transparency), so RGB24 is enough and needs no alpha.
+        #Grayscale stays 1 byte per pixel; see paint.
+        img_format = cairo.FORMAT_A8 if pixels.is_gray else cairo.FORMAT_RGB24
+        assert pixels.stride >= cairo_stride_for_width(img_format, pixels.width)
+        data = pixels.data
+        if isinstance(data, bytes):
+            #create_for_data only takes writable buffers
+            data = bytearray(data)
+        #The surface keeps a reference to the buffer
+        return cairo.ImageSurface.create_for_data(data, img_format, pixels.width, pixels.height, pixels.stride)
     
     def delayed_load(self):
         #The actual delay load is unncessary, but the flag is needed to know if this is waiting for actual display or not.
         self.delay = False
 
     def _delayed_resize(self, width: int, height: int):
-        if self.zoomed_width == width or self._original_width == width:
+        """Make the zoomed surface in the current thread (the cache's)."""
+        if self.zoomed_width == width or self.img.get_width() == width:
             return
-        zoomed = self._resize_img(width, height)
-        if self._width == width and self._height == height:
-            #Make sure this isn't an out of order execution.
-            self.zoomed_bmp = zoomed
-            self.zoomed_width = width
-            log.debug(f"Cairo: Updated zoomed bitmap ({width}x{height})")
-            if self.img_change_cb:
-                self.img_change_cb(self)
+        self.zoomed_bmp = self._resize_img(width, height)
+        self.zoomed_width = width
+
+    def _apply_resize(self, width: int, height: int, zoomed: cairo.ImageSurface|None) -> None:
+        #Main thread. The worker drops results of replaced jobs, but check anyway.
+        if zoomed is None or self._width != width or self._height != height:
+            return
+        self.zoomed_bmp = zoomed
+        self.zoomed_width = width
+        log.debug(f"Cairo: Updated zoomed bitmap ({width}x{height})")
+        if self.img_change_cb:
+            self.img_change_cb(self)
 
     def _maybe_scale_image(self):
-        #Always clear out the timer and previous scaled image, if set.
+        #Always clear out the previous scaled image and any pending one.
         self.zoomed_bmp = None
         self.zoomed_width = None
-        if self.timer is not None:
-            self.timer.cancel()
-            self.timer = None
+        self._tile = None
+        self._tile_pending = None
         #TODO: Maybe add other checks. There are various situations where there's no point in making a resized image
-        if (self._width == self._original_width or self._height == self._original_height):
-            return
-        if (self._width > self._original_width):
+        if (self._width == self.img.get_width() or self._height == self.img.get_height()
+                or self._width > self.img.get_width()):
             #Don't resize if zooming in. Need to figure out an appropriate cutoff
             #In practice this is probably dependent on screen size.
+            worker.cancel(self)
+            return
+        width, height = self._width, self._height
+        resize_worker = worker.get_worker()
+        def make() -> cairo.ImageSurface|None:
+            resized = self.src.rescale(width, height)
+            if resize_worker.cancelled():
+                #Zoomed again meanwhile; skip the conversion
+                return None
+            return self.convert_to_cairo_surface(resized)
+        #Waits for the zoom to settle, so a burst of wheel steps makes one surface
+        resize_worker.submit(self, make, lambda zoomed: self._apply_resize(width, height, zoomed), delay=RESIZE_DELAY)
+
+    def close(self) -> None:
+        worker.cancel(self)
+        log.debug(f'Cairo: resize worker metrics {dict(worker.get_worker().metrics)}')
+        #Also drops a pending full size decode
+        self.src.close()
+        super().close()
+
+    def _load_full_resolution(self, width: int, height: int, wait: bool = True) -> None:
+        """Replace the surface if zooming past the size the image was decoded at.
+        Unless wait, the full size is decoded in the background and the current surface is scaled up meanwhile.
+        """
+        if width <= self.img.get_width() and height <= self.img.get_height():
             return
-        self.timer = threading.Timer(0.2, self._delayed_resize, args=[self._width, self._height])
-        self.timer.start()
+        if wait:
+            if self.src.load_full_resolution():
+                self._full_loaded(repaint=False)
+        else:
+            self.src.load_full_resolution_async(self._full_loaded)
+
+    def _full_loaded(self, repaint: bool = True) -> None:
+        self.img = self.convert_to_cairo_surface(self.src.getImg())
+        self.zoomed_bmp = None
+        self.zoomed_width = None
+        self._tile = None
+        self._tile_pending = None
+        if repaint:
+            self.resize(self._width, self._height)
+            if self.img_change_cb:
+                self.img_change_cb(self)
 
     def resize(self, width: int, height: int) -> None:
         #The actual resizing will be done on-demand by a matrix transformation.
+        self._load_full_resolution(width, height, wait=self.delay)
         self._width = width
         self._height = height
-        #0.2 seconds after this is called, create a real resized image.
+        #RESIZE_DELAY seconds after the last call, create a real resized image in the resize worker.
         #Scaling via matrix is super quick. Panning a scaled image is not, unless low quality filter is used.
         #This is intended as a compromise - do the initial scale quickly, in a background thread, create a higher-quality scaled image
         #This should avoid both the stuttering from rapid resizing and from panning a scaled image.
@@ -146,19 +238,83 @@ class CairoImage(ImageHandlerBase, SecondaryImageHandler):
         #Do nothing - changing self.rotation is enough
         pass
 
+    def _add_rotation(self, matrix: cairo.Matrix) -> None:
+        """Make matrix map display coordinates to those of the unrotated (zoomed) image first."""
+        if self.rotation != 0:
+            matrix.translate(self._width / 2, self._height / 2)
+            matrix.rotate((0, 3.0 * math.pi / 2.0, math.pi, math.pi / 2.0)[self.rotation])
+            if self.rotation in (0, 2):
+                matrix.translate(-self._width / 2, -self._height / 2)
+            else:
+                matrix.translate(-self._height / 2, -self._width / 2)
+
+    def _visible_rect(self, view_width: int, view_height: int, x: int, y: int) -> tuple[int, int, int, int]:
+        """The part of the unrotated zoomed image that is in view, as (left, top, right, bottom)."""
+        matrix = cairo.Matrix()
+        self._add_rotation(matrix)
+        corners = [matrix.transform_point(px - x, py - y) for px in (0, view_width) for py in (0, view_height)]
+        xs = [cx for cx, _ in corners]
+        ys = [cy for _, cy in corners]
+        return (max(0, math.floor(min(xs))), max(0, math.floor(min(ys))),
+                min(self._width, math.ceil(max(xs))), min(self._height, math.ceil(max(ys))))
+
+    def _get_tile(self, dc: wx.DC, x: int, y: int) -> _Tile|None:
+        """When zoomed in: the high quality tile to paint, if it covers the view. Asks for a new one
+        when the view gets near (or past) its edges."""
+        view_width, view_height = dc.GetSize()
+        visible = self._visible_rect(view_width, view_height, x, y)
+        if visible[0] >= visible[2] or visible[1] >= visible[3]:
+            return None
+        tile = self._tile
+        if tile is not None and not tile.matches(self._width, self._height):
+            tile = self._tile = None
+        near = _grow(visible, TILE_MARGIN // 2, self._width, self._height)
+        covered = tile is not None and tile.contains(visible)
+        if not (covered and tile.contains(near)):
+            pending = self._tile_pending
+            if pending is None or not _contains(pending, near):
+                self._request_tile(_grow(visible, TILE_MARGIN, self._width, self._height))
+        return tile if covered else None
+
+    def _request_tile(self, rect: tuple[int, int, int, int]) -> None:
+        src = self.img
+        width, height = self._width, self._height
+        self._tile_pending = rect
+        def make() -> _Tile:
+            return _Tile.render(src, width, height, rect)
+        def apply(tile: _Tile) -> None:
+            if not tile.matches(self._width, self._height):
+                return
+            self._tile = tile
+            self._tile_pending = None
+            if self.img_change_cb:
+                self.img_change_cb(self)
+        worker.get_worker().submit(self, make, apply)
+
     def paint(self, dc: wx.DC, x: int, y: int) -> None:
-        img = self.zoomed_bmp if self.zoomed_bmp else self.img
+        tile = None
+        if self.zoomed_bmp is None and self._width > self.img.get_width():
+            #Zoomed in. Scaling every paint is slow, so pans would have to use a low quality filter.
+            tile = self._get_tile(dc, x, y)
+        img = self.zoomed_bmp if self.zoomed_bmp else tile.surface if tile else self.img
+        if __debug__:
+            #How often the high quality surface is there in time
+            if self.zoomed_bmp is not None:
+                worker.get_worker().record('paint_zoomed')
+            elif worker.get_worker().is_busy(self):
+                worker.get_worker().record('paint_waiting')
         ctx = wxcairo.ContextFromDC(dc)
         imgpat = cairo.SurfacePattern(img)
         
-        wscale = self._original_width  / self._width 
-        hscale = self._original_height / self._height
+        #Display size -> surface size
+        wscale = self.img.get_width() / self._width
+        hscale = self.img.get_height() / self._height
 
         #Set quality for the scale. There are a few tricks that can be done with this.
         if (self._last_zoom != wscale or self._last_rot != self.rotation):
             #This is a zoom change - panning needs to be fast, but scaling doesn't.
             quality = cairo.FILTER_GOOD
-        elif self._width > self._original_width:
+        elif self._width > self.img.get_width():
             #Zooming in on a large image is faster than zooming out
             #This is kinda annoying, because the artifacts are a lot worse when zooming out.
             quality = cairo.FILTER_GOOD
@@ -171,31 +327,52 @@ class CairoImage(ImageHandlerBase, SecondaryImageHandler):
         #BEST - The highest-quality available, performance may not be suitable for interactive use.
 
         matrix = cairo.Matrix()
-        if img == self.img:
+        if tile is not None:
+            #Already at the display size; just a blit
+            matrix.translate(-tile.left, -tile.top)
+        elif img == self.img:
             matrix.scale(wscale, hscale)
             #I believe this has no effect if the scale isn't done. Rotation is always 90 degrees, which I assume is optimized.
             imgpat.set_filter(quality)
 
-        if self.rotation != 0:
-            matrix.translate(self._width / 2, self._height / 2)
-            matrix.rotate((0, 3.0 * math.pi / 2.0, math.pi, math.pi / 2.0)[self.rotation])
-            if self.rotation in (0, 2):
-                matrix.translate(-self._width / 2, -self._height / 2)
-            else:
-                matrix.translate(-self._height / 2, -self._width / 2)
-
+        self._add_rotation(matrix)
         imgpat.set_matrix(matrix)
         ctx_matrix = cairo.Matrix()
         ctx_matrix.translate(x, y)
         ctx.set_matrix(ctx_matrix)
         
-        ctx.set_source(imgpat)
-        ctx.paint()
+        if img.get_format() == cairo.FORMAT_A8:
+            #Grayscale: paint white over black using the pixels as coverage, so they're never expanded.
+            #PAD keeps the edges from fading into the black; the clip keeps the white inside the image.
+            imgpat.set_extend(cairo.EXTEND_PAD)
+            ctx.rectangle(0, 0, self.width, self.height)
+            ctx.clip()
+            ctx.set_source_rgb(0, 0, 0)
+            ctx.paint()
+            ctx.set_source_rgb(1, 1, 1)
+            ctx.mask(imgpat)
+        else:
+            ctx.set_source(imgpat)
+            ctx.paint()
     
     def copy_to_clipboard(self) -> None:
-        bmp = wxcairo.BitmapFromImageSurface(self.img)
+        self._load_full_resolution(self._original_width, self._original_height)
+        if self.img.get_format() == cairo.FORMAT_A8:
+            #wxcairo only converts color surfaces
+            bmp = self.src.getImg().get_pixels().to_wx_bitmap()
+        else:
+            bmp = wxcairo.BitmapFromImageSurface(self.img)
         self.do_copy_to_clipboard(bmp)
 
+    @property
+    def memory_size(self) -> int:
+        size = self.img.get_stride() * self.img.get_height() + self.src.memory_size
+        if self.zoomed_bmp is not None:
+            size += self.zoomed_bmp.get_stride() * self.zoomed_bmp.get_height()
+        if self._tile is not None:
+            size += self._tile.surface.get_stride() * self._tile.surface.get_height()
+        return size
+
     def create_thumbnail(self, width: int, height: int, delay: bool = False) -> wx.Bitmap|Callable[[],wx.Bitmap]:
         return self.src.create_thumbnail(width, height, delay)
 
@@ -0,0 +1,80 @@
+"""Conversion of pixels with more than 8 bits per channel (16 bit gray and RGB, 32 bit int, float)
+to the 8 bits used for display. 16 bit values are scaled by 255/65535 and rounded, so nothing is
+truncated or clipped.
+
+NumPy is used when it's installed (PIL is faster by itself for little endian 16 bit). Without it,
+PIL images are still converted in C by PIL itself; FreeImage falls back to its own conversions,
+which drop the low byte instead of rounding.
+Everything here is called while decoding, i.e. in the cache thread.
+"""
+import ctypes
+import logging
+
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+log = logging.getLogger('depth')
+
+#Modes PIL uses for 16 bit grayscale. Plain 'I' (32 bit) is also assumed to hold 16 bit values,
+#which is how PIL loads some 16 bit formats.
+GRAY16_MODES = ('I;16', 'I;16L', 'I;16B', 'I;16N')
+_SCALE_16 = 255 / 65535
+
+_table = None
+def _gray16_table():
+    """The 8 bit value of every 16 bit value, as a NumPy array."""
+    global _table
+    if _table is None:
+        _table = ((numpy.arange(65536, dtype=numpy.uint32) + 128) // 257).astype(numpy.uint8)
+    return _table
+
+
+def is_high_depth(img: Image.Image) -> bool:
+    return img.mode[0] in ('I', 'F')
+
+def to_8_bits(img: Image.Image) -> Image.Image:
+    """A high bit depth PIL image as 8 bit grayscale ('L'). Other images are returned unchanged."""
+    mode = img.mode
+    if mode == 'I;16':
+        #PIL resolves the lambda to a scale and offset and applies them in C. The result is still 16 bit.
+        return img.point(lambda x: x * _SCALE_16 + 0.5).convert('L')
+    if mode == 'F':
+        #No fixed range; stretch whatever range is used
+        lo, hi = img.getextrema()
+        if hi <= lo:
+            return img.convert('L')
+        scale = 255 / (hi - lo)
+        return img.point(lambda x: (x - lo) * scale + 0.5).convert('L')
+    if mode in GRAY16_MODES or mode == 'I':
+        if numpy is not None:
+            values = numpy.asarray(img)
+            if mode == 'I':
+                values = values.clip(0, 65535)
+            return Image.fromarray(gray16_to_8(values))
+        if mode != 'I':
+            img = img.convert('I')
+        #Converting to L clips anything outside 0-255
+        return img.point(lambda x: x * _SCALE_16 + 0.5).convert('L')
+    return img
+
+def gray16_to_8(values: 'numpy.ndarray') -> 'numpy.ndarray':
+    """Array of 16 bit values (any byte order) to an uint8 array of the same shape."""
+    return _gray16_table()[values]
+
+def rgb16_to_bgrx(values: 'numpy.ndarray', out: 'numpy.ndarray') -> None:
+    """(height, width, 3 or 4) array of 16 bit R G B (A) values into an uint8 (height, width, 4)
+    array in B G R X order (see PixelBuffer). Alpha is dropped."""
+    table = _gray16_table()
+    for dst, src in ((0, 2), (1, 1), (2, 0)):
+        out[..., dst] = table[values[..., src]]
+    out[..., 3] = 255
+
+def rows_of(address: int, pitch: int, height: int, row_bytes: int) -> 'numpy.ndarray':
+    """Writable (height, row_bytes) uint8 view of rows that are pitch bytes apart in memory
+    (e.g. a FreeImage bitmap), without the padding at the end of each row."""
+    buf = (ctypes.c_char * (pitch * height)).from_address(address)
+    return numpy.frombuffer(buf, numpy.uint8).reshape(height, pitch)[:, :row_bytes]
@@ -0,0 +1,59 @@
+"""Frames of an animation, decoded shortly before they're shown instead of all up front."""
+import logging
+from collections.abc import Callable
+from threading import Lock
+from typing import Generic, TypeVar
+
+log = logging.getLogger('frames')
+
+T = TypeVar('T')
+
+
+class FrameBuffer(Generic[T]):
+    """Holds the frames from the one being shown to `ahead` frames past it, wrapping around at the end.
+    Frames are decoded in play order by decode_ahead and dropped once they've been shown.
+    Frame 0 is decoded up front and kept by the handler, so it's never buffered.
+    get may be called from any thread; decode_ahead only from one (the animation's).
+    """
+    def __init__(self, count: int, decode: Callable[[int], T], ahead: int) -> None:
+        """decode: returns frame i. Called with increasing i, except after the last frame."""
+        self._count = count
+        self._decode = decode
+        self._ahead = min(ahead, count - 1)
+        self._frames: dict[int, T] = {}
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, index: int) -> T|None:
+        """Frame index, or None if it hasn't been decoded (yet)."""
+        with self._lock:
+            return self._frames.get(index)
+
+    def _window(self, position: int) -> list[int]:
+        indexes = ((position + i) % self._count for i in range(self._ahead + 1))
+        return [i for i in indexes if i != 0]
+
+    def decode_ahead(self, position: int) -> int:
+        """Drop the frames before position and decode the missing ones up to `ahead` past it.
+        Returns the number of frames decoded."""
+        window = self._window(position)
+        with self._lock:
+            for i in [i for i in self._frames if i not in window]:
+                del self._frames[i]
+            missing = [i for i in window if i not in self._frames]
+        for i in missing:
+            frame = self._decode(i)
+            with self._lock:
+                self._frames[i] = frame
+        return len(missing)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._frames.clear()
+
+    @property
+    def capacity(self) -> int:
+        """The most frames held at once."""
+        return min(self._ahead + 1, self._count - 1)
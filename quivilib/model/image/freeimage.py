@@ -7,6 +7,8 @@ import pyfreeimage as fi
 from pyfreeimage import Image
 from quivilib.i18n import _
 from quivilib.interface.imagehandler import ImageHandlerBase, BaseImageProt
+from quivilib.model.image import depth, worker
+from quivilib.model.image.pyramid import Pyramid
 from quivilib.util import add_exception_custom_msg
 
 from typing import IO, Self
@@ -14,12 +16,45 @@ from typing import IO, Self
 log = logging.getLogger('freeimage')
 
 
+def _halve(img: Image) -> Image:
+    #Box is an average of each 2x2 block here
+    return img.rescale(max(img.width // 2, 1), max(img.height // 2, 1), fi.FILTER_BOX)
+
+def _to_8_bits(img: Image) -> Image:
+    """Images with more than 8 bits per channel as standard 8 bit gray or 32 bit bitmaps (see depth)."""
+    image_type = img.image_type
+    if image_type not in (fi.FIT_UINT16, fi.FIT_RGB16, fi.FIT_RGBA16):
+        #Floats, 32 bit ints etc: stretched over the range used
+        return img.convert_to_standard_type(True)
+    if depth.numpy is None:
+        #FreeImage drops the low byte instead of rounding
+        if image_type == fi.FIT_UINT16:
+            return img.convert_to_8_bits()
+        return img.convert_to_32_bits()
+    width, height = img.width, img.height
+    channels = 1 if image_type == fi.FIT_UINT16 else 3 if image_type == fi.FIT_RGB16 else 4
+    #Both bitmaps are bottom-up, so the rows line up
+    src = depth.rows_of(img.address, img.pitch, height, width * channels * 2).view(depth.numpy.uint16)
+    if channels == 1:
+        #8 bit bitmaps are allocated with a grayscale palette
+        out = Image.allocate(width, height, 8)
+        dst = depth.rows_of(out.address, out.pitch, height, width)
+        dst[...] = depth.gray16_to_8(src)
+    else:
+        out = Image.allocate(width, height, 32)
+        dst = depth.rows_of(out.address, out.pitch, height, width * 4)
+        depth.rgb16_to_bgrx(src.reshape(height, width, channels), dst.reshape(height, width, 4))
+    return out
+
+
 class FreeImage(ImageHandlerBase):
     @classmethod
     def OpenImage(cls, f: IO[bytes], path: str, delay=False) -> Image:
         try:
             fi.library.load().reset_last_error()
             img = Image.load_from_file(f, path)
+            if img.image_type != fi.FIT_BITMAP:
+                img = _to_8_bits(img)
 
             try:
                 if img.transparent:
@@ -29,7 +64,9 @@ class FreeImage(ImageHandlerBase):
             if sys.platform == 'win32':
                 if img.bpp != 24:
                     img = img.convert_to_24_bits()
-            else:
+            elif img.bpp not in (24, 32) and not img.is_grayscale:
+                #24 bit images are expanded while being copied for display (see get_pixels)
+                #and grayscale is kept at 1 byte per pixel
                 img = img.convert_to_32_bits()
             return img
         except Exception as e:
@@ -65,6 +102,30 @@ class FreeImage(ImageHandlerBase):
     def getImg(self) -> BaseImageProt:
         return self.img
 
+    @property
+    def img(self) -> Image:
+        return self._img
+    @img.setter
+    def img(self, img: Image) -> None:
+        self._img = img
+        #Zooms are made from the nearest reduced copy; made when first needed
+        self._pyramid = Pyramid(img, _halve, lambda im: (im.width, im.height), lambda im: im.pitch * im.height)
+
+    @property
+    def memory_size(self) -> int:
+        size = self.img.pitch * self.img.height + self._pyramid.memory_size
+        if self.zoomed_bmp is not None:
+            zoomed = self.zoomed_bmp
+            if isinstance(zoomed, wx.Bitmap):
+                size += zoomed.GetWidth() * zoomed.GetHeight() * 4
+            else:
+                size += zoomed.pitch * zoomed.height
+        #No wx copy on Windows; the DIB is painted directly
+        bmp = getattr(self, 'bmp', None)
+        if bmp is not None:
+            size += bmp.GetWidth() * bmp.GetHeight() * 4
+        return size
+
     def get_display_bmp(self):
         return self.zoomed_bmp if self.zoomed_bmp else self.bmp
 
@@ -84,24 +145,43 @@ class FreeImage(ImageHandlerBase):
     def rescale(self, width, height) -> Self:
         #TODO: Make sure this isn't called multiple times with the same dimensions.
         #I don't want to actually store this in zoomed_bmp, but something similar is fine.
-        return self.img.rescale(width, height, fi.FILTER_BICUBIC)
+        return self._pyramid.source_for(width, height).rescale(width, height, fi.FILTER_BICUBIC)
 
     def resize(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
         if self.base_width == width and self.base_height == height:
             self.zoomed_bmp = None
+            worker.cancel(self)
+        elif self.delay:
+            #Still in the cache thread; nothing is waiting for it. Converted to a wx.Bitmap by delayed_load.
+            self.zoomed_bmp = self.rescale(width, height)
         else:
-            img = self.img.rescale(width, height, fi.FILTER_BICUBIC)
-            if sys.platform != 'win32':
-                if self.delay:
+            #Show a quick box filtered copy now and swap in the bicubic one when it's ready.
+            #Missing reduced copies are made by the worker, not here.
+            pyramid = self._pyramid
+            preview = pyramid.source_for(width, height, build=False).rescale(width, height, fi.FILTER_BOX)
+            def rescale():
+                return pyramid.source_for(width, height).rescale(width, height, fi.FILTER_BICUBIC)
+            if sys.platform == 'win32':
+                self.zoomed_bmp = preview
+                def make():
+                    return rescale()
+                def apply(img) -> None:
                     self.zoomed_bmp = img
-                else:
-                    self.zoomed_bmp = img.convert_to_wx_bitmap(wx)
             else:
-                self.zoomed_bmp = img
-        self.width = width
-        self.height = height
+                self.zoomed_bmp = preview.convert_to_wx_bitmap(wx)
+                def make():
+                    return rescale().get_pixels()
+                def apply(pixels) -> None:
+                    self.zoomed_bmp = pixels.to_wx_bitmap()
+            worker.zoom_in_background(self, width, height, make, apply)
+
+    def close(self) -> None:
+        worker.cancel(self)
 
     def _do_rotate(self, clockwise: int) -> None:
+        worker.cancel(self)
         self.img = self.img.rotate(90 if clockwise else 270)
         if self.zoomed_bmp:
             if self.rotation in (1, 3):
@@ -146,7 +226,8 @@ class FreeImage(ImageHandlerBase):
 
     def create_thumbnail(self, width: int, height: int, delay: bool = False) -> wx.Bitmap|Callable[[],wx.Bitmap]:
         (width, height) = self.get_thumbnail_size(width, height)
-        img = self.img.rescale(width, height, fi.FILTER_BILINEAR)
+        #Reuses a reduced copy if there is one
+        img = self._pyramid.source_for(width, height, build=False).rescale(width, height, fi.FILTER_BILINEAR)
         if delay:
             def delayed_fn(_img=img, _wx=wx) -> wx.Bitmap:
                 return _img.convert_to_wx_bitmap(_wx)
@@ -159,6 +240,7 @@ class FreeImage(ImageHandlerBase):
     def _get_extensions() -> list[str]:
         return [x.casefold() for x in fi.library.load().get_readable_extensions()]
     ext_list = _get_extensions()
+    backend_name = 'freeimage'
     
     @staticmethod
     def extensions():
@@ -1,3 +1,4 @@
+import io
 import logging
 from collections.abc import Callable
 from typing import Any, IO, Self, List
@@ -5,12 +6,44 @@ from typing import Any, IO, Self, List
 import wx
 from PIL import Image
 
-from quivilib.interface.imagehandler import ImageHandlerBase, AnimatedImage, BaseImageProt
+from quivilib import meta
+from quivilib.interface.imagehandler import ImageHandlerBase, AnimatedImage, BaseImageProt, Capability, PixelBuffer, FRAME_DEBUG
+from quivilib.model.image import depth, worker
+from quivilib.model.image.frames import FrameBuffer
+from quivilib.model.image.pyramid import Pyramid
 
 log: logging.Logger = logging.getLogger('pil')
 #PIL has its own logging that's typically not relevant.
 logging.getLogger("PIL").setLevel(logging.ERROR)
 
+#Largest reduction used when decoding at a reduced size. JPEG can't scale by more during decode.
+MAX_REDUCTION = 8
+
+
+def _to_pixels(img: Image.Image, allow_gray=False) -> PixelBuffer:
+    if img.mode == 'L' and allow_gray:
+        stride = (img.width + 3) & ~3
+        return PixelBuffer(img.width, img.height, img.tobytes('raw', 'L', stride), stride, PixelBuffer.GRAY)
+    if img.mode != 'RGB':
+        #Grayscale is only expanded here, when it's about to be drawn
+        img = img.convert('RGB')
+    #Swaps the channels and pads in one pass
+    return PixelBuffer(img.width, img.height, img.tobytes('raw', 'BGRX'))
+
+def _memory_size(img: Image.Image|wx.Bitmap|PixelBuffer|None) -> int:
+    if img is None:
+        return 0
+    if isinstance(img, PixelBuffer):
+        return img.stride * img.height
+    if isinstance(img, Image.Image):
+        #PIL stores everything but 8 bit images with 4 bytes per pixel
+        return img.width * img.height * (1 if img.mode in ('L', 'P', '1') else 4)
+    return img.GetWidth() * img.GetHeight() * 4
+
+def _is_gray_palette(img: Image.Image) -> bool:
+    palette = img.getpalette() or []
+    return all(palette[i] == palette[i+1] == palette[i+2] for i in range(0, len(palette) - 2, 3))
+
 
 class PilWrapper(BaseImageProt):
     """ Wrapper class; used to store image data.
@@ -43,9 +76,6 @@ class PilWrapper(BaseImageProt):
     def __getattr__(self, name):
         return getattr(self.img, name)
         
-    def getData(self) -> tuple[int, int, bytes]:
-        b = self.img.tobytes()
-        return (self.width, self.height, b)
     def maybeConvert32bit(self) -> Self:
         if self.img.mode != 'RGB':
             return PilWrapper(self.img.convert('RGB'))
@@ -60,11 +90,17 @@ class PilWrapper(BaseImageProt):
         if im is not self.img:
             del im
         return arr
+    def get_pixels(self, allow_gray=False) -> PixelBuffer:
+        return _to_pixels(self.img, allow_gray)
     #Image operations; this needs to have the same interface as FI.
     def rescale(self, width: int, height: int) -> Self:
         #I think this needs to return self if the width/height are the same.
         img = self.img.resize((width, height), Image.Resampling.BICUBIC)
         return PilWrapper(img)
+    def rescale_region(self, box: tuple[float, float, float, float], width: int, height: int) -> Self:
+        #No crop copy; edge pixels are filtered using their neighbours outside the box, so tiles line up
+        img = self.img.resize((width, height), Image.Resampling.BICUBIC, box=box)
+        return PilWrapper(img)
     def transpose(self, method: Image.Transpose) -> Self:
         img = self.img.transpose(method)
         return PilWrapper(img)
@@ -95,23 +131,28 @@ class PilWrapper(BaseImageProt):
             del self.img
 
 class PilImage(ImageHandlerBase):
-    # Used to convert 16-bit int precision images to 8-bit.
-    # PIL's behavior is to truncate, which is not useful.
-    # Remove this if that ever changes. It's been reported, and it sounds like they
-    # stopped truncating, but it's still doing it.
-    @staticmethod
-    def lookup(x):
-        return x / 256
-
     @staticmethod
     def _to_32(img: Image.Image):
         """Does the conversion steps to ensure img is 32 bit RGB. May return the input."""
-        if img.mode[0] == 'I':  # 16-bit precision
-            img = img.point(PilImage.lookup, 'RGB')
-        elif img.mode != 'RGB':
+        if depth.is_high_depth(img):
+            #PIL's own conversion clips instead of scaling
+            img = depth.to_8_bits(img)
+        if img.mode != 'RGB':
             img = img.convert('RGB')
         return img
 
+    @staticmethod
+    def _to_display_mode(img: Image.Image):
+        """Like _to_32, but grayscale images are kept (or made) 8 bit, a quarter of the memory.
+        They're only expanded to RGB when drawn. May return the input."""
+        if depth.is_high_depth(img):
+            img = depth.to_8_bits(img)
+        elif img.mode in ('1', 'LA') or (img.mode == 'P' and _is_gray_palette(img)):
+            img = img.convert('L')
+        elif img.mode != 'L':
+            img = PilImage._to_32(img)
+        return img
+
     @classmethod
     def OpenImage(cls, f: IO[bytes], path: str, delay=False, convert_to_32=True) -> Image.Image:
         img = Image.open(f)
@@ -119,78 +160,252 @@ class PilImage(ImageHandlerBase):
         if convert_to_32:
             img = PilImage._to_32(img)
         return img
+    @staticmethod
+    def _get_reduction(size: tuple[int, int], fit: Callable[[int, int], float]) -> int:
+        """Largest power of two the image can be shrunk by and still be at least as large as it'll be shown."""
+        zoom = fit(*size)
+        scale = 1
+        if zoom <= 0:
+            #The view has no size yet
+            return scale
+        while scale < MAX_REDUCTION and zoom * scale * 2 <= 1:
+            scale *= 2
+        return scale
+
     @classmethod
-    def CreateImage(cls, f:IO[bytes], path:str, delay=False) -> Self:
+    def CreateImage(cls, f:IO[bytes], path:str, delay=False, fit: Callable[[int, int], float]|None = None,
+                    reopen: Callable[[], IO[bytes]]|None = None) -> Self:
+        """fit: gives the zoom the image will be shown at, from its full size. If given, the image is
+        decoded at the smallest size that's still large enough, and the full size is decoded later if needed.
+        reopen: opens the file again for that. Without it, the file contents are kept instead.
+        """
+        start = f.tell()
         img = cls.OpenImage(f, path, delay, convert_to_32=False)
         #get_attr is mandatory because is_animated is only defined for plugins that support animation.
         animated = getattr(img, "is_animated", False)
         if (animated):
-            return AnimatedPilImage(img, path, delay)
+            f.seek(start)
+            source = f.read()
+            return AnimatedPilImage(Image.open(io.BytesIO(source)), path, delay, source)
 
-        img = PilImage._to_32(img)
-        return PilImage(img, path, delay=delay)
-    def __init__(self, img: Image.Image, path: str, delay=False) -> None:
+        full_size = img.size
+        scale = 1 if fit is None else PilImage._get_reduction(full_size, fit)
+        #Jpeg2KImageFile.reduce returns the level instead of the method once it's set
+        reduce_shadowed = False
+        if scale > 1:
+            #Only possible before loading
+            if img.format == 'JPEG':
+                img.draft(None, (full_size[0] // scale, full_size[1] // scale))
+            elif img.format == 'JPEG2000':
+                img.reduce = scale.bit_length() - 1
+                reduce_shadowed = True
+        img = PilImage._to_display_mode(img)
+        source = None
+        if scale > 1:
+            img.load()
+            if reduce_shadowed and not callable(img.reduce):
+                #A plain Image, so reduce() works again (e.g. for the pyramid)
+                img = img.copy()
+            if img.size == full_size:
+                #The decoder can't do it, but a smaller image is still faster to zoom and paint
+                img = img.reduce(scale)
+            if reopen is None:
+                f.seek(start)
+                source = f.read()
+            log.debug(f'Decoded {path} at {img.size}, full size is {full_size}')
+        else:
+            reopen = None
+        return PilImage(img, path, delay=delay, full_size=full_size, source=source, reopen=reopen)
+    def __init__(self, img: Image.Image, path: str, delay=False, full_size: tuple[int, int]|None = None,
+                 source: bytes|None = None, reopen: Callable[[], IO[bytes]]|None = None) -> None:
+        """full_size and source or reopen are given if img was decoded at a reduced size.
+        base_width/base_height are always the full size.
+        """
         self.delay = delay
         self.img_path = path
 
-        self.bmp: wx.Bitmap = self._img_to_bmp(img)
+        #Made on first use; not needed at all if the image is painted by cairo
+        self._bmp: wx.Bitmap|None = None
         
-        self._original_width = self.width = img.size[0]
-        self._original_height = self.height = img.size[1]
+        self.width, self.height = img.size
+        self._original_width, self._original_height = full_size or img.size
+        #File contents (or how to read them again), to decode the full size on demand
+        self._source = source
+        self._reopen = reopen
+        #Owner of the full size decode in the worker, which is separate from the zoom jobs
+        self._full_job = object()
         
         self.img = PilWrapper(img)
         self.zoomed_bmp: wx.Bitmap|None = None
-        self.delayed_bmp: tuple[int, int, bytes]|None = None
+        self.delayed_bmp: PixelBuffer|None = None
         self.rotation = 0
 
     def getImg(self) -> BaseImageProt:
         return self.img
 
+    @property
+    def img(self) -> PilWrapper:
+        return self._img
+    @img.setter
+    def img(self, img: PilWrapper) -> None:
+        self._img = img
+        #Zooms are made from the nearest reduced copy; made when first needed
+        self._pyramid = Pyramid(img.img, lambda im: im.reduce(2), lambda im: im.size, _memory_size)
+
+    @property
+    def bmp(self) -> wx.Bitmap:
+        #wx.Bitmap must be created in the main thread
+        if self._bmp is None:
+            self._bmp = self.img.get_pixels().to_wx_bitmap()
+        return self._bmp
+    @bmp.setter
+    def bmp(self, bmp: wx.Bitmap) -> None:
+        self._bmp = bmp
+
     def get_display_bmp(self):
         return self.zoomed_bmp if self.zoomed_bmp else self.bmp
 
     def copy(self) -> Self:
-        return PilImage(self.img.img, self.img_path)
+        #The source is always unrotated
+        if self.rotation == 0:
+            source, reopen = self._source, self._reopen
+        else:
+            source, reopen = None, None
+        return PilImage(self.img.img, self.img_path, full_size=(self.base_width, self.base_height),
+                        source=source, reopen=reopen)
+
+    @property
+    def memory_size(self) -> int:
+        size = _memory_size(self.img.img) + _memory_size(self._bmp) + _memory_size(self.zoomed_bmp)
+        size += self._pyramid.memory_size
+        return size + _memory_size(self.delayed_bmp) + len(self._source or b'')
+
+    def _decode_full(self, source: bytes|None, reopen: Callable[[], IO[bytes]]|None,
+                     rotation: int) -> Image.Image|None:
+        """Thread safe. None if the file can't be read anymore (e.g. the archive was closed)."""
+        try:
+            if source is not None:
+                data = source
+            else:
+                assert reopen is not None
+                f = reopen()
+                try:
+                    data = f.read()
+                finally:
+                    f.close()
+            img = PilImage._to_display_mode(Image.open(io.BytesIO(data)))
+            for _ in range(rotation):
+                img = img.transpose(Image.Transpose.ROTATE_90)
+        except Exception:
+            log.debug(f'Could not decode {self.img_path} at full size', exc_info=True)
+            return None
+        log.debug(f'Decoded {self.img_path} at full size')
+        return img
+
+    def _set_full(self, img: Image.Image|None) -> bool:
+        #Not tried again if it failed
+        self._source = None
+        self._reopen = None
+        if img is None:
+            return False
+        self.img = PilWrapper(img)
+        self._bmp = None
+        self.zoomed_bmp = None
+        self.delayed_bmp = None
+        return True
+
+    def load_full_resolution(self) -> bool:
+        if self._source is None and self._reopen is None:
+            return False
+        worker.cancel(self._full_job)
+        return self._set_full(self._decode_full(self._source, self._reopen, self.rotation))
+
+    def load_full_resolution_async(self, on_loaded: Callable[[], None]) -> bool:
+        if self._source is None and self._reopen is None:
+            return False
+        resize_worker = worker.get_worker()
+        if resize_worker.is_busy(self._full_job):
+            return True
+        source, reopen, rotation = self._source, self._reopen, self.rotation
+        def done(img: Image.Image|None) -> None:
+            #Rotating cancels the job, but the full size may have been decoded by load_full_resolution meanwhile
+            if (self._source is None and self._reopen is None) or rotation != self.rotation:
+                return
+            if self._set_full(img):
+                on_loaded()
+        resize_worker.submit(self._full_job, lambda: self._decode_full(source, reopen, rotation), done)
+        return True
+
+    def _full_loaded(self) -> None:
+        self.resize(self.width, self.height)
+        if self.img_change_cb:
+            self.img_change_cb(self)
         
     def delayed_load(self) -> None:
         if not self.delay:
             log.debug("delayed_load was called but delay was off")
             return
-        self.bmp = wx.Bitmap.FromBuffer(self.img.size[0], self.img.size[1], self.bmp)
         if self.delayed_bmp:
-            w, h, s = self.delayed_bmp
-            self.zoomed_bmp = wx.Bitmap.FromBuffer(w, h, s)
+            self.zoomed_bmp = self.delayed_bmp.to_wx_bitmap()
             self.delayed_bmp = None
+        elif self.zoomed_bmp is None:
+            #Called in the main thread ahead of display; make the bitmap now rather than at the first paint
+            self.bmp
         self.delay = False
     
-    def _img_to_bmp(self, img: Image.Image|PilWrapper):
-        s = img.tobytes()
+    def _img_to_bmp(self, img: Image.Image) -> wx.Bitmap|PixelBuffer:
+        pixels = _to_pixels(img)
         if self.delay:
-            return s
+            return pixels
         else:
-            return wx.Bitmap.FromBuffer(img.size[0], img.size[1], s)
+            return pixels.to_wx_bitmap()
     
+    def _zoomed(self, width: int, height: int, resample=Image.Resampling.BICUBIC, build=True) -> Image.Image:
+        return self._pyramid.source_for(width, height, build).resize((width, height), resample)
+
     def rescale(self, width: int, height: int) -> Self:
         #Wrapper (needed for Cairo)
-        return self.img.rescale(width, height)
+        return PilWrapper(self._zoomed(width, height))
     def resize(self, width: int, height: int) -> None:
-        if self.base_width == width and self.base_height == height:
-            self.zoomed_bmp = None
-        else:
-            wrapper = self.img.rescale(width, height)
-            (w, h, s) = wrapper.getData()
+        if width > self.img.width or height > self.img.height:
+            #Zoomed past the decoded size
             if self.delay:
-                #TODO: Consider always making the delayed load a tuple and always use _img_to_bmp
-                self.delayed_bmp = (w, h, s)
+                #Still in the cache thread; nothing is waiting for it
+                self.load_full_resolution()
             else:
-                self.zoomed_bmp = wx.Bitmap.FromBuffer(w, h, s)
+                #The reduced image is shown scaled up until it's done
+                self.load_full_resolution_async(self._full_loaded)
         self.width = width
         self.height = height
+        if self.img.width == width and self.img.height == height:
+            self.zoomed_bmp = None
+            worker.cancel(self)
+        elif self.delay:
+            #Still in the cache thread; nothing is waiting for it
+            self.delayed_bmp = _to_pixels(self._zoomed(width, height))
+        else:
+            #Show a quick nearest neighbour copy now and swap in the bicubic one when it's ready.
+            #Missing reduced copies are made by the worker, not here.
+            preview = self._zoomed(width, height, Image.Resampling.NEAREST, build=False)
+            self.zoomed_bmp = _to_pixels(preview).to_wx_bitmap()
+            pyramid = self._pyramid
+            def make() -> PixelBuffer:
+                return _to_pixels(pyramid.source_for(width, height).resize((width, height), Image.Resampling.BICUBIC))
+            def apply(pixels: PixelBuffer) -> None:
+                self.zoomed_bmp = pixels.to_wx_bitmap()
+            worker.zoom_in_background(self, width, height, make, apply)
+
+    def close(self) -> None:
+        worker.cancel(self)
+        worker.cancel(self._full_job)
+        super().close()
 
     def _do_rotate(self, clockwise: int) -> None:
+        worker.cancel(self)
+        worker.cancel(self._full_job)
         self.img = self.img.transpose(Image.Transpose.ROTATE_90 if clockwise else Image.Transpose.ROTATE_270)
-        #Update the bmp
-        self.bmp = self._img_to_bmp(self.img)
+        #Remade on the next paint
+        self._bmp = None
         #Rotate the stored dimensions for any future/current zoom operations
         self.width, self.height = (self.height, self.width)
         
@@ -203,8 +418,9 @@ class PilImage(ImageHandlerBase):
 
     def create_thumbnail(self, width: int, height: int, delay: bool) -> wx.Bitmap|Callable[[],wx.Bitmap]:
         (width, height) = self.get_thumbnail_size(width, height)
-        img = self.img.resize((width, height), Image.Resampling.BICUBIC)
-        bmp = wx.Bitmap.FromBuffer(width, height, img.tobytes())
+        #Reuses a reduced copy if there is one
+        img = self._zoomed(width, height, build=False)
+        bmp = _to_pixels(img).to_wx_bitmap()
         #TODO: Implement delayed_fn. See freeimage.
         return bmp
 
@@ -212,60 +428,97 @@ class PilImage(ImageHandlerBase):
     def _get_extensions() -> list[str]:
         return [x.casefold() for x in Image.registered_extensions().keys()]
     ext_list: Any = _get_extensions()
+    capabilities = Capability.ANIMATION | Capability.DRAFT
+    backend_name = 'pil'
+    _source: bytes|None = None
+    _reopen: Callable[[], IO[bytes]]|None = None
+    _full_job: object|None = None
     
     @staticmethod
     def extensions():
         return PilImage.ext_list
 
 class AnimatedPilImage(PilImage, AnimatedImage):
-    def __init__(self, img: Image.Image, path: str, delay=False) -> None:
+    """Only the first frame is decoded when the image is opened. The others are decoded by the
+    animation thread shortly before they're shown (see FrameBuffer), from the kept file contents.
+    """
+    def __init__(self, img: Image.Image, path: str, delay=False, source: bytes = b'') -> None:
+        """source: the file contents; img must be opened from a copy of them."""
         # This doesn't call PilImage init to avoid some double bmp use.
         self.delay = delay
         self.img_path = path
         self._original_width = self.width = img.size[0]
         self._original_height = self.height = img.size[1]
         self.rotation = 0
+        self._source = source
 
         #This is number of times it should loop, not a bool.
         loop = img.info.get('loop', 0)
         count: int = img.n_frames
         frame_delays = [0] * count
-        frames: List[wx.Bitmap] = [None] * count
-        #Get the img and delay data. This requires using img.seek to select each individual frame.
+        #Get the delays. This requires using img.seek to select each individual frame,
+        #which only reads the frame headers...
         for i in range(count):
             img.seek(i)
-            # WebP does not populate `info` until the image is loaded, so calling load() is mandatory.
-            # This method is idempotent so there's no harm in an early call.
-            img.load()
+            if img.format == 'WEBP':
+                # ...except for WebP, which does not populate `info` until the frame is loaded.
+                img.load()
             frame_delays[i] = self.duration_to_time(img.info.get('duration', 100))
-            frame = img
-            if img.mode != 'RGB':
-                frame = frame.convert('RGB')
-            frames[i] = self._img_to_bmp(frame)
         img.seek(0)
+        #Decoded by the animation thread only
+        self._decoder: Image.Image|None = None
+        frames = FrameBuffer(count, self._decode_frame, meta.ANIMATION_FRAMES_AHEAD)
         AnimatedImage.__init__(self, frames, frame_delays)
-        self.bmp: wx.Bitmap = frames[0]
 
-        #Just the first frame.
+        #Just the first frame. The bitmap is made from it.
         self.img = PilWrapper(PilImage._to_32(img.copy()))
+        self._bmp = None
         self.zoomed_bmp: wx.Bitmap | None = None
-        self.delayed_bmp: tuple[int, int, bytes] | None = None
+        self.delayed_bmp: PixelBuffer | None = None
+        #Bitmap of the frame being shown, if not the first
+        self._frame_bmp: wx.Bitmap | None = None
+        self._frame_bmp_index = 0
 
-    def delayed_load(self) -> None:
-        if not self.delay:
-            log.debug("delayed_load was called but delay was off")
-            return
+    def _decode_frame(self, index: int) -> PixelBuffer:
+        if self._decoder is None:
+            self._decoder = Image.open(io.BytesIO(self._source))
+        self._decoder.seek(index)
+        frame = self._decoder
+        if frame.mode != 'RGB':
+            frame = frame.convert('RGB')
+        return _to_pixels(frame)
 
-        #TODO: Don't re-use this. Split into two lists...
-        for i in range(len(self.frames)):
-            self.frames[i] = wx.Bitmap.FromBuffer(self.img.size[0], self.img.size[1], self.frames[i])
+    def decode_ahead(self) -> None:
+        decoded = self.frames.decode_ahead(self.frame)
+        if FRAME_DEBUG and decoded:
+            log.debug(f'Decoded {decoded} frames ahead of {self.frame}')
 
-        self.bmp = self.frames[0]
-        self.delay = False
+    @property
+    def memory_size(self) -> int:
+        #The buffer is charged as if full, since it fills up as soon as the image is shown
+        frame_size = self._original_width * self._original_height * 4
+        size = _memory_size(self.img.img) + _memory_size(self._bmp) + _memory_size(self._frame_bmp)
+        return size + self.frames.capacity * frame_size + len(self._source)
 
     def get_display_bmp(self):
         #Animated images just won't support zooming, at least unless cairo can be used.
-        return AnimatedImage.get_display_bmp(self)
+        if self.frame == 0:
+            return self.bmp
+        if self.frame != self._frame_bmp_index:
+            pixels = self.frames.get(self.frame)
+            if pixels is None:
+                #The decoder is behind; keep showing the last frame
+                return self._frame_bmp or self.bmp
+            self._frame_bmp = pixels.to_wx_bitmap()
+            self._frame_bmp_index = self.frame
+        return self._frame_bmp
+
+    def close(self) -> None:
+        super().close()
+        #Decoded again if the image is shown again
+        self.frames.clear()
+        self._frame_bmp = None
+        self._frame_bmp_index = 0
 
     #Disallow
     def resize(self, width: int, height: int) -> None:
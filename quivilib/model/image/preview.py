@@ -0,0 +1,203 @@
+import io
+import logging
+from collections.abc import Callable
+from typing import IO, Self
+
+import wx
+from PIL import Image, ExifTags
+
+from quivilib import meta
+from quivilib.interface.imagehandler import ImageHandler, ImageHandlerBase, BaseImageProt, PixelBuffer
+from quivilib.model.image.pil import PilImage, PilWrapper, MAX_REDUCTION, _to_pixels, _memory_size
+
+log = logging.getLogger('preview')
+
+
+def _exif_thumbnail(img: Image.Image) -> Image.Image|None:
+    """The thumbnail in the EXIF data, if it's at least as large as a 1/8 decode and has the same shape
+    (some cameras letterbox it)."""
+    exif = img.info.get('exif')
+    if not exif or not exif.startswith(b'Exif\x00\x00'):
+        return None
+    ifd1 = img.getexif().get_ifd(ExifTags.IFD.IFD1)
+    offset = ifd1.get(ExifTags.Base.JpegIFOffset)
+    length = ifd1.get(ExifTags.Base.JpegIFByteCount)
+    if not offset or not length:
+        return None
+    #Offsets are from the TIFF header, after the Exif marker
+    thumb = Image.open(io.BytesIO(exif[6 + offset:6 + offset + length]))
+    if max(thumb.size) * MAX_REDUCTION < max(img.size):
+        return None
+    if abs(thumb.width / thumb.height - img.width / img.height) > 0.01:
+        return None
+    return thumb
+
+
+class PreviewImage(ImageHandlerBase):
+    """ Shown while an image is decoded: a small copy of it, scaled up to the displayed size.
+    set_image swaps in the decoded image; from then on everything is passed to it.
+    """
+    @classmethod
+    def CreatePreview(cls, f: IO[bytes], path: str, fit: Callable[[int, int], float]|None = None) -> Self|None:
+        """Only JPEGs have a way to get a small copy (EXIF thumbnail, or decoding at 1/8) much faster
+        than the image itself. Returns None for anything else, or if the image will decode quickly anyway
+        (see meta.PREVIEW_MIN_PIXELS). The file is rewound afterwards.
+        """
+        start = f.tell()
+        try:
+            img = Image.open(f)
+            full_size = img.size
+            if img.format != 'JPEG':
+                return None
+            #The image itself may be decoded at a reduced size (see PilImage.CreateImage)
+            scale = 1 if fit is None else PilImage._get_reduction(full_size, fit)
+            if scale == MAX_REDUCTION or full_size[0] * full_size[1] // (scale * scale) < meta.PREVIEW_MIN_PIXELS:
+                return None
+            small = _exif_thumbnail(img)
+            if small is None:
+                img.draft(None, (full_size[0] // MAX_REDUCTION, full_size[1] // MAX_REDUCTION))
+                small = img
+            small = PilImage._to_display_mode(small)
+            small.load()
+        except Exception:
+            log.debug(f'No preview for {path}', exc_info=True)
+            return None
+        finally:
+            f.seek(start)
+        log.debug(f'Preview of {path} at {small.size}, full size is {full_size}')
+        return cls(small, path, full_size, delay=True)
+
+    def __init__(self, img: Image.Image, path: str, full_size: tuple[int, int], delay=False) -> None:
+        self.img_path = path
+        self.delay = delay
+        self.rotation = 0
+        self._preview = img
+        self._original_width, self._original_height = full_size
+        self._width, self._height = img.size
+        #Made in the cache thread, until delayed_load
+        self._pixels: PixelBuffer|None = _to_pixels(img)
+        self._bmp: wx.Bitmap|None = None
+        #The decoded image, once set_image is called
+        self.full: ImageHandler|None = None
+
+    def set_image(self, img: ImageHandler) -> None:
+        """Show img instead of the preview, at the same size and rotation. Must be called on the main thread."""
+        for _ in range(self.rotation):
+            img.rotate(True)
+        if (img.width, img.height) != (self._width, self._height):
+            img.resize(self._width, self._height)
+        self.full = img
+        self._bmp = None
+        self._preview = None
+        img.set_callback(self._on_full_changed)
+        img.start_animation()
+        if self.img_change_cb:
+            self.img_change_cb(self)
+
+    def _on_full_changed(self, img: ImageHandler) -> None:
+        #The canvas only listens to the image it has
+        if self.img_change_cb:
+            self.img_change_cb(self)
+
+    @property
+    def width(self) -> int:
+        return self.full.width if self.full else self._width
+    @property
+    def height(self) -> int:
+        return self.full.height if self.full else self._height
+    @property
+    def base_width(self) -> int:
+        return self.full.base_width if self.full else super().base_width
+    @property
+    def base_height(self) -> int:
+        return self.full.base_height if self.full else super().base_height
+
+    def getImg(self) -> BaseImageProt:
+        return self.full.getImg() if self.full else PilWrapper(self._preview)
+
+    def copy(self) -> Self:
+        if self.full:
+            return self.full.copy()
+        return PreviewImage(self._preview, self.img_path, (self._original_width, self._original_height))
+
+    def delayed_load(self) -> None:
+        if self.full:
+            return self.full.delayed_load()
+        if self._pixels is not None:
+            self._bmp = self._pixels.to_wx_bitmap()
+            self._pixels = None
+        self.delay = False
+
+    def rescale(self, width: int, height: int) -> Self:
+        if self.full:
+            return self.full.rescale(width, height)
+        return PilWrapper(self._preview.resize((width, height), Image.Resampling.BILINEAR))
+
+    def resize(self, width: int, height: int) -> None:
+        if self.full:
+            return self.full.resize(width, height)
+        self._width = width
+        self._height = height
+        #Small enough to scale up on the spot
+        pixels = _to_pixels(self._preview.resize((width, height), Image.Resampling.BILINEAR))
+        if self.delay:
+            self._pixels = pixels
+        else:
+            self._bmp = pixels.to_wx_bitmap()
+
+    def rotate(self, clockwise: int) -> None:
+        if self.full:
+            return self.full.rotate(clockwise)
+        super().rotate(clockwise)
+
+    def _do_rotate(self, clockwise: int) -> None:
+        self._preview = self._preview.transpose(Image.Transpose.ROTATE_90 if clockwise else Image.Transpose.ROTATE_270)
+        self.resize(self._height, self._width)
+
+    def paint(self, dc: wx.DC, x: int, y: int) -> None:
+        if self.full:
+            return self.full.paint(dc, x, y)
+        if self._bmp is None:
+            log.error("paint called but image was not loaded")
+            return
+        dc.DrawBitmap(self._bmp, x, y)
+
+    def copy_to_clipboard(self) -> None:
+        if self.full:
+            return self.full.copy_to_clipboard()
+        self.do_copy_to_clipboard(self._bmp)
+
+    def create_thumbnail(self, width: int, height: int, delay: bool = False) -> wx.Bitmap|Callable[[],wx.Bitmap]:
+        if self.full:
+            return self.full.create_thumbnail(width, height, delay)
+        (width, height) = self.get_thumbnail_size(width, height)
+        return _to_pixels(self._preview.resize((width, height), Image.Resampling.BILINEAR)).to_wx_bitmap()
+
+    def is_animated(self) -> bool:
+        return self.full.is_animated() if self.full else False
+
+    def stop_animation(self):
+        if self.full:
+            self.full.stop_animation()
+
+    def load_full_resolution(self) -> bool:
+        return self.full.load_full_resolution() if self.full else False
+
+    def load_full_resolution_async(self, on_loaded: Callable[[], None]) -> bool:
+        return self.full.load_full_resolution_async(on_loaded) if self.full else False
+
+    @property
+    def memory_size(self) -> int:
+        if self.full:
+            return self.full.memory_size
+        return _memory_size(self._preview) + _memory_size(self._pixels) + _memory_size(self._bmp)
+
+    def close(self) -> None:
+        if self.full:
+            self.full.close()
+
+    @staticmethod
+    def extensions():
+        """ Previews are only made for images that were opened some other way.
+        """
+        return []
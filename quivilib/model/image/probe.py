@@ -0,0 +1,120 @@
+"""Read the dimensions of an image from its header, without decoding it.
+Supports JPEG, PNG, GIF, WebP and BMP; anything else returns None.
+Also tells the format of an image from its first bytes (see sniff_format).
+"""
+import struct
+
+from typing import IO
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+#Start of frame markers. C4 (DHT), C8 (JPG) and CC (DAC) share the range but aren't frames.
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+#Markers without a length field
+_JPEG_STANDALONE = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+#Number of bytes sniff_format needs
+SNIFF_SIZE = 16
+#(offset, magic bytes, format). Checked in order.
+_SIGNATURES = [
+    (0, b'\xff\xd8\xff', 'JPEG'),
+    (0, _PNG_SIGNATURE, 'PNG'),
+    (0, b'GIF87a', 'GIF'),
+    (0, b'GIF89a', 'GIF'),
+    (8, b'WEBP', 'WEBP'),
+    (0, b'II*\x00', 'TIFF'),
+    (0, b'MM\x00*', 'TIFF'),
+    (0, b'\x00\x00\x00\x0cjP  \r\n\x87\n', 'JPEG2000'),
+    (0, b'\xff\x4f\xff\x51', 'JPEG2000'),
+    (0, b'8BPS', 'PSD'),
+    (0, b'BM', 'BMP'),
+]
+#Extension that stands for each format when looking up the backends
+FORMAT_EXTENSIONS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'GIF': '.gif',
+    'WEBP': '.webp',
+    'TIFF': '.tif',
+    'JPEG2000': '.jp2',
+    'PSD': '.psd',
+    'BMP': '.bmp',
+}
+
+
+def sniff_format(head: bytes) -> str|None:
+    """Return the format of an image (a key of FORMAT_EXTENSIONS) from its first SNIFF_SIZE bytes,
+    or None if it isn't recognized.
+    """
+    for offset, magic, fmt in _SIGNATURES:
+        if head.startswith(magic, offset):
+            if fmt == 'WEBP' and not head.startswith(b'RIFF'):
+                continue
+            return fmt
+    return None
+
+
+def probe_size(f: IO[bytes]) -> tuple[int, int]|None:
+    """Return (width, height) of the image in the file, or None if it can't be told from the header.
+    The file must be at the start; it's left at an arbitrary position.
+    """
+    head = f.read(32)
+    if head.startswith(_PNG_SIGNATURE) and head[12:16] == b'IHDR':
+        return struct.unpack('>II', head[16:24])
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return struct.unpack('<HH', head[6:10])
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return _webp_size(head)
+    if head[:2] == b'BM' and len(head) >= 26:
+        width, height = struct.unpack('<ii', head[18:26])
+        #Negative height means the rows are stored top-down
+        return width, abs(height)
+    if head[:2] == b'\xff\xd8':
+        f.seek(2)
+        return _jpeg_size(f)
+    return None
+
+
+def _webp_size(head: bytes) -> tuple[int, int]|None:
+    chunk = head[12:16]
+    if chunk == b'VP8 ' and head[23:26] == b'\x9d\x01\x2a':
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L' and head[20:21] == b'\x2f':
+        bits = int.from_bytes(head[21:25], 'little')
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    return None
+
+
+def _jpeg_size(f: IO[bytes]) -> tuple[int, int]|None:
+    while True:
+        byte = f.read(1)
+        if not byte:
+            return None
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        #Any number of 0xFF may be used as padding
+        while marker == b'\xff':
+            marker = f.read(1)
+        if not marker:
+            return None
+        code = marker[0]
+        if code in _JPEG_STANDALONE:
+            continue
+        if code in (0xD9, 0xDA):
+            #End of image or start of scan without a frame header
+            return None
+        data = f.read(2)
+        if len(data) < 2:
+            return None
+        length = struct.unpack('>H', data)[0]
+        if code in _JPEG_SOF:
+            frame = f.read(5)
+            if len(frame) < 5:
+                return None
+            height, width = struct.unpack('>HH', frame[1:5])
+            return width, height
+        #Skip the segment (e.g. EXIF, which may include a large thumbnail)
+        f.seek(length - 2, 1)
@@ -0,0 +1,62 @@
+"""Reduced copies of an image (1/2, 1/4, 1/8), so zooming out doesn't resample the full image every time."""
+import logging
+from collections.abc import Callable
+from threading import Lock
+from typing import Generic, TypeVar
+
+log = logging.getLogger('pyramid')
+
+T = TypeVar('T')
+
+#Number of levels below the full image: 1/2, 1/4, 1/8
+LEVELS = 3
+
+
+class Pyramid(Generic[T]):
+    """Each level is made from the previous one when it's first needed, and then kept.
+    Handlers make a new Pyramid whenever their image changes (e.g. rotation).
+    Safe to use from several threads (the main thread, the cache and the resize worker).
+    """
+    def __init__(self, base: T, halve: Callable[[T], T], size: Callable[[T], tuple[int, int]],
+                 memory: Callable[[T], int]) -> None:
+        """halve: returns the image at half size. size and memory: the size in pixels and bytes of an image."""
+        self._halve = halve
+        self._size = size
+        self._memory = memory
+        self._levels: list[T] = [base]
+        self._lock = Lock()
+
+    def source_for(self, width: int, height: int, build: bool = True) -> T:
+        """The smallest level that is still at least width x height (the full image if none is).
+        If not build, only levels that were already made are considered."""
+        while True:
+            with self._lock:
+                levels = list(self._levels)
+            i = 0
+            while i + 1 < len(levels):
+                next_w, next_h = self._size(levels[i + 1])
+                if next_w < width or next_h < height:
+                    return levels[i]
+                i += 1
+            #The smallest level so far is still large enough; maybe a smaller one is needed
+            w, h = self._size(levels[i])
+            if not build or i == LEVELS or w // 2 < width or h // 2 < height:
+                return levels[i]
+            #Made without the lock, so other threads (e.g. the main thread with build=False) don't wait for it
+            halved = self._halve(levels[i])
+            with self._lock:
+                #Unless another thread made it meanwhile
+                if len(self._levels) == len(levels):
+                    self._levels.append(halved)
+                    log.debug(f'Made a {w // 2}x{h // 2} level')
+
+    def smallest(self) -> T:
+        """The smallest level made so far."""
+        with self._lock:
+            return self._levels[-1]
+
+    @property
+    def memory_size(self) -> int:
+        """Bytes held by the levels, not counting the full image."""
+        with self._lock:
+            return sum(self._memory(level) for level in self._levels[1:])
@@ -0,0 +1,58 @@
+from quivilib.interface.imagehandler import ImageHandler, Capability
+from quivilib.model.image.probe import sniff_format, FORMAT_EXTENSIONS
+
+
+class FormatRegistry(object):
+    """ Which image extensions are supported and which backends (PIL, FreeImage) can open them.
+    Built once at startup; backend extension lists can be slow to query (FreeImage goes through ctypes),
+    so everything is answered from precomputed sets.
+    """
+    def __init__(self, backends: list[type[ImageHandler]], listed_extensions: dict[type[ImageHandler], list[str]],
+                 preferred: dict[str, str]|None = None) -> None:
+        """
+        @param backends: handler classes in order of preference
+        @param listed_extensions: extensions shown as supported, per backend, if different from
+            everything the backend can open (PIL registers many rarely useful formats).
+        @param preferred: format (see probe.sniff_format) -> backend_name to try first for it
+        """
+        self.backends = tuple(backends)
+        routes: dict[str, list[type[ImageHandler]]] = {}
+        listed: set[str] = set()
+        for cls in self.backends:
+            exts = {ext.casefold() for ext in cls.extensions()}
+            for ext in exts:
+                routes.setdefault(ext, []).append(cls)
+            listed.update(listed_extensions.get(cls, exts))
+        #Extension -> backends that can open it, most preferred first
+        self._routes: dict[str, tuple[type[ImageHandler], ...]] = {ext: tuple(classes) for ext, classes in routes.items()}
+        #Listed extensions that at least one backend can actually open
+        self.extensions: frozenset[str] = frozenset(ext for ext in listed if ext in self._routes)
+        #Sniffed format -> backends, with the preferred one first
+        self._format_routes: dict[str, tuple[type[ImageHandler], ...]] = {}
+        for fmt, ext in FORMAT_EXTENSIONS.items():
+            classes = self.backends_for(ext)
+            name = (preferred or {}).get(fmt)
+            first = [cls for cls in classes if cls.backend_name == name]
+            self._format_routes[fmt] = tuple(first + [cls for cls in classes if cls not in first])
+
+    def is_supported(self, ext: str) -> bool:
+        """True if files with this extension (including the dot) are shown as images."""
+        return ext.casefold() in self.extensions
+
+    def backends_for(self, ext: str) -> tuple[type[ImageHandler], ...]:
+        """Backends that can open the extension, most preferred first. Empty if none."""
+        return self._routes.get(ext.casefold(), ())
+
+    def backends_for_content(self, head: bytes, ext: str) -> tuple[type[ImageHandler], ...]:
+        """Backends for a file starting with head (at least probe.SNIFF_SIZE bytes), most preferred first.
+        The content decides; the extension is only used if the format isn't recognized.
+        """
+        fmt = sniff_format(head)
+        if fmt is not None:
+            backends = self._format_routes[fmt]
+            if backends:
+                return backends
+        return self.backends_for(ext)
+
+    def backends_with(self, capability: Capability) -> tuple[type[ImageHandler], ...]:
+        return tuple(cls for cls in self.backends if cls.capabilities & capability == capability)
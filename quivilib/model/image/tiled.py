@@ -0,0 +1,155 @@
+import logging
+from collections import OrderedDict
+from collections.abc import Callable
+from typing import Self
+
+import wx
+
+from quivilib import meta
+from quivilib.interface.imagehandler import ImageHandler, ImageHandlerBase, SecondaryImageHandler, BaseImageProt
+
+log = logging.getLogger('tiled')
+
+#Size of a tile on screen, in pixels
+TILE_SIZE = 512
+
+
+def needs_tiles(img: ImageHandler) -> bool:
+    return max(img.base_width, img.base_height) > meta.TILED_MIN_SIZE
+
+
+class TiledImage(ImageHandlerBase, SecondaryImageHandler):
+    """ Images too large for a single bitmap or surface (long vertical strips, huge scans).
+    Only the tiles in view are scaled and made into bitmaps; the most recently used ones are kept,
+    up to meta.TILE_CACHE_SIZE bytes. The decoded image is kept by the source handler.
+    """
+    @classmethod
+    def CreateImage(cls, f, path, delay=False) -> ImageHandler:
+        raise Exception("Use another class to open the image first")
+    @classmethod
+    def CreateWrappedImage(cls, src: ImageHandler|None = None, delay=False) -> ImageHandler:
+        if src is None:
+            raise Exception("Tiles must have a separate image loader.")
+        return TiledImage(src, delay=delay)
+    def __init__(self, src: ImageHandler, delay=False) -> None:
+        #src is never resized or made into a bitmap as a whole
+        self.src = src
+        self.img_path = src.img_path
+        self.delay = delay
+        self.rotation = 0
+        self._original_width = self.width = src.base_width
+        self._original_height = self.height = src.base_height
+        #(column, row) -> (bitmap, bytes), least recently used first
+        self._tiles: OrderedDict[tuple[int, int], tuple[wx.Bitmap, int]] = OrderedDict()
+        self._tiles_size = 0
+
+    def getImg(self) -> BaseImageProt:
+        return self.src.getImg()
+
+    def copy(self) -> Self:
+        return TiledImage(self.src.copy())
+
+    def delayed_load(self) -> None:
+        #Tiles are made when painted
+        self.delay = False
+
+    def rescale(self, width: int, height: int) -> Self:
+        return self.src.rescale(width, height)
+
+    def _clear_tiles(self) -> None:
+        self._tiles.clear()
+        self._tiles_size = 0
+
+    def resize(self, width: int, height: int) -> None:
+        img = self.getImg()
+        if width > img.width or height > img.height:
+            if self.delay:
+                self.load_full_resolution()
+            else:
+                #Tiles are cut from the reduced image until it's done
+                self.src.load_full_resolution_async(self._full_loaded)
+        self.width = width
+        self.height = height
+        self._clear_tiles()
+
+    def _do_rotate(self, clockwise: int) -> None:
+        self.src.rotate(clockwise)
+        self.width, self.height = self.height, self.width
+        self._clear_tiles()
+
+    def _get_tile(self, column: int, row: int) -> wx.Bitmap:
+        key = (column, row)
+        tile = self._tiles.get(key)
+        if tile is not None:
+            self._tiles.move_to_end(key)
+            return tile[0]
+        img = self.getImg()
+        #Display -> decoded image
+        xscale = img.width / self.width
+        yscale = img.height / self.height
+        left = column * TILE_SIZE
+        top = row * TILE_SIZE
+        right = min(left + TILE_SIZE, self.width)
+        bottom = min(top + TILE_SIZE, self.height)
+        box = (left * xscale, top * yscale, right * xscale, bottom * yscale)
+        bmp = img.rescale_region(box, right - left, bottom - top).get_pixels().to_wx_bitmap()
+        size = (right - left) * (bottom - top) * 4
+        self._tiles[key] = (bmp, size)
+        self._tiles_size += size
+        while self._tiles_size > meta.TILE_CACHE_SIZE and len(self._tiles) > 1:
+            _, (_, old_size) = self._tiles.popitem(last=False)
+            self._tiles_size -= old_size
+        return bmp
+
+    def paint(self, dc: wx.DC, x: int, y: int) -> None:
+        if self.delay:
+            log.error("paint called but image was not loaded")
+            return
+        view_width, view_height = dc.GetSize()
+        #The part of the image in view
+        left = max(0, -x)
+        top = max(0, -y)
+        right = min(self.width, view_width - x)
+        bottom = min(self.height, view_height - y)
+        if left >= right or top >= bottom:
+            return
+        for row in range(top // TILE_SIZE, (bottom - 1) // TILE_SIZE + 1):
+            for column in range(left // TILE_SIZE, (right - 1) // TILE_SIZE + 1):
+                dc.DrawBitmap(self._get_tile(column, row), x + column * TILE_SIZE, y + row * TILE_SIZE)
+
+    def copy_to_clipboard(self) -> None:
+        #Scaled down to fit in a single bitmap, which is what tiling avoids otherwise
+        img = self.getImg()
+        factor = min(1, meta.TILED_MIN_SIZE / max(img.width, img.height))
+        if factor < 1:
+            img = img.rescale(max(1, int(img.width * factor)), max(1, int(img.height * factor)))
+        self.do_copy_to_clipboard(img.get_pixels().to_wx_bitmap())
+
+    @property
+    def memory_size(self) -> int:
+        return self.src.memory_size + self._tiles_size
+
+    def create_thumbnail(self, width: int, height: int, delay: bool = False) -> wx.Bitmap|Callable[[],wx.Bitmap]:
+        return self.src.create_thumbnail(width, height, delay)
+
+    def load_full_resolution(self) -> bool:
+        if self.src.load_full_resolution():
+            self._clear_tiles()
+            return True
+        return False
+
+    def _full_loaded(self) -> None:
+        log.debug(f'Tiled: decoded {self.img_path} at full size')
+        self._clear_tiles()
+        if self.img_change_cb:
+            self.img_change_cb(self)
+
+    def close(self) -> None:
+        self._clear_tiles()
+        self.src.close()
+
+    @staticmethod
+    def extensions():
+        """ Extensions do not matter for tiles.
+        """
+        return []
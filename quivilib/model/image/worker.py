@@ -0,0 +1,142 @@
+"""A background thread for the slow part of zooming.
+
+Handlers show a cheap preview right away and hand the high quality resample to the shared
+ResizeWorker. Jobs are per image: a new job replaces one that hasn't started yet, so a burst of
+zoom steps only resamples for the last one, and marks a running one as stale so its result is
+dropped (the job can check cancelled() between steps to stop early). Results are applied in the
+main thread.
+"""
+import logging
+import time
+from collections import Counter
+from collections.abc import Callable
+from threading import Thread, Condition, Lock
+from typing import Any
+
+import wx
+
+log = logging.getLogger('worker')
+
+
+class _Job(object):
+    def __init__(self, owner, make: Callable[[], Any], done: Callable[[Any], None], not_before: float) -> None:
+        self.owner = owner
+        self.make = make
+        self.done = done
+        self.not_before = not_before
+        self.cancelled = False
+
+
+class ResizeWorker(object):
+    def __init__(self, deliver: Callable[..., None] = wx.CallAfter) -> None:
+        """deliver: used to call the done functions in the main thread."""
+        self._deliver = deliver
+        #id(owner) -> newest job. Oldest first.
+        self._jobs: dict[int, _Job] = {}
+        self._running: _Job|None = None
+        self._cond = Condition()
+        #submitted, coalesced (replaced before starting), stale (finished after being replaced), delivered,
+        #and anything handlers record()
+        self.metrics: Counter[str] = Counter()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, owner, make: Callable[[], Any], done: Callable[[Any], None], delay: float = 0.0) -> None:
+        """Run make() in the worker, no sooner than delay seconds from now, and then done(result) in the
+        main thread. Replaces any job of the same owner."""
+        with self._cond:
+            if self._cancel(owner):
+                self.metrics['coalesced'] += 1
+            self._jobs[id(owner)] = _Job(owner, make, done, time.perf_counter() + delay)
+            self.metrics['submitted'] += 1
+            self._cond.notify()
+
+    def cancel(self, owner) -> None:
+        """Drop the owner's pending job and the result of its running one."""
+        with self._cond:
+            self._cancel(owner)
+
+    def is_busy(self, owner) -> bool:
+        with self._cond:
+            running = self._running is not None and self._running.owner is owner and not self._running.cancelled
+            return running or id(owner) in self._jobs
+
+    def cancelled(self) -> bool:
+        """In a job: whether it has been replaced or cancelled, so the rest of the work can be skipped."""
+        with self._cond:
+            return self._running is None or self._running.cancelled
+
+    def record(self, name: str) -> None:
+        with self._cond:
+            self.metrics[name] += 1
+
+    def _cancel(self, owner) -> bool:
+        """Returns True if a pending job was dropped."""
+        job = self._jobs.pop(id(owner), None)
+        if job is not None:
+            job.cancelled = True
+        if self._running is not None and self._running.owner is owner:
+            self._running.cancelled = True
+        return job is not None
+
+    def _next(self) -> _Job:
+        with self._cond:
+            while True:
+                now = time.perf_counter()
+                for key, job in self._jobs.items():
+                    if job.not_before <= now:
+                        del self._jobs[key]
+                        self._running = job
+                        return job
+                timeout = min((job.not_before for job in self._jobs.values()), default=now) - now
+                self._cond.wait(timeout if self._jobs else None)
+
+    def _run(self) -> None:
+        while True:
+            job = self._next()
+            try:
+                result = job.make()
+            except Exception:
+                log.exception('Background resize failed')
+                continue
+            finally:
+                with self._cond:
+                    self._running = None
+            if not job.cancelled:
+                self._deliver(self._finish, job, result)
+            else:
+                self.record('stale')
+
+    def _finish(self, job: _Job, result) -> None:
+        #May have been cancelled while waiting for the main thread
+        if not job.cancelled:
+            self.record('delivered')
+            job.done(result)
+        else:
+            self.record('stale')
+
+
+_worker: ResizeWorker|None = None
+_worker_lock = Lock()
+def get_worker() -> ResizeWorker:
+    """The worker shared by all images. Started on first use."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ResizeWorker()
+        return _worker
+
+def cancel(owner) -> None:
+    if _worker is not None:
+        _worker.cancel(owner)
+
+def zoom_in_background(img, width: int, height: int, make: Callable[[], Any], apply: Callable[[Any], None]) -> None:
+    """Finish a zoom of img to width x height: make() runs in the worker and apply(result) in the main thread,
+    unless img has been resized, rotated or closed meanwhile. img's canvas is then told to repaint."""
+    def done(result) -> None:
+        if (img.width, img.height) != (width, height):
+            return
+        apply(result)
+        if img.img_change_cb:
+            img.img_change_cb(img)
+    get_worker().submit(img, make, done)
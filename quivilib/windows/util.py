@@ -44,9 +44,9 @@ def get_icon_for_directory(small=True):
     icon.CreateFromHICON(hicon)
     return icon
 
-def delete_file(path, window):
+def delete_file(path, hwnd=0):
+    """hwnd owns any confirmation or progress dialog; 0 for none. Safe to call from any thread."""
     from win32com.shell import shell, shellcon
     
-    hwnd = window.GetHandle()
     flags = shellcon.FOF_ALLOWUNDO
     shell.SHFileOperation((hwnd, shellcon.FO_DELETE, path, None, flags, None, None))
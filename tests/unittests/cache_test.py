@@ -1,13 +1,16 @@
 import logging
 import unittest
 from pathlib import Path
+from unittest.mock import patch
 
 import wx
 from pubsub import pub as Publisher
 
+from quivilib import meta
 from quivilib.control.cache import ImageCache, ImageCacheLoadRequest
 from quivilib.model.container import SortOrder
 from quivilib.model.container.directory import DirectoryContainer
+from quivilib.model.dimensions import DimensionStore
 from quivilib.model.settings import Settings
 
 logging.getLogger().setLevel(logging.NOTSET)
@@ -30,3 +33,57 @@ class Test(unittest.TestCase):
         #time.sleep(10)
         
         Publisher.sendMessage('program.closed')
+
+    def test_evict(self):
+        class Req:
+            def __init__(self, size):
+                self.path = Path(str(size))
+                self.img = type('Img', (), {'memory_size': size})()
+        s = Settings('filethatdoesnotexist.ini')
+        cache = ImageCache(s)
+        try:
+            removed = []
+            cache.notify_cache_removed = removed.append
+            def fill(*sizes):
+                cache.on_flush()
+                #Oldest first
+                for size in reversed(sizes):
+                    cache._insert(Req(size))
+            fill(300, 200, 100, 50)
+            self.assertEqual(cache.cache_memory, 650)
+            with patch.multiple(meta, CACHE_SIZE=10, CACHE_MEMORY_SIZE=500):
+                cache._evict()
+            self.assertEqual([req.img.memory_size for req in cache.cache], [300, 200])
+            self.assertEqual(cache.cache_memory, 500)
+            self.assertEqual(len(removed), 2)
+            #The newest one stays even if it's over the budget by itself
+            fill(1000, 10)
+            with patch.multiple(meta, CACHE_SIZE=10, CACHE_MEMORY_SIZE=500):
+                cache._evict()
+            self.assertEqual(len(cache.cache), 1)
+            self.assertEqual(cache.cache_memory, 1000)
+            fill(1, 1, 1)
+            with patch.multiple(meta, CACHE_SIZE=2, CACHE_MEMORY_SIZE=500):
+                cache._evict()
+            self.assertEqual(len(cache.cache), 2)
+            self.assertEqual(cache.cache_memory, 2)
+        finally:
+            Publisher.sendMessage('program.closed')
+
+    def test_dimensions_stored(self):
+        container = DirectoryContainer(Path('.') / 'tests' / 'dummy', SortOrder.TYPE, False)
+        item = container.items[2]
+        class Loaded:
+            img = type('Img', (), {'base_width': 800, 'base_height': 600, 'memory_size': 0,
+                                   'delayed_load': lambda self: None})()
+        Loaded.item = item
+        Loaded.path = item.path
+        store = DimensionStore()
+        cache = ImageCache(Settings('filethatdoesnotexist.ini'), store)
+        try:
+            cache.notify_image_loaded = lambda request: None
+            cache.on_image_loaded(Loaded())
+            self.assertEqual(item.dimensions, (800, 600))
+            self.assertEqual(store.get_item(item), (800, 600))
+        finally:
+            Publisher.sendMessage('program.closed')
@@ -1,6 +1,9 @@
 
 
-from quivilib.model.canvas import Canvas
+from pubsub import pub as Publisher
+
+from quivilib.model.canvas import Canvas, get_fit_factor
+from quivilib.model.commandenum import FitSettings
 from quivilib.model.settings import Settings
 
 import unittest
@@ -32,4 +35,34 @@ class Test(unittest.TestCase):
         
         self.assertEqual(self.c.top, 25)
         self.assertEqual(self.c.left, 25)
-        
\ No newline at end of file
+        
+    def test_get_fit_factor(self):
+        FitType = FitSettings.FitType
+        self.assertEqual(get_fit_factor(FitType.WINDOW, 200, 100, 100, 100), (0.5, False))
+        self.assertEqual(get_fit_factor(FitType.HEIGHT, 200, 100, 100, 100), (1.0, False))
+        #Only shrinks
+        self.assertEqual(get_fit_factor(FitType.WIDTH_IF_LARGER, 50, 100, 100, 100), (1, False))
+        #Spreads are fit as half the width
+        self.assertEqual(get_fit_factor(FitType.WIDTH, 200, 100, 100, 100, detect_spreads=True), (1.0, True))
+
+    def test_get_fit_function(self):
+        self.v.width = self.v.height = 100
+        self.c._get_str_setting = lambda name: FitSettings.FitType.WINDOW.name
+        fit = self.c.get_fit_function()
+        #The view size is read when the function is made
+        self.v.width = self.v.height = 400
+        self.assertEqual(fit(200, 100), 0.5)
+
+    def test_announce_fit(self):
+        self.v.width = self.v.height = 100
+        self.c._get_str_setting = lambda name: FitSettings.FitType.WIDTH.name
+        self.c._get_bool_setting = lambda name: True
+        sent = []
+        def on_fit_changed(FitType, IsSpread):
+            sent.append((FitType, IsSpread))
+        Publisher.subscribe(on_fit_changed, 'canvas.fit.changed')
+        try:
+            self.c.announce_fit(300, 100)
+        finally:
+            Publisher.unsubscribe(on_fit_changed, 'canvas.fit.changed')
+        self.assertEqual(sent, [(FitSettings.FitType.WIDTH, True)])
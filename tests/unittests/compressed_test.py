@@ -1,9 +1,14 @@
 
 
+import io
+import os
+import tarfile
+import tempfile
 import unittest
+import zipfile
 
 from quivilib.model.container import SortOrder
-from quivilib.model.container.compressed import CompressedContainer
+from quivilib.model.container.compressed import CompressedContainer, ZipFile
 from pathlib import Path
 
 
@@ -117,3 +122,71 @@ class Test(unittest.TestCase):
         normalized = [str(Path(x)) for x in filepaths]
         normalized.sort()
         self.assertEqual(lst, normalized)
+
+    def test_zip_prefetch(self):
+        fd, name = tempfile.mkstemp(suffix='.zip')
+        os.close(fd)
+        try:
+            contents = {f'{i:02}.jpg': os.urandom(1000) + bytes(5000) for i in range(6)}
+            contents['04.jpg'] = os.urandom(1024 * 1024)
+            with zipfile.ZipFile(name, 'w') as zf:
+                for i, (member, data) in enumerate(contents.items()):
+                    compression = zipfile.ZIP_DEFLATED if i % 2 else zipfile.ZIP_STORED
+                    zf.writestr(member, data, compress_type=compression)
+            archive = ZipFile(Path(name))
+            try:
+                archive.prefetch([Path('01.jpg'), Path('02.jpg'), Path('03.jpg'), Path('05.jpg')])
+                #The last one is too far from the others, so it's left for open_file
+                self.assertIn('03.jpg', archive._read_ahead)
+                self.assertNotIn('05.jpg', archive._read_ahead)
+                for member, data in contents.items():
+                    self.assertEqual(archive.open_file(Path(member)).read(), data)
+                self.assertEqual(archive._read_ahead.size, 0)
+            finally:
+                archive.close()
+            #A late prefetch (e.g. from the cache thread) doesn't open the file again
+            archive.prefetch([Path('01.jpg'), Path('02.jpg')])
+            archive._read_run([archive.mapping[Path('01.jpg')], archive.mapping[Path('02.jpg')]])
+            self.assertIsNone(archive._raw_fp)
+        finally:
+            os.remove(name)
+
+    def test_tar(self):
+        fd, name = tempfile.mkstemp(suffix='.cbt')
+        os.close(fd)
+        try:
+            contents = {'b/02.jpg': os.urandom(3000), 'b/01.jpg': os.urandom(700), 'a.png': b''}
+            with tarfile.open(name, 'w') as tf:
+                for member, data in contents.items():
+                    info = tarfile.TarInfo(member)
+                    info.size = len(data)
+                    tf.addfile(info, io.BytesIO(data))
+            container = CompressedContainer(Path(name), SortOrder.NAME, False)
+            try:
+                self.assertEqual([str(item.path) for item in container.items],
+                                 ['..', 'a.png', str(Path('b/01.jpg')), str(Path('b/02.jpg'))])
+                for idx in range(1, container.item_count):
+                    f = container.open_image(idx)
+                    f.seek(0, io.SEEK_END)
+                    size = f.tell()
+                    f.seek(0)
+                    data = f.read()
+                    if size:
+                        self.assertEqual(bytes(f.getbuffer()), data)
+                    f.close()
+                    self.assertEqual(data, contents[container.items[idx].path.as_posix()])
+                    self.assertEqual(size, len(data))
+                f = container.open_image(3)
+            finally:
+                container.close_container()
+            #A reader still open keeps the map alive after the archive is closed
+            self.assertIsNotNone(container.file._mm)
+            buf = bytearray(100)
+            self.assertEqual(f.readinto(buf), 100)
+            self.assertEqual(bytes(buf), contents['b/02.jpg'][:100])
+            f.close()
+            self.assertIsNone(container.file._mm)
+            #Late reads fail instead of getting empty data
+            self.assertRaises(ValueError, container.file.open_file, Path('a.png'))
+        finally:
+            os.remove(name)
@@ -0,0 +1,67 @@
+import ctypes
+import unittest
+from unittest.mock import patch
+
+import numpy
+from PIL import Image
+
+from quivilib.model.image import depth
+
+
+#16 bit value -> 8 bit value: v * 255 / 65535, rounded
+SAMPLES = [(0, 0), (128, 0), (129, 1), (384, 1), (32896, 128), (65406, 254), (65407, 255), (65535, 255)]
+
+
+class Test(unittest.TestCase):
+    def _gray(self, mode, values):
+        values = numpy.asarray(values, dtype=numpy.uint16)
+        if mode == 'I':
+            return Image.fromarray(values.astype(numpy.int32))
+        #PIL's convert clips 16 bit values to 255
+        dtype = '>u2' if mode == 'I;16B' else '<u2'
+        return Image.frombytes(mode, values.shape[::-1], values.astype(dtype).tobytes())
+
+    def _check_gray(self):
+        values = [[v for v, _ in SAMPLES]]
+        expected = [e for _, e in SAMPLES]
+        for mode in ('I;16', 'I;16B', 'I'):
+            img = depth.to_8_bits(self._gray(mode, values))
+            self.assertEqual(img.mode, 'L', mode)
+            self.assertEqual(list(img.tobytes()), expected, mode)
+
+    def test_gray16(self):
+        self._check_gray()
+        with patch.object(depth, 'numpy', None):
+            self._check_gray()
+        img = Image.new('RGB', (1, 1))
+        self.assertIs(depth.to_8_bits(img), img)
+
+    def test_float(self):
+        img = Image.new('F', (3, 1))
+        for x, v in enumerate((0.5, 1.0, 1.5)):
+            img.putpixel((x, 0), v)
+        self.assertEqual(list(depth.to_8_bits(img).tobytes()), [0, 128, 255])
+
+    def test_rgb16(self):
+        values = numpy.array([[[65535, 384, 0], [0, 32896, 65535]]], dtype=numpy.uint16)
+        out = numpy.zeros((1, 2, 4), dtype=numpy.uint8)
+        depth.rgb16_to_bgrx(values, out)
+        self.assertEqual(out.tolist(), [[[0, 1, 255, 255], [255, 128, 0, 255]]])
+
+    def test_rows_of(self):
+        #2 rows of 3 bytes, padded to 4
+        buf = ctypes.create_string_buffer(b'abc_def_', 8)
+        rows = depth.rows_of(ctypes.addressof(buf), 4, 2, 3)
+        self.assertEqual(rows.tobytes(), b'abcdef')
+        rows[1, 0] = ord('x')
+        self.assertEqual(buf.raw[:8], b'abc_xef_')
+
+    def test_large(self):
+        #Both paths give the same result on a photo sized image
+        values = numpy.random.default_rng(1).integers(0, 65536, (1200, 1600), dtype=numpy.uint16)
+        for mode in ('I;16', 'I;16B'):
+            img = self._gray(mode, values)
+            expected = ((values.astype(numpy.uint32) * 255 + 32767) // 65535).astype(numpy.uint8)
+            self.assertTrue(numpy.array_equal(numpy.asarray(depth.to_8_bits(img)), expected), mode)
+            with patch.object(depth, 'numpy', None):
+                self.assertTrue(numpy.array_equal(numpy.asarray(depth.to_8_bits(img)), expected), mode)
@@ -1,9 +1,14 @@
 
 
+import os
+import shutil
+import tempfile
 import unittest
+from threading import Event
 
-from quivilib.model.container import SortOrder
-from quivilib.model.container.directory import DirectoryContainer
+from quivilib.model.container import SortOrder, ContainerOpenCancelled
+from quivilib.model.container.base import deferred_messages
+from quivilib.model.container.directory import DirectoryContainer, _ReadAhead
 from quivilib.model.container.compressed import CompressedContainer
 from pathlib import Path
 
@@ -95,4 +100,110 @@ class Test(unittest.TestCase):
         self.dir.selected_item = 1
         self.assertEqual(self.dir.items.index(self.dir.selected_item), 1)
         self.dir.selected_item = self.dir.items[1]
-        self.assertEqual(self.dir.selected_item, self.dir.items[1])
\ No newline at end of file
+        self.assertEqual(self.dir.selected_item, self.dir.items[1])
+
+    def test_index_of(self):
+        for sort_order in SortOrder:
+            self.dir.sort_order = sort_order
+            for i, item in enumerate(self.dir.items):
+                self.assertEqual(self.dir.index_of(item), i)
+                self.assertEqual(self.dir.index_of(item.path), i)
+        self.assertRaises(ValueError, self.dir.index_of, Path('doesnotexist.jpg'))
+        #Selecting by path only matches on the name
+        self.dir.selected_item = Path('/some/other/dir/teste.jpg')
+        self.assertEqual(self.dir.selected_item.name, 'teste.jpg')
+
+    def test_sort_keys_cached(self):
+        self.dir.sort_order = SortOrder.NAME
+        item = self.dir.items[1]
+        self.assertIn(SortOrder.NAME, item.sort_keys)
+        keys = item.sort_keys
+        self.dir.refresh(False)
+        #Unchanged items keep their computed keys across a refresh
+        self.assertIs(self.dir.items[self.dir.index_of(item)].sort_keys, keys)
+
+
+    def test_deferred_messages(self):
+        with deferred_messages() as messages:
+            container = DirectoryContainer(Path('./tests/dummy'), SortOrder.NAME, False)
+        self.assertIn(('container.opened', {'container': container}), messages)
+        cancel = Event()
+        cancel.set()
+        with deferred_messages(cancel):
+            self.assertRaises(ContainerOpenCancelled, DirectoryContainer,
+                              Path('./tests/dummy'), SortOrder.NAME, False)
+
+    def test_update_entries(self):
+        tmp = Path(tempfile.mkdtemp())
+        try:
+            shutil.copy('./tests/dummy/teste.jpg', tmp / 'b.jpg')
+            shutil.copy('./tests/dummy/teste.jpg', tmp / 'c.jpg')
+            container = DirectoryContainer(tmp, SortOrder.NAME, False)
+            container.selected_item = 2
+            shutil.copy('./tests/dummy/teste.jpg', tmp / 'a.jpg')
+            os.remove(tmp / 'c.jpg')
+            os.utime(tmp / 'b.jpg', (0, 0))
+            stale = container.update_entries({'a.jpg', 'b.jpg', 'c.jpg'})
+            self.assertEqual(sorted(item.name for item in stale), ['b.jpg', 'c.jpg'])
+            self.assertEqual([item.name for item in container.items], ['..', 'a.jpg', 'b.jpg'])
+            self.assertEqual(container.index_of(tmp / 'b.jpg'), 2)
+            #The selected item was removed, so its neighbour is selected
+            self.assertEqual(container.selected_item.name, 'b.jpg')
+            self.assertEqual(container.update_entries(None), [])
+            #Scanning alone leaves the list alone
+            os.remove(tmp / 'a.jpg')
+            self.assertEqual(container.scan_entries(None), ([], [tmp / 'a.jpg'], []))
+            self.assertEqual(container.item_count, 3)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_remove_item(self):
+        self.dir.sort_order = SortOrder.NAME
+        self.dir.selected_item = 2
+        names = [item.name for item in self.dir.items]
+        removed = self.dir.remove_item(2)
+        self.assertEqual(removed.name, names[2])
+        self.assertEqual([item.name for item in self.dir.items], names[:2] + names[3:])
+        self.assertEqual(self.dir.selected_item.name, names[3])
+        self.assertRaises(ValueError, self.dir.index_of, removed)
+        self.dir.restore_item(removed)
+        self.assertEqual([item.name for item in self.dir.items], names)
+        self.assertEqual(self.dir.index_of(removed), 2)
+
+    def test_read_ahead(self):
+        tmp = Path(tempfile.mkdtemp())
+        try:
+            a, b, c = (tmp / f'{name}.jpg' for name in 'abc')
+            for path in (a, b, c):
+                path.write_bytes(path.name.encode())
+            read_ahead = _ReadAhead()
+            read_ahead.hint([a, b])
+            #b was skipped; a is being opened
+            read_ahead.hint([c], current=a)
+            self.assertEqual(read_ahead._hinted, {a, c})
+            with read_ahead.open(a) as f:
+                self.assertEqual(f.read(), b'a.jpg')
+            self.assertEqual(read_ahead._hinted, {c})
+            self.assertEqual(read_ahead.stats[True][0], 1)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_listing_cache(self):
+        tmp = Path(tempfile.mkdtemp())
+        try:
+            shutil.copy('./tests/dummy/teste.jpg', tmp / 'a.jpg')
+            first = DirectoryContainer(tmp, SortOrder.NAME, False)
+            second = DirectoryContainer(tmp, SortOrder.NAME, False)
+            #The listing was reused
+            self.assertIs(second.items[1], first.items[1])
+            shutil.copy('./tests/dummy/teste.jpg', tmp / 'b.jpg')
+            os.utime(tmp, ns=(0, 0))
+            third = DirectoryContainer(tmp, SortOrder.NAME, False)
+            self.assertEqual([item.name for item in third.items], ['..', 'a.jpg', 'b.jpg'])
+            #A file rewritten in place doesn't change the directory's mtime
+            old = third.items[1]
+            third.apply_changes([], [], [(tmp / 'a.jpg', None)])
+            fourth = DirectoryContainer(tmp, SortOrder.NAME, False)
+            self.assertIsNot(fourth.items[1], old)
+        finally:
+            shutil.rmtree(tmp)
\ No newline at end of file
@@ -0,0 +1,37 @@
+import unittest
+
+from quivilib.model.image.frames import FrameBuffer
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.decoded = []
+        def decode(i):
+            self.decoded.append(i)
+            return f'frame {i}'
+        self.frames = FrameBuffer(10, decode, 3)
+
+    def test_decode_ahead(self):
+        self.assertEqual(len(self.frames), 10)
+        self.assertIsNone(self.frames.get(1))
+        #Frame 0 is never buffered
+        self.assertEqual(self.frames.decode_ahead(0), 3)
+        self.assertEqual(self.decoded, [1, 2, 3])
+        self.assertEqual(self.frames.get(2), 'frame 2')
+        #Played frames are dropped
+        self.assertEqual(self.frames.decode_ahead(2), 2)
+        self.assertIsNone(self.frames.get(1))
+        self.assertEqual(self.decoded, [1, 2, 3, 4, 5])
+        #Wraps around
+        self.frames.decode_ahead(8)
+        self.assertEqual(self.decoded[-3:], [8, 9, 1])
+        self.assertEqual(sorted(self.frames._frames), [1, 8, 9])
+        self.assertEqual(self.frames.capacity, 4)
+        self.frames.clear()
+        self.assertIsNone(self.frames.get(9))
+
+    def test_short(self):
+        frames = FrameBuffer(2, str, 8)
+        frames.decode_ahead(0)
+        self.assertEqual(frames.get(1), '1')
+        self.assertEqual(frames.capacity, 1)
@@ -1,5 +1,6 @@
 
 
+import io
 import unittest
 import sys
 
@@ -27,6 +28,37 @@ class Test(unittest.TestCase):
         self.assertTrue(len(dic) > 0)
         self.assertTrue('.jpg' in dic)
         
+    def test_get_pixels(self):
+        img = fi.Image.load('./tests/python.png').convert_to_32_bits()
+        pixels = img.get_pixels()
+        self.assertEqual((pixels.width, pixels.height, pixels.stride), (img.width, img.height, img.width * 4))
+        #24 bit images are expanded directly; the result must be the same
+        pixels24 = img.convert_to_24_bits().get_pixels()
+        self.assertEqual(pixels24.stride, pixels.stride)
+        self.assertEqual(bytes(pixels24.data)[0::4], bytes(pixels.data)[0::4])
+        self.assertEqual(bytes(pixels24.data)[2::4], bytes(pixels.data)[2::4])
+        
+    def test_load_from_memory(self):
+        with open('./tests/python.png', 'rb') as f:
+            data = f.read()
+        expected = fi.Image.load('./tests/python.png')
+        for src in (io.BytesIO(data), io.BytesIO(bytearray(data))):
+            img = fi.Image.load_from_file(src)
+            self.assertEqual((img.width, img.height, img.bpp), (expected.width, expected.height, expected.bpp))
+        img = fi.Image.load_from_memory(memoryview(data))
+        self.assertEqual(img.width, expected.width)
+        
+    def test_16_bits(self):
+        from PIL import Image
+        from quivilib.model.image.freeimage import FreeImage
+        f = io.BytesIO()
+        Image.new('I;16', (3, 2), 32896).save(f, 'PNG')
+        f.seek(0)
+        img = FreeImage.OpenImage(f, 'test.png')
+        #Scaled to 8 bit gray, rounded
+        self.assertEqual((img.image_type, img.bpp), (fi.FIT_BITMAP, 8))
+        self.assertEqual(bytes(img.get_pixels(allow_gray=True).data)[:3], bytes([128] * 3))
+        
     def test_convert_wx(self):
         img = fi.Image.load('./tests/python.png')
         bmp = img.convert_to_wx_bitmap(wx)
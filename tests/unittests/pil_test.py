@@ -0,0 +1,134 @@
+import io
+import time
+import unittest
+
+from PIL import Image
+
+from quivilib.model.image import worker
+from quivilib.model.image.pil import PilImage, PilWrapper, AnimatedPilImage
+
+
+class Test(unittest.TestCase):
+    def _open(self, fmt, fit):
+        f = io.BytesIO()
+        Image.new('RGB', (800, 600), (255, 0, 0)).save(f, fmt)
+        f.seek(0)
+        return PilImage.CreateImage(f, 'test', delay=True, fit=fit)
+
+    def test_reduced_decode(self):
+        for fmt in ('JPEG', 'PNG'):
+            img = self._open(fmt, lambda w, h: 0.3)
+            self.assertEqual(img.getImg().size, (400, 300), fmt)
+            self.assertEqual((img.base_width, img.base_height), (800, 600))
+            #Zooming past the decoded size decodes the full size
+            img.resize(700, 525)
+            self.assertEqual(img.getImg().size, (800, 600))
+            self.assertFalse(img.load_full_resolution())
+
+    def test_reduced_jpeg2000(self):
+        f = io.BytesIO()
+        Image.new('RGB', (800, 600), (255, 0, 0)).save(f, 'JPEG2000')
+        f.seek(0)
+        img = PilImage.CreateImage(f, 'test.jp2', delay=True, fit=lambda w, h: 0.2)
+        self.assertEqual(img.getImg().size, (200, 150))
+        #Zooming halves the decoded image
+        self.assertEqual(img.rescale(50, 37).size, (50, 37))
+        img.resize(700, 525)
+        self.assertEqual(img.getImg().size, (800, 600))
+
+    def test_full_decode_async(self):
+        f = io.BytesIO()
+        Image.new('RGB', (800, 600), (255, 0, 0)).save(f, 'JPEG')
+        data = f.getvalue()
+        f.seek(0)
+        reopened = []
+        def reopen():
+            reopened.append(True)
+            return io.BytesIO(data)
+        img = PilImage.CreateImage(f, 'test', delay=True, fit=lambda w, h: 0.3, reopen=reopen)
+        #The file is read again instead of kept
+        self.assertEqual(img.memory_size, 400 * 300 * 4)
+        img.delayed_load()
+        changed = []
+        img.set_callback(changed.append)
+        img.resize(700, 525)
+        #Shown scaled up until the worker is done
+        self.assertEqual(img.width, 700)
+        deadline = time.perf_counter() + 5
+        while not changed and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(changed, [img])
+        self.assertEqual(img.getImg().size, (800, 600))
+        self.assertEqual(reopened, [True])
+        self.assertFalse(img.load_full_resolution())
+        self.assertFalse(worker.get_worker().is_busy(img._full_job))
+
+    def test_full_decode(self):
+        img = self._open('JPEG', lambda w, h: 0.9)
+        self.assertEqual(img.getImg().size, (800, 600))
+        self.assertFalse(img.load_full_resolution())
+        #The view has no size yet
+        img = self._open('JPEG', lambda w, h: 0)
+        self.assertEqual(img.getImg().size, (800, 600))
+
+    def test_get_pixels(self):
+        img = Image.new('RGB', (3, 2), (1, 2, 3))
+        img.putpixel((2, 1), (4, 5, 6))
+        pixels = PilWrapper(img).get_pixels()
+        self.assertEqual((pixels.width, pixels.height, pixels.stride), (3, 2, 12))
+        #Passed to wx as is; only cairo needs a writable copy
+        self.assertIsInstance(pixels.data, bytes)
+        #Cairo's RGB24 is B G R X in memory
+        self.assertEqual(bytes(pixels.data[:3]), bytes([3, 2, 1]))
+        self.assertEqual(bytes(pixels.data[-4:-1]), bytes([6, 5, 4]))
+
+    def test_grayscale(self):
+        f = io.BytesIO()
+        Image.new('L', (5, 2), 7).save(f, 'PNG')
+        f.seek(0)
+        img = PilImage.CreateImage(f, 'test', delay=True)
+        #Kept at 1 byte per pixel
+        self.assertEqual(img.getImg().mode, 'L')
+        pixels = img.getImg().get_pixels(allow_gray=True)
+        self.assertTrue(pixels.is_gray)
+        #Rows are padded to 4 bytes, like cairo's A8
+        self.assertEqual(pixels.stride, 8)
+        self.assertEqual(bytes(pixels.data[:5]), bytes([7] * 5))
+        self.assertFalse(img.getImg().get_pixels().is_gray)
+        self.assertEqual(img.memory_size, 10)
+
+    def test_gray16(self):
+        f = io.BytesIO()
+        Image.new('I;16', (2, 1), 32896).save(f, 'PNG')
+        f.seek(0)
+        img = PilImage.CreateImage(f, 'test', delay=True)
+        #Scaled, not clipped
+        self.assertEqual(img.getImg().mode, 'L')
+        self.assertEqual(img.getImg().img.getpixel((0, 0)), 128)
+
+    def test_rescale_from_pyramid(self):
+        img = self._open('PNG', None)
+        size = img.memory_size
+        self.assertEqual(img.rescale(300, 225).size, (300, 225))
+        #The 1/2 level is kept and counted
+        self.assertEqual(img.memory_size, size + 400 * 300 * 4)
+        img.rotate(True)
+        self.assertEqual(img.memory_size, size)
+
+    def test_animated(self):
+        frames = [Image.new('RGB', (40, 30), (i * 20, 0, 0)) for i in range(12)]
+        f = io.BytesIO()
+        frames[0].save(f, 'GIF', save_all=True, append_images=frames[1:], duration=[50] * 11 + [200])
+        f.seek(0)
+        img = PilImage.CreateImage(f, 'test', delay=True)
+        self.assertIsInstance(img, AnimatedPilImage)
+        self.assertEqual(img.delays, [50] * 11 + [200])
+        #Only the first frame is decoded up front
+        self.assertIsNone(img.frames.get(1))
+        self.assertEqual(img.getImg().img.getpixel((0, 0)), (0, 0, 0))
+        img.decode_ahead()
+        self.assertEqual(img.frames.get(1).data[2], 20)
+        #Charged as if the buffer was full
+        self.assertGreaterEqual(img.memory_size, 9 * 40 * 30 * 4 + len(f.getvalue()))
+        img.close()
+        self.assertIsNone(img.frames.get(1))
@@ -0,0 +1,75 @@
+import io
+import struct
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+from quivilib.model.image import open_preview, open_direct
+from quivilib.model.image.preview import PreviewImage
+
+
+def _jpeg(width, height, exif_thumb=None):
+    f = io.BytesIO()
+    kwargs = {}
+    if exif_thumb is not None:
+        thumb = io.BytesIO()
+        exif_thumb.save(thumb, 'JPEG')
+        data = thumb.getvalue()
+        #TIFF header, an empty IFD0, then IFD1 pointing at the thumbnail right after it
+        tiff = b'II*\x00' + struct.pack('<I', 8) + struct.pack('<HI', 0, 14) + struct.pack('<H', 2)
+        tiff += struct.pack('<HHII', 513, 4, 1, 44) + struct.pack('<HHII', 514, 4, 1, len(data)) + struct.pack('<I', 0)
+        kwargs['exif'] = b'Exif\x00\x00' + tiff + data
+    Image.new('RGB', (width, height), 'blue').save(f, 'JPEG', **kwargs)
+    f.seek(0)
+    return f
+
+
+class Test(unittest.TestCase):
+    def test_draft(self):
+        f = _jpeg(3200, 2400)
+        img = open_preview(f, Path('a.jpg'))
+        self.assertIsInstance(img, PreviewImage)
+        self.assertEqual(f.tell(), 0)
+        self.assertEqual((img.width, img.height), (400, 300))
+        self.assertEqual((img.base_width, img.base_height), (3200, 2400))
+        #Shown at 1/8 or less anyway
+        self.assertIsNone(open_preview(f, Path('a.jpg'), fit=lambda w, h: 0.1))
+        #Decoded at 1/2, which is few enough pixels to be quick
+        self.assertIsNone(open_preview(f, Path('a.jpg'), fit=lambda w, h: 0.3))
+        self.assertIsNotNone(open_preview(f, Path('a.jpg'), fit=lambda w, h: 0.9))
+
+    def test_exif_thumbnail(self):
+        img = open_preview(_jpeg(3200, 2400, Image.new('RGB', (400, 300), 'red')), Path('a.jpg'))
+        self.assertGreater(img.getImg().img.getpixel((0, 0))[0], 200)
+        #Too small, or letterboxed
+        for thumb in (Image.new('RGB', (160, 120), 'red'), Image.new('RGB', (400, 400), 'red')):
+            img = open_preview(_jpeg(3200, 2400, thumb), Path('a.jpg'))
+            self.assertLess(img.getImg().img.getpixel((0, 0))[0], 50)
+
+    def test_no_preview(self):
+        self.assertIsNone(open_preview(_jpeg(800, 600), Path('a.jpg')))
+        f = io.BytesIO()
+        Image.new('RGB', (3200, 2400)).save(f, 'PNG')
+        f.seek(0)
+        self.assertIsNone(open_preview(f, Path('a.png')))
+        self.assertEqual(f.tell(), 0)
+
+    def test_set_image(self):
+        f = _jpeg(3200, 2400)
+        img = open_preview(f, Path('a.jpg'))
+        img.delayed_load()
+        changed = []
+        img.set_callback(changed.append)
+        img.resize(800, 600)
+        img.rotate(True)
+        self.assertEqual((img.width, img.height, img.base_width), (600, 800, 2400))
+        full = open_direct(f, Path('a.jpg'))
+        full.delayed_load()
+        img.set_image(full)
+        self.assertEqual(changed, [img])
+        self.assertEqual((full.width, full.height, full.rotation), (600, 800, 1))
+        #Everything goes to the decoded image from now on
+        img.resize(300, 400)
+        self.assertEqual((full.width, full.height), (300, 400))
+        self.assertIs(img.getImg(), full.getImg())
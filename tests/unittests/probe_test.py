@@ -0,0 +1,40 @@
+import io
+import unittest
+
+from PIL import Image
+
+from quivilib.model.image.probe import probe_size, sniff_format, SNIFF_SIZE
+
+
+class Test(unittest.TestCase):
+    def _probe(self, fmt, mode='RGB', **kwargs):
+        f = io.BytesIO()
+        Image.new(mode, (123, 45)).save(f, fmt, **kwargs)
+        f.seek(0)
+        return probe_size(f)
+
+    def test_formats(self):
+        for fmt in ('JPEG', 'PNG', 'GIF', 'BMP', 'WEBP'):
+            self.assertEqual(self._probe(fmt), (123, 45), fmt)
+        self.assertEqual(self._probe('WEBP', 'RGBA'), (123, 45))
+        self.assertEqual(self._probe('WEBP', lossless=True), (123, 45))
+        self.assertEqual(self._probe('JPEG', progressive=True), (123, 45))
+
+    def test_jpeg_with_exif(self):
+        exif = Image.Exif()
+        exif[0x010e] = 'description'
+        self.assertEqual(self._probe('JPEG', exif=exif.tobytes()), (123, 45))
+        with open('./tests/dummy/teste.jpg', 'rb') as f:
+            self.assertEqual(probe_size(f), (500, 397))
+
+    def test_unknown(self):
+        self.assertIsNone(probe_size(io.BytesIO(b'not an image')))
+        self.assertIsNone(probe_size(io.BytesIO(b'\xff\xd8\xff\xe0\x00')))
+
+    def test_sniff_format(self):
+        for fmt in ('JPEG', 'PNG', 'GIF', 'BMP', 'WEBP', 'TIFF'):
+            f = io.BytesIO()
+            Image.new('RGB', (12, 34)).save(f, fmt)
+            self.assertEqual(sniff_format(f.getvalue()[:SNIFF_SIZE]), fmt)
+        self.assertIsNone(sniff_format(b'RIFF\0\0\0\0WAVEfmt '))
+        self.assertIsNone(sniff_format(b''))
@@ -0,0 +1,46 @@
+import unittest
+
+from PIL import Image
+
+from quivilib.model.image.pyramid import Pyramid
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.halved = 0
+        def halve(img):
+            self.halved += 1
+            return img.reduce(2)
+        self.pyramid = Pyramid(Image.new('RGB', (1600, 1200)), halve, lambda im: im.size,
+                               lambda im: im.width * im.height * 4)
+
+    def test_source_for(self):
+        #Nothing smaller is made unless asked for
+        self.assertEqual(self.pyramid.source_for(500, 300, build=False).size, (1600, 1200))
+        self.assertEqual(self.halved, 0)
+        self.assertEqual(self.pyramid.source_for(500, 300).size, (800, 600))
+        self.assertEqual(self.pyramid.source_for(900, 300).size, (1600, 1200))
+        self.assertEqual(self.pyramid.source_for(400, 300).size, (400, 300))
+        self.assertEqual(self.halved, 2)
+        #1/8 at most
+        self.assertEqual(self.pyramid.source_for(10, 10).size, (200, 150))
+        self.assertEqual(self.pyramid.smallest().size, (200, 150))
+        self.assertEqual(self.halved, 3)
+        #Zooming in uses the full image
+        self.assertEqual(self.pyramid.source_for(3200, 2400).size, (1600, 1200))
+
+    def test_no_lock_while_halving(self):
+        def halve(img):
+            #Other threads can still read the pyramid
+            self.assertTrue(pyramid._lock.acquire(blocking=False))
+            pyramid._lock.release()
+            self.assertEqual(pyramid.source_for(400, 300, build=False).size, (1600, 1200))
+            return img.reduce(2)
+        pyramid = Pyramid(Image.new('RGB', (1600, 1200)), halve, lambda im: im.size,
+                          lambda im: im.width * im.height * 4)
+        self.assertEqual(pyramid.source_for(800, 600).size, (800, 600))
+
+    def test_memory_size(self):
+        self.assertEqual(self.pyramid.memory_size, 0)
+        self.pyramid.source_for(400, 300)
+        self.assertEqual(self.pyramid.memory_size, (800 * 600 + 400 * 300) * 4)
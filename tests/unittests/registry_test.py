@@ -0,0 +1,45 @@
+import unittest
+
+from quivilib.interface.imagehandler import Capability
+from quivilib.model.image.registry import FormatRegistry
+
+
+class First(object):
+    capabilities = Capability.ANIMATION | Capability.DRAFT
+    backend_name = 'first'
+    @staticmethod
+    def extensions():
+        return ['.jpg', '.gif', '.xyz']
+
+class Second(object):
+    capabilities = Capability.NONE
+    backend_name = 'second'
+    @staticmethod
+    def extensions():
+        return ['.JPG', '.tif']
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.registry = FormatRegistry([First, Second], {First: ['.jpg', '.gif', '.png']}, {'JPEG': 'second'})
+
+    def test_extensions(self):
+        #.xyz isn't listed, .png can't be opened by anything
+        self.assertEqual(self.registry.extensions, frozenset(['.jpg', '.gif', '.tif']))
+        self.assertTrue(self.registry.is_supported('.TIF'))
+        self.assertFalse(self.registry.is_supported('.xyz'))
+
+    def test_routing(self):
+        self.assertEqual(self.registry.backends_for('.jpg'), (First, Second))
+        self.assertEqual(self.registry.backends_for_content(b'\xff\xd8\xff\xe0', '.jpg'), (Second, First))
+        #The content wins over the extension
+        self.assertEqual(self.registry.backends_for_content(b'II*\x00', '.jpg'), (Second,))
+        self.assertEqual(self.registry.backends_for_content(b'GIF89a', '.jpg'), (First,))
+        #Unknown content, or no backend for the sniffed format: use the extension
+        self.assertEqual(self.registry.backends_for_content(b'????', '.gif'), (First,))
+        self.assertEqual(self.registry.backends_for_content(b'\x89PNG\r\n\x1a\n', '.gif'), (First,))
+        self.assertEqual(self.registry.backends_for('.Tif'), (Second,))
+        #Not listed, but can still be opened directly
+        self.assertEqual(self.registry.backends_for('.xyz'), (First,))
+        self.assertEqual(self.registry.backends_for('.png'), ())
+        self.assertEqual(self.registry.backends_with(Capability.DRAFT), (First,))
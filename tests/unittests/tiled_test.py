@@ -0,0 +1,69 @@
+import io
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image
+
+from quivilib import meta
+from quivilib.interface.imagehandler import PixelBuffer
+from quivilib.model.image import open_img
+from quivilib.model.image.tiled import TiledImage, TILE_SIZE
+
+
+class DummyDC:
+    def __init__(self, width, height):
+        self.size = (width, height)
+        self.drawn = []
+    def GetSize(self):
+        return self.size
+    def DrawBitmap(self, bmp, x, y):
+        self.drawn.append((x, y))
+
+
+class Test(unittest.TestCase):
+    def _open(self, width, height):
+        f = io.BytesIO()
+        Image.new('L', (width, height), 128).save(f, 'PNG')
+        f.seek(0)
+        return open_img(f, Path('strip.png'), delay=True)
+
+    def test_strip(self):
+        with patch.object(meta, 'TILED_MIN_SIZE', 2000):
+            img = self._open(800, 3000)
+        self.assertIsInstance(img, TiledImage)
+        img.delayed_load()
+        self.assertEqual((img.width, img.height), (800, 3000))
+        #Only the tiles in view are made
+        dc = DummyDC(1000, 700)
+        img.paint(dc, 100, -600)
+        self.assertEqual(dc.drawn, [(100, -88), (612, -88), (100, 424), (612, 424)])
+        self.assertEqual(img._tiles_size, (512 + 288) * 512 * 2 * 4)
+        #Zooming starts over
+        img.resize(400, 1500)
+        self.assertEqual(img._tiles_size, 0)
+        img.rotate(True)
+        self.assertEqual((img.width, img.height, img.base_width), (1500, 400, 3000))
+
+    def test_lru(self):
+        with patch.object(meta, 'TILED_MIN_SIZE', 2000):
+            img = self._open(512, 4096)
+        img.delayed_load()
+        with patch.object(meta, 'TILE_CACHE_SIZE', TILE_SIZE * TILE_SIZE * 4 * 2):
+            for top in range(0, 4096, TILE_SIZE):
+                img.paint(DummyDC(512, 512), 0, -top)
+        #Only the last two are kept
+        self.assertEqual(list(img._tiles), [(0, 6), (0, 7)])
+
+    def test_copy_to_clipboard(self):
+        with patch.object(meta, 'TILED_MIN_SIZE', 2000):
+            img = self._open(800, 4000)
+            copied = []
+            img.do_copy_to_clipboard = copied.append
+            with patch.object(PixelBuffer, 'to_wx_bitmap', lambda pixels: (pixels.width, pixels.height)):
+                img.copy_to_clipboard()
+        #Scaled down to fit in one bitmap
+        self.assertEqual(copied, [(400, 2000)])
+
+    def test_small(self):
+        self.assertNotIsInstance(self._open(800, 600), TiledImage)
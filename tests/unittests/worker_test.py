@@ -0,0 +1,68 @@
+import threading
+import unittest
+
+from quivilib.model.image.worker import ResizeWorker
+
+
+def _direct(fn, *args):
+    fn(*args)
+
+
+class Test(unittest.TestCase):
+    def setUp(self):
+        self.worker = ResizeWorker(deliver=_direct)
+        self.results = []
+        self.delivered = threading.Event()
+
+    def _done(self, result):
+        self.results.append(result)
+        self.delivered.set()
+
+    def test_latest_wins(self):
+        owner = object()
+        started = threading.Event()
+        release = threading.Event()
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'stale'
+        self.worker.submit(owner, slow, self._done)
+        self.assertTrue(started.wait(5))
+        #Replaces each other while the first one runs; the first one's result is dropped
+        self.worker.submit(owner, lambda: 'second', self._done)
+        self.worker.submit(owner, lambda: 'third', self._done)
+        self.assertTrue(self.worker.is_busy(owner))
+        release.set()
+        self.assertTrue(self.delivered.wait(5))
+        self.assertEqual(self.results, ['third'])
+        metrics = self.worker.metrics
+        self.assertEqual((metrics['submitted'], metrics['coalesced'], metrics['delivered']), (3, 1, 1))
+        self.assertEqual(metrics['stale'], 1)
+
+    def test_cancelled_while_running(self):
+        owner = object()
+        started = threading.Event()
+        release = threading.Event()
+        checked = []
+        def make():
+            started.set()
+            release.wait(5)
+            checked.append(self.worker.cancelled())
+            self.delivered.set()
+        self.worker.submit(owner, make, self._done)
+        self.assertTrue(started.wait(5))
+        self.worker.cancel(owner)
+        release.set()
+        self.assertTrue(self.delivered.wait(5))
+        self.assertEqual(checked, [True])
+
+    def test_cancel(self):
+        owner = object()
+        self.worker.submit(owner, lambda: 'cancelled', self._done, delay=60)
+        self.assertTrue(self.worker.is_busy(owner))
+        self.worker.cancel(owner)
+        self.assertFalse(self.worker.is_busy(owner))
+        #Other owners are unaffected
+        self.worker.submit(object(), lambda: 'other', self._done)
+        self.assertTrue(self.delivered.wait(5))
+        self.assertEqual(self.results, ['other'])